@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:36
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_bookmarks(apps, schema_editor):
+    Bookmark = apps.get_model('bookmarks', 'Bookmark')
+    Snippet = apps.get_model('snippets', 'Snippet')
+    LeaderboardEntry = apps.get_model('snippets', 'LeaderboardEntry')
+
+    duplicates = Bookmark.objects.values('user_id', 'snippet_id').annotate(
+        copies=Count('id'), keep=Min('id')
+    ).filter(copies__gt=1).order_by()
+    for row in duplicates:
+        Bookmark.objects.filter(user_id=row['user_id'], snippet_id=row['snippet_id']).exclude(pk=row['keep']).delete()
+        # The copies were counted like separate bookmarks
+        removed = row['copies'] - 1
+        Snippet.objects.filter(pk=row['snippet_id']).update(bookmark_count=F('bookmark_count') - removed)
+        LeaderboardEntry.objects.filter(board='most_bookmarked', object_id=row['snippet_id']).update(
+            score=F('score') - removed
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookmarks', '0001_initial'),
+        ('snippets', '0009_leaderboards'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bookmarks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookmark',
+            constraint=models.UniqueConstraint(fields=('user', 'snippet'), name='bookmark_user_snippet_unique'),
+        ),
+    ]
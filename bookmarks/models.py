@@ -9,6 +9,10 @@ class Bookmark(models.Model):
 
     class Meta:
         ordering = ['-user']
+        constraints = [
+            # Concurrent get_or_create() calls must not bookmark a snippet twice
+            models.UniqueConstraint(fields=['user', 'snippet'], name='bookmark_user_snippet_unique'),
+        ]
 
     def __str__(self):
         return f"{self.snippet.title} bookmarked by {self.user.username}"
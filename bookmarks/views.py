@@ -1,12 +1,16 @@
-from django.db.models import Count
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView
 from django.contrib import messages
+from django.utils.decorators import method_decorator
 
-from snippets.models import Snippet
+from snippets.models import LeaderboardEntry, Snippet
 from bookmarks.models import Bookmark
+from snippets.utils.concurrency import ThreadedGetMixin
+from snippets.utils.conditional import conditional_page, leaderboard_stamps
+from snippets.utils.leaderboards import top_entries, with_objects
+from snippets.utils.pagination import KeysetPaginationMixin
 
 
 @login_required
@@ -14,6 +18,7 @@ def AddBookmarkView(request, snippet_id):
     snippet = get_object_or_404(Snippet, pk=snippet_id)
     bookmark, created = Bookmark.objects.get_or_create(user=request.user, snippet=snippet)
     if created:
+        Snippet.adjust_counters(snippet.pk, bookmark_count=1)
         messages.success(request, 'Snippet bookmarked successfully.')
     else:
         messages.info(request, 'Snippet was already bookmarked.')
@@ -24,21 +29,24 @@ def AddBookmarkView(request, snippet_id):
 def DeleteBookmarkView(request, snippet_id):
     snippet = get_object_or_404(Snippet, pk=snippet_id)
     if request.method == "POST":
-        if snippet.bookmarks.filter(user=request.user).exists():
-            Bookmark.objects.filter(user=request.user, snippet=snippet).delete()
+        deleted, _ = Bookmark.objects.filter(user=request.user, snippet=snippet).delete()
+        if deleted:
+            Snippet.adjust_counters(snippet.pk, bookmark_count=-deleted)
             messages.success(request, 'Snippet removed from bookmarks successfully.')
         else:
             messages.info(request, 'Snippet was not bookmarked.')
     return redirect('/bookmarks/user-bookmarks/')
 
-class UserBookmarksListView(ListView):
+class UserBookmarksListView(KeysetPaginationMixin, ListView):
     model = Bookmark
     template_name = 'bookmarks/templates/bookmark/user_bookmarks.html'
     context_object_name = 'bookmarks'
     paginate_by = 10
+    keyset_ordering = ('-id',)
 
     def get_queryset(self):
-        return Bookmark.objects.filter(user=self.request.user)
+        return Bookmark.objects.filter(user=self.request.user).select_related('snippet__author', 'snippet__language') \
+            .defer(*(f'snippet__{field}' for field in Snippet.HEAVY_FIELDS))
 
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -46,13 +54,12 @@ class UserBookmarksListView(ListView):
         return super().dispatch(request, *args, **kwargs)
 
 
-class MostBookmarkedView(ListView):
+@method_decorator(conditional_page(leaderboard_stamps), name='get')
+class MostBookmarkedView(ThreadedGetMixin, ListView):
     model = Snippet
     template_name = 'bookmarks/templates/bookmark/most_bookmarked.html'
     context_object_name = 'most_bookmarked_list'
     paginate_by = 10
 
     def get_queryset(self):
-        return Snippet.objects.annotate(
-            bookmark_count=Count('bookmarks')
-        ).order_by('-bookmark_count')[:3]
\ No newline at end of file
+        return with_objects(top_entries(LeaderboardEntry.MOST_BOOKMARKED)[:3], Snippet.objects, 'bookmark_count')
\ No newline at end of file
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+# The longest trending window, see snippets.utils.trending
+BACKFILL_DAYS = 30
+
+
+def backfill_rating_buckets(apps, schema_editor):
+    Rating = apps.get_model('ratings', 'Rating')
+    RatingBucket = apps.get_model('ratings', 'RatingBucket')
+
+    rows = (
+        Rating.objects.filter(date__gte=timezone.now() - datetime.timedelta(days=BACKFILL_DAYS))
+        .annotate(hour=TruncHour('date', tzinfo=datetime.timezone.utc))
+        .values('snippet_id', 'hour')
+        .annotate(likes=Count('id', filter=Q(rating='like')), dislikes=Count('id', filter=Q(rating='dislike')))
+        .order_by()
+    )
+    RatingBucket.objects.bulk_create(
+        (RatingBucket(snippet_id=row['snippet_id'], start=row['hour'], span=3600,
+                      likes=row['likes'], dislikes=row['dislikes']) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0001_initial'),
+        ('snippets', '0009_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('span', models.PositiveIntegerField(choices=[(3600, 'Hour'), (86400, 'Day')], default=3600)),
+                ('likes', models.IntegerField(default=0)),
+                ('dislikes', models.IntegerField(default=0)),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to='snippets.snippet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start'], name='ratingbucket_start_idx')],
+                'unique_together': {('snippet', 'start')},
+            },
+        ),
+        migrations.RunPython(backfill_rating_buckets, migrations.RunPython.noop),
+    ]
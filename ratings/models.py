@@ -10,6 +10,11 @@ class Rating(models.Model):
         (LIKE, 'Like'),
         (DISLIKE, 'Dislike'),
     ]
+    # Snippet counter column kept in sync with each rating value
+    COUNTER_FIELDS = {
+        LIKE: 'like_count',
+        DISLIKE: 'dislike_count',
+    }
 
     snippet = models.ForeignKey('snippets.Snippet', related_name='ratings', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='ratings', on_delete=models.CASCADE)
@@ -18,6 +23,40 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('snippet', 'user')
+        indexes = [
+            # A user's likes, covering the snippet ids the recommenders look up
+            models.Index(fields=['user', 'rating', 'snippet'], name='rating_user_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} rated '{self.snippet.title}' as {self.get_rating_display()}"
+
+
+class RatingBucket(models.Model):
+    """
+    Net like and dislike changes of a snippet during one hour or day starting at ``start``
+    (see snippets.utils.trending). Vote flips are recorded when they happen, so a bucket can
+    hold negative counts.
+    """
+    HOUR = 3600
+    DAY = 86400
+    SPANS = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    snippet = models.ForeignKey('snippets.Snippet', related_name='rating_buckets', on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    span = models.PositiveIntegerField(choices=SPANS, default=HOUR)
+    likes = models.IntegerField(default=0)
+    dislikes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('snippet', 'start')
+        indexes = [
+            # Windowed reads only touch the buckets that started inside the window
+            models.Index(fields=['start'], name='ratingbucket_start_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.snippet_id} from {self.start:%Y-%m-%d %H:%M}: +{self.likes} -{self.dislikes}'
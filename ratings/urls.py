@@ -1,7 +1,8 @@
 from django.urls import path
-from ratings.views import RateSnippetView, TopRatedSnippetsView
+from ratings.views import RateSnippetView, TopRatedSnippetsView, TrendingSnippetsView
 
 urlpatterns = [
     path('<int:pk>/', RateSnippetView, name='rate_snippet'),
     path('snippets', TopRatedSnippetsView, name='top_rated_snippets'),
+    path('trending/', TrendingSnippetsView, name='trending_snippets'),
 ]
@@ -1,10 +1,16 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, F
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect
 from django.http import HttpResponseBadRequest
+from django.template.response import TemplateResponse
 
 from ratings.models import Rating
-from snippets.models import Snippet
+from snippets.models import LeaderboardEntry, Snippet
+from snippets.utils.conditional import conditional_page, leaderboard_stamps
+from snippets.utils.leaderboards import awith_objects, top_entries
+from snippets.utils.recommendation_cache import invalidate_user_recommendations
+from snippets.utils.trending import DEFAULT_WINDOW, WINDOWS, get_trending_snippets
 
 from django.contrib import messages
 
@@ -19,28 +25,34 @@ def RateSnippetView(request, pk):
         if rating_value not in [Rating.LIKE, Rating.DISLIKE]:
             return HttpResponseBadRequest("Invalid rating value")
 
-        if snippet.has_user_rated(user):
-            rating = snippet.ratings.get(user=user)
-            rating.rating = rating_value
-            rating.save()
-            messages.success(request, 'Rating updated successfully.')
-        else:
-            Rating.objects.create(snippet=snippet, user=user, rating=rating_value)
-            messages.success(request, 'Rating added successfully.')
+        with transaction.atomic():
+            rating = snippet.ratings.select_for_update().filter(user=user).first()
+            if rating:
+                if rating.rating != rating_value:
+                    # The rating flipped: move one vote from the old counter to the new one
+                    Snippet.adjust_counters(snippet.pk, **{
+                        Rating.COUNTER_FIELDS[rating.rating]: -1,
+                        Rating.COUNTER_FIELDS[rating_value]: 1,
+                    })
+                    rating.rating = rating_value
+                    rating.save()
+                messages.success(request, 'Rating updated successfully.')
+            else:
+                Rating.objects.create(snippet=snippet, user=user, rating=rating_value)
+                Snippet.adjust_counters(snippet.pk, **{Rating.COUNTER_FIELDS[rating_value]: 1})
+                messages.success(request, 'Rating added successfully.')
+        invalidate_user_recommendations(user.pk)
 
         return redirect('snippet_detail', pk=pk)
     else:
         return HttpResponseBadRequest("Only POST method is allowed for rating snippets")
 
-def TopRatedSnippetsView(request):
-    # Annotate each Snippet with counts of likes and dislikes
-    top_snippets = Snippet.objects.annotate(
-        total_likes=Count('ratings', filter=Q(ratings__rating='like')),
-        total_dislikes=Count('ratings', filter=Q(ratings__rating='dislike'))
-    ).annotate(
-        # Calculate popularity_score as the difference between total_likes and total_dislikes
-        popularity_score=F('total_likes') - F('total_dislikes')
-    ).order_by('-popularity_score')[:10]  # Retrieve the top 10 snippets based on popularity_score
+@conditional_page(leaderboard_stamps)
+async def TopRatedSnippetsView(request):
+    # Read the 10 best scores (likes minus dislikes) from the materialized leaderboard
+    top_snippets = await awith_objects(
+        top_entries(LeaderboardEntry.TOP_RATED)[:10], Snippet.objects.select_related('author'), 'popularity_score'
+    )
 
     popularity_score_arr = []
 
@@ -56,4 +68,18 @@ def TopRatedSnippetsView(request):
     context = {
         'top_snippets': popularity_score_arr  # Uses the proper array with best snippets
     }
-    return render(request, 'ratings/templates/top_rated_snippets.html', context)
+    # Rendered by the handler on the request thread, where the templates may use the ORM
+    return TemplateResponse(request, 'ratings/templates/top_rated_snippets.html', context)
+
+
+async def TrendingSnippetsView(request):
+    # Recent votes weigh more than old ones, see snippets.utils.trending
+    window = request.GET.get('window', DEFAULT_WINDOW)
+    if window not in WINDOWS:
+        window = DEFAULT_WINDOW
+    context = {
+        'trending_snippets': await sync_to_async(get_trending_snippets)(window),
+        'windows': list(WINDOWS),
+        'window': window,
+    }
+    return TemplateResponse(request, 'ratings/templates/trending_snippets.html', context)
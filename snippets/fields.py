@@ -0,0 +1,71 @@
+"""
+Text columns stored compressed.
+
+CompressedTextField reads and writes ``str`` like a TextField but stores bytes: a one-byte
+format marker followed by either the UTF-8 text (RAW) or its zlib stream (ZLIB). Values under
+``min_bytes``, or that would not shrink, stay raw, so short texts cost one byte and no CPU.
+Values written before a column became compressed are still read back as they are.
+
+The database only sees bytes: lookups other than ``exact`` and ``isnull`` do not work, and
+raw SQL has to go through decompress().
+"""
+import zlib
+
+from django.db import models
+
+# Format marker, the first byte of every stored value
+RAW = b'\x00'
+ZLIB = b'\x01'
+COMPRESS_MIN_BYTES = 256
+COMPRESSION_LEVEL = 6
+
+
+def compress(text, min_bytes=COMPRESS_MIN_BYTES):
+    data = text.encode('utf-8')
+    if len(data) >= min_bytes:
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        if len(compressed) < len(data):
+            return ZLIB + compressed
+    return RAW + data
+
+
+def decompress(value):
+    if isinstance(value, str):
+        # Stored before the column was compressed
+        return value
+    value = bytes(value)
+    marker, data = value[:1], value[1:]
+    if marker == ZLIB:
+        data = zlib.decompress(data)
+    elif marker != RAW:
+        raise ValueError(f'Unknown compression marker {marker!r}')
+    return data.decode('utf-8')
+
+
+class CompressedTextField(models.TextField):
+    description = 'Text stored compressed'
+
+    def __init__(self, *args, min_bytes=COMPRESS_MIN_BYTES, **kwargs):
+        self.min_bytes = min_bytes
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.min_bytes != COMPRESS_MIN_BYTES:
+            kwargs['min_bytes'] = self.min_bytes
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        # Column type of binary data on each backend
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return value
+        return connection.Database.Binary(compress(value, self.min_bytes))
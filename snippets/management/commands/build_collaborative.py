@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from snippets.utils.collaborative import ITEM_NEIGHBOURS, TOP_N, BATCH_SIZE, build_collaborative_scores
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the collaborative-filtering recommendation scores from all ratings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item-neighbours', type=int, default=ITEM_NEIGHBOURS,
+                            help='Similar snippets kept per snippet.')
+        parser.add_argument('--top-n', type=int, default=TOP_N, help='Scores stored per user.')
+        parser.add_argument('--chunk-size', type=int, default=BATCH_SIZE,
+                            help='Rows scored per sparse matrix product.')
+
+    def handle(self, *args, **options):
+        written = build_collaborative_scores(
+            item_neighbours=options['item_neighbours'],
+            top_n=options['top_n'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} collaborative scores.'))
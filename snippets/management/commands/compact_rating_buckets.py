@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from snippets.utils.trending import compact, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rolls old hourly rating buckets up into daily ones and drops the buckets no trending window reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the buckets from the ratings table first, e.g. after a bulk import.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            written = rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} hourly rating buckets.'))
+        rolled_up, written, dropped = compact()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled {rolled_up} hourly buckets up into {written} daily buckets and dropped {dropped} old buckets.'
+        ))
@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from snippets.utils.ndjson import RECORD_TYPES, export_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Exports languages, users, snippets, ratings and comments as NDJSON (one JSON record per line).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for standard output.")
+        parser.add_argument('--types', nargs='+', choices=RECORD_TYPES, default=list(RECORD_TYPES),
+                            help='Record types to export.')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            written = export_ndjson(sys.stdout, options['types'])
+            self.stderr.write(f'Exported {written} records.')
+            return
+        with open(options['path'], 'w', encoding='utf-8') as f:
+            written = export_ndjson(f, options['types'])
+        self.stdout.write(self.style.SUCCESS(f'Exported {written} records to {options["path"]}.'))
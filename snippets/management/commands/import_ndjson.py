@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from snippets.utils.ndjson import BATCH_SIZE, Importer
+
+
+class Command(BaseCommand):
+    help = ('Imports an NDJSON file written by export_ndjson in batches. An interrupted import resumes from '
+            'its checkpoint when run again. Passwords are not exported, so imported users have no usable '
+            'password until they reset it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file to import.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Lines per transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes rendering code and Markdown (default: one per CPU, 0 or 1 renders inline).')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--skip-finish', action='store_true',
+                            help='Do not recount counters and rebuild similarities afterwards, e.g. before '
+                                 'importing another file.')
+
+    def handle(self, *args, **options):
+        importer = Importer(options['path'], batch_size=options['batch_size'], workers=options['workers'],
+                            stdout=self.stdout, stderr=self.stderr)
+        counts = importer.run(resume=not options['restart'])
+        if not options['skip_finish']:
+            importer.finish()
+        summary = ', '.join(f'{count} {record_type}s' for record_type, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Imported {summary}; {importer.invalid} invalid records skipped.'))
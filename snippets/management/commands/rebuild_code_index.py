@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from snippets.models import Snippet
+from snippets.utils.minhash import index_code_signature
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the MinHash signatures and LSH buckets used for "similar code" lookups.'
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for snippet in Snippet.objects.select_related('language').only('pk', 'code', 'language').iterator(
+                chunk_size=500):
+            index_code_signature(snippet)
+            indexed += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed the code of {indexed} snippets.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from snippets.utils.search import rebuild_search_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over snippet titles, descriptions, tags and code.'
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError('Full-text search needs the SQLite FTS5 extension.')
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} snippets.'))
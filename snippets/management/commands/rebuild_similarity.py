@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from snippets.utils.similarity import TOP_K, rebuild_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the precomputed top-K similar snippets for every snippet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours kept per snippet.')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Snippets scored per sparse matrix product.')
+
+    def handle(self, *args, **options):
+        written = rebuild_neighbours(top_k_size=options['top_k'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} snippet neighbours.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from bookmarks.models import Bookmark
+from ratings.models import Rating
+from snippets.models import Comment, Snippet
+
+
+def count_of(model, **filters):
+    rows = model.objects.filter(snippet=OuterRef('pk'), **filters).order_by().values('snippet')
+    return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count'), output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized like/dislike/comment/bookmark counters of every snippet.'
+
+    def handle(self, *args, **options):
+        actual = {
+            'like_count': count_of(Rating, rating=Rating.LIKE),
+            'dislike_count': count_of(Rating, rating=Rating.DISLIKE),
+            'comment_count': count_of(Comment),
+            'bookmark_count': count_of(Bookmark),
+        }
+        drifted = Snippet.objects.annotate(**{f'actual_{field}': value for field, value in actual.items()})
+        drift = Q()
+        for field in actual:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        repaired = Snippet.objects.filter(pk__in=drifted.filter(drift).values('pk')).update(**actual)
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters on {repaired} snippets.'))
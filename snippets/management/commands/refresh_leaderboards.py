@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from snippets.models import LeaderboardEntry
+from snippets.utils.leaderboards import refresh
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized leaderboards from the snippet, rating and bookmark tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', action='append', choices=[board for board, _ in LeaderboardEntry.BOARDS],
+                            help='Only refresh this board; may be repeated.')
+
+    def handle(self, *args, **options):
+        written = refresh(options['board'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} leaderboard entries.'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnippetTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snippet_tags', to='snippets.snippet')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snippet_tags', to='snippets.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'snippet'], name='snippettag_tag_snippet_idx')],
+                'unique_together': {('snippet', 'tag')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def normalize_tags(raw_tags):
+    return set(tag.strip().lower() for tag in raw_tags.split(',') if tag.strip())
+
+
+def backfill_tag_index(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    Tag = apps.get_model('snippets', 'Tag')
+    SnippetTag = apps.get_model('snippets', 'SnippetTag')
+
+    tag_ids = {}
+    rows = Snippet.objects.order_by('pk').values_list('pk', 'tags')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+        parsed = [(pk, normalize_tags(tags)) for pk, tags in batch]
+        new_names = set().union(*(names for _, names in parsed)) - tag_ids.keys()
+        if new_names:
+            Tag.objects.bulk_create([Tag(name=name) for name in new_names], ignore_conflicts=True)
+            tag_ids.update(Tag.objects.filter(name__in=new_names).values_list('name', 'id'))
+
+        SnippetTag.objects.bulk_create(
+            [SnippetTag(snippet_id=pk, tag_id=tag_ids[name]) for pk, names in parsed for name in names],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0002_tag_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tag_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0003_backfill_tag_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='snippets.snippet')),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='snippets.snippet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['snippet', '-score'], name='neighbour_snippet_score_idx'), models.Index(fields=['neighbour'], name='neighbour_neighbour_idx')],
+                'unique_together': {('snippet', 'neighbour')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:44
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, **filters):
+    rows = model.objects.filter(snippet=OuterRef('pk'), **filters).order_by().values('snippet')
+    return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count'), output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    Comment = apps.get_model('snippets', 'Comment')
+    Rating = apps.get_model('ratings', 'Rating')
+    Bookmark = apps.get_model('bookmarks', 'Bookmark')
+    Snippet.objects.update(
+        like_count=count_of(Rating, rating='like'),
+        dislike_count=count_of(Rating, rating='dislike'),
+        comment_count=count_of(Comment),
+        bookmark_count=count_of(Bookmark),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0004_snippet_neighbours'),
+        ('ratings', '0001_initial'),
+        ('bookmarks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0006_collaborative_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSignature',
+            fields=[
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='code_signature', serialize=False, to='snippets.snippet')),
+                ('signature', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CodeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('snippet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='code_buckets', to='snippets.snippet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='codebucket_band_bucket_idx')],
+                'unique_together': {('snippet', 'band')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+FTS_TABLE = 'snippets_snippet_fts'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, description, tags, code, tokenize = 'unicode61')"
+    )
+    # Rank title matches above tags, description and code
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 1.0)')")
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description, tags, code) "
+        f"SELECT id, title, description, tags, code FROM snippets_snippet"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0007_code_signatures'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def populate_leaderboards(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    LeaderboardEntry = apps.get_model('snippets', 'LeaderboardEntry')
+
+    snippets = Snippet.objects.order_by()
+    boards = {
+        'top_rated': snippets.annotate(score=F('like_count') - F('dislike_count')).exclude(score=0)
+        .values_list('id', 'score'),
+        'most_bookmarked': snippets.filter(bookmark_count__gt=0).values_list('id', 'bookmark_count'),
+        'top_authors': snippets.values('author_id').annotate(score=Count('id')).values_list('author_id', 'score'),
+        'top_languages': snippets.values('language_id').annotate(score=Count('id')).values_list('language_id', 'score'),
+    }
+    for board, scores in boards.items():
+        LeaderboardEntry.objects.bulk_create(
+            (LeaderboardEntry(board=board, object_id=object_id, score=score) for object_id, score in scores),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0008_snippet_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('top_rated', 'Top rated snippets'), ('most_bookmarked', 'Most bookmarked snippets'), ('top_authors', 'Top authors'), ('top_languages', 'Top languages')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('score', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', '-score', 'object_id'], name='leaderboard_board_score_idx')],
+                'unique_together': {('board', 'object_id')},
+            },
+        ),
+        migrations.RunPython(populate_leaderboards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:02
+
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0009_leaderboards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['snippet', '-pub_date'], name='comment_snippet_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(fields=['-update_date', '-pub_date', '-id'], name='snippet_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(fields=['language', '-update_date', '-pub_date', '-id'], name='snippet_language_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(fields=['author', '-update_date', '-pub_date', '-id'], name='snippet_author_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snippet',
+            index=models.Index(models.OrderBy(django.db.models.expressions.CombinedExpression(models.F('like_count'), '-', models.F('dislike_count')), descending=True), models.OrderBy(models.F('update_date'), descending=True), name='snippet_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:07
+
+import html
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from pygments import highlight
+from pygments.formatters.html import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+
+BATCH_SIZE = 500
+# Frozen copies of the list page sizes at the time of this migration
+EXCERPT_LINES = 5
+EXCERPT_LINE_LENGTH = 100
+SUMMARY_LENGTH = 200
+
+
+def code_excerpt(code, language_code, formatter):
+    lines = code.strip('\n').splitlines()[:EXCERPT_LINES]
+    excerpt = '\n'.join(line[:EXCERPT_LINE_LENGTH] for line in lines)
+    return highlight(excerpt, get_lexer_by_name(language_code), formatter)
+
+
+def plain_summary(description_html):
+    text = ' '.join(html.unescape(strip_tags(description_html)).split())
+    return Truncator(text).chars(SUMMARY_LENGTH)
+
+
+def backfill_excerpts(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    rows = Snippet.objects.order_by('pk').only('pk', 'code', 'description_html', 'language__language_code') \
+        .select_related('language')
+    formatter = HtmlFormatter(linenos=False)
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for snippet in batch:
+            snippet.excerpt_html = code_excerpt(snippet.code, snippet.language.language_code, formatter)
+            snippet.summary = plain_summary(snippet.description_html)
+        Snippet.objects.bulk_update(batch, ['excerpt_html', 'summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='excerpt_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='summary',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:14
+
+import snippets.fields
+from django.db import migrations
+
+COMPRESSED_FIELDS = ['code', 'description_html', 'highlighted_code']
+BATCH_SIZE = 500
+
+
+def _batches(Snippet):
+    rows = Snippet.objects.order_by('pk').only('pk', *COMPRESSED_FIELDS)
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        yield batch
+
+
+def compress_snippets(apps, schema_editor):
+    # Rows copied over by the column change still hold plain text; writing them back compresses them
+    Snippet = apps.get_model('snippets', 'Snippet')
+    for batch in _batches(Snippet):
+        Snippet.objects.bulk_update(batch, COMPRESSED_FIELDS)
+
+
+def decompress_snippets(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    quote = schema_editor.quote_name
+    assignments = ', '.join(f'{quote(field)} = %s' for field in COMPRESSED_FIELDS)
+    with schema_editor.connection.cursor() as cursor:
+        for batch in _batches(Snippet):
+            cursor.executemany(
+                f'UPDATE {quote(Snippet._meta.db_table)} SET {assignments} WHERE id = %s',
+                [[getattr(snippet, field) for field in COMPRESSED_FIELDS] + [snippet.pk] for snippet in batch],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0011_snippet_list_projection'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='snippet',
+            name='code',
+            field=snippets.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='description_html',
+            field=snippets.fields.CompressedTextField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='highlighted_code',
+            field=snippets.fields.CompressedTextField(editable=False),
+        ),
+        migrations.RunPython(compress_snippets, decompress_snippets),
+    ]
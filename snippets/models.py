@@ -1,13 +1,12 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
 from django.urls import reverse
 from django.utils import timezone
-from markdown import markdown
-from pygments.formatters.html import HtmlFormatter
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name
 
-from ratings.models import Rating
+from snippets.fields import CompressedTextField
+from snippets.utils import fragments
+from snippets.utils.rendering import SUMMARY_LENGTH, code_excerpt, get_lexer, highlight_code, plain_summary, render_markdown
 
 
 class Language(models.Model):
@@ -25,7 +24,27 @@ class Language(models.Model):
         return reverse('language_detail', kwargs={'slug': self.slug})
 
     def get_lexer(self):
-        return get_lexer_by_name(self.language_code)
+        return get_lexer(self.language_code)
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class SnippetQuerySet(models.QuerySet):
+
+    def for_list(self):
+        """
+        Loads what list pages show: the snippet row without its code and description, which
+        the stored excerpt and summary stand in for, plus the author and language.
+        """
+        return self.select_related('author', 'language').defer(*Snippet.HEAVY_FIELDS)
 
 
 class Snippet(models.Model):
@@ -33,38 +52,129 @@ class Snippet(models.Model):
     language = models.ForeignKey(Language, related_name='snippets', on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='snippets', on_delete=models.CASCADE)
     description = models.TextField()
-    description_html = models.TextField(editable=False)
-    code = models.TextField()
-    highlighted_code = models.TextField(editable=False)
+    description_html = CompressedTextField(editable=False)
+    code = CompressedTextField()
+    highlighted_code = CompressedTextField(editable=False)
+    excerpt_html = models.TextField(editable=False, default='')
+    summary = models.CharField(max_length=SUMMARY_LENGTH, editable=False, default='')
     pub_date = models.DateTimeField(default=timezone.now, editable=False)
     update_date = models.DateTimeField(default=timezone.now, editable=False)
     tags = models.CharField(max_length=255, default='')
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    dislike_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    bookmark_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = SnippetQuerySet.as_manager()
+
+    # Unique version of Meta.ordering used for cursor pagination
+    KEYSET_ORDERING = ('-update_date', '-pub_date', '-id')
+    # Denormalized counters, only ever changed through adjust_counters()
+    COUNTER_FIELDS = ('like_count', 'dislike_count', 'comment_count', 'bookmark_count')
+    # Unbounded text columns, left out of list querysets
+    HEAVY_FIELDS = ('description', 'description_html', 'code', 'highlighted_code')
 
     class Meta:
         ordering = ['-update_date', '-pub_date']
+        indexes = [
+            # KEYSET_ORDERING, overall and per language and author listing
+            models.Index(fields=['-update_date', '-pub_date', '-id'], name='snippet_keyset_idx'),
+            models.Index(fields=['language', '-update_date', '-pub_date', '-id'], name='snippet_language_keyset_idx'),
+            models.Index(fields=['author', '-update_date', '-pub_date', '-id'], name='snippet_author_keyset_idx'),
+            # Popular snippets, the recommendations of users without likes
+            models.Index((F('like_count') - F('dislike_count')).desc(), F('update_date').desc(),
+                         name='snippet_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored tags, language, code and description so save() only re-renders
+        # and re-indexes what actually changed
+        instance._loaded_tags = instance.__dict__.get('tags')
+        instance._loaded_language_id = instance.__dict__.get('language_id')
+        instance._loaded_code = instance.__dict__.get('code')
+        instance._loaded_description = instance.__dict__.get('description')
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.pk:
+        created = not self.pk
+        if created:
             self.pub_date = timezone.now()
         self.update_date = timezone.now()
-        self.description_html = markdown(self.description)
-        self.highlighted_code = self.highlight()
+        # Fields deferred by a list queryset were not changed, and are not loaded just to save
+        deferred = self.get_deferred_fields()
+        tags_changed = 'tags' not in deferred and getattr(self, '_loaded_tags', None) != self.tags
+        language_changed = getattr(self, '_loaded_language_id', None) != self.language_id
+        code_changed = 'code' not in deferred and getattr(self, '_loaded_code', None) != self.code
+        if 'description' not in deferred and getattr(self, '_loaded_description', None) != self.description:
+            self.description_html = render_markdown(self.description)
+            self.summary = plain_summary(self.description_html)
+            self._loaded_description = self.description
+        if code_changed or language_changed or (
+            'code' not in deferred and not (self.highlighted_code and self.excerpt_html)
+        ):
+            if 'code' in deferred:
+                self.refresh_from_db(fields=['code'])
+            self.highlighted_code = self.highlight()
+            self.excerpt_html = code_excerpt(self.code, self.language.language_code)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back possibly stale counters over concurrent F() updates
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+                and field.attname not in self.get_deferred_fields()
+            ]
         super().save(*args, **kwargs)
+        if created or language_changed:
+            from snippets.utils.leaderboards import snippet_saved
+            snippet_saved(self, created, getattr(self, '_loaded_language_id', None))
+        if tags_changed:
+            self.sync_tags()
+            self._loaded_tags = self.tags
+        if tags_changed or language_changed:
+            from snippets.utils.similarity import update_snippet_neighbours
+            update_snippet_neighbours(self)
+            self._loaded_language_id = self.language_id
+        if code_changed or language_changed:
+            from snippets.utils.minhash import index_code_signature
+            index_code_signature(self)
+            self._loaded_code = self.code
+        if created:
+            from snippets.utils.recommendation_cache import snippet_created
+            snippet_created(self)
+
+        from snippets.utils.search import index_snippets
+        index_snippets([self])
 
     def get_absolute_url(self):
         return reverse('snippet_detail', kwargs={'pk': self.pk})
 
     def highlight(self):
-        return highlight(self.code, self.language.get_lexer(), HtmlFormatter(linenos=False))
+        return highlight_code(self.code, self.language.language_code)
+
+    @classmethod
+    def adjust_counters(cls, pk, **deltas):
+        """
+        Atomically adds ``deltas`` to the counter columns of a snippet, e.g. ``like_count=1``.
+        """
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if updates:
+            cls.objects.filter(pk=pk).update(**updates)
+            from snippets.utils.leaderboards import counters_adjusted
+            counters_adjusted(pk, deltas)
+            from snippets.utils.trending import record
+            record(pk, likes=deltas.get('like_count', 0), dislikes=deltas.get('dislike_count', 0))
+            fragments.bump(fragments.snippet_key(pk), fragments.LEADERBOARD_KEY)
 
     def get_likes(self):
-        return self.ratings.filter(rating=Rating.LIKE).count()
+        return self.like_count
 
     def get_dislikes(self):
-        return self.ratings.filter(rating=Rating.DISLIKE).count()
+        return self.dislike_count
 
     def has_user_rated(self, user):
         return self.ratings.filter(user=user).exists()
@@ -75,6 +185,20 @@ class Snippet(models.Model):
     def get_normalized_tags(self):
         return set(tag.strip().lower() for tag in self.tags.split(',') if tag.strip())
 
+    def sync_tags(self):
+        """
+        Mirrors the comma-separated ``tags`` field into the indexed Tag/SnippetTag tables.
+        """
+        names = self.get_normalized_tags()
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = set(Tag.objects.filter(name__in=names).values_list('id', flat=True))
+
+        self.snippet_tags.exclude(tag_id__in=tag_ids).delete()
+        SnippetTag.objects.bulk_create(
+            [SnippetTag(snippet=self, tag_id=tag_id) for tag_id in tag_ids],
+            ignore_conflicts=True,
+        )
+
     def get_weighted_score(self):
         likes = self.get_likes()
         dislikes = self.get_dislikes()
@@ -84,6 +208,121 @@ class Snippet(models.Model):
         return (likes - dislikes) / total_ratings
 
 
+class SnippetTag(models.Model):
+    snippet = models.ForeignKey(Snippet, related_name='snippet_tags', on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, related_name='snippet_tags', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('snippet', 'tag')
+        indexes = [
+            # Candidate lookup goes tag -> snippets, the reverse of the unique index
+            models.Index(fields=['tag', 'snippet'], name='snippettag_tag_snippet_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag.name} on {self.snippet.title}'
+
+
+class SnippetNeighbour(models.Model):
+    """
+    One of a snippet's precomputed top-K most similar snippets (see snippets.utils.similarity).
+    """
+    snippet = models.ForeignKey(Snippet, related_name='neighbours', on_delete=models.CASCADE)
+    neighbour = models.ForeignKey(Snippet, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('snippet', 'neighbour')
+        indexes = [
+            models.Index(fields=['snippet', '-score'], name='neighbour_snippet_score_idx'),
+            models.Index(fields=['neighbour'], name='neighbour_neighbour_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.neighbour.title} similar to {self.snippet.title} ({self.score:.3f})'
+
+
+class CollaborativeScore(models.Model):
+    """
+    Precomputed item-item collaborative-filtering score of a snippet for a user
+    (see snippets.utils.collaborative).
+    """
+    user = models.ForeignKey(User, related_name='collaborative_scores', on_delete=models.CASCADE)
+    snippet = models.ForeignKey(Snippet, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('user', 'snippet')
+        indexes = [
+            models.Index(fields=['user', '-score'], name='cf_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.snippet.title} for {self.user.username} ({self.score:.3f})'
+
+
+class CodeSignature(models.Model):
+    """
+    MinHash signature of a snippet's code tokens (see snippets.utils.minhash).
+    """
+    snippet = models.OneToOneField(Snippet, related_name='code_signature', primary_key=True,
+                                   on_delete=models.CASCADE)
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f'Code signature of {self.snippet.title}'
+
+
+class CodeBucket(models.Model):
+    """
+    LSH bucket a snippet's signature falls into for one band; snippets sharing any bucket
+    are candidate near-duplicates.
+    """
+    snippet = models.ForeignKey(Snippet, related_name='code_buckets', on_delete=models.CASCADE)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('snippet', 'band')
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='codebucket_band_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.snippet.title} in band {self.band} bucket {self.bucket}'
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Precomputed score of a snippet, author or language on one leaderboard (see
+    snippets.utils.leaderboards). ``object_id`` is a Snippet, User or Language id depending on
+    the board; a missing row means a score of zero.
+    """
+    TOP_RATED = 'top_rated'
+    MOST_BOOKMARKED = 'most_bookmarked'
+    TOP_AUTHORS = 'top_authors'
+    TOP_LANGUAGES = 'top_languages'
+    BOARDS = [
+        (TOP_RATED, 'Top rated snippets'),
+        (MOST_BOOKMARKED, 'Most bookmarked snippets'),
+        (TOP_AUTHORS, 'Top authors'),
+        (TOP_LANGUAGES, 'Top languages'),
+    ]
+
+    board = models.CharField(max_length=20, choices=BOARDS)
+    object_id = models.PositiveIntegerField()
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('board', 'object_id')
+        indexes = [
+            models.Index(fields=['board', '-score', 'object_id'], name='leaderboard_board_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.object_id} on {self.board} ({self.score})'
+
+
 class Comment(models.Model):
     snippet = models.ForeignKey(Snippet, related_name='comments', on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='comments', on_delete=models.CASCADE)
@@ -92,6 +331,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['snippet', '-pub_date'], name='comment_snippet_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.snippet.title}'
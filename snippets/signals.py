@@ -0,0 +1,52 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bookmarks.models import Bookmark
+from ratings.models import Rating
+from snippets.models import Comment, Language, Snippet
+from snippets.utils import fragments
+from snippets.utils.leaderboards import snippet_deleted
+from snippets.utils.search import remove_snippets
+
+
+@receiver(post_delete, sender=Snippet)
+def remove_deleted_snippet_from_search(sender, instance, **kwargs):
+    # Also runs for snippets deleted through a cascade, e.g. when their author is deleted
+    remove_snippets([instance.pk])
+
+
+@receiver(post_delete, sender=Snippet)
+def remove_deleted_snippet_from_leaderboards(sender, instance, **kwargs):
+    snippet_deleted(instance)
+
+
+@receiver(post_save, sender=Snippet)
+@receiver(post_delete, sender=Snippet)
+def bump_snippet_fragments(sender, instance, **kwargs):
+    # Any snippet can be another one's neighbour in the recommendation sidebar
+    fragments.bump(fragments.snippet_key(instance.pk), fragments.SNIPPETS_KEY, fragments.LEADERBOARD_KEY)
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def bump_language_fragments(sender, instance, **kwargs):
+    fragments.bump(fragments.SNIPPETS_KEY, fragments.LEADERBOARD_KEY)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_fragments(sender, instance, **kwargs):
+    fragments.bump(fragments.comments_key(instance.snippet_id))
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def bump_rating_fragments(sender, instance, **kwargs):
+    # The sidebar favours authors the user liked
+    fragments.bump(fragments.ratings_key(instance.user_id))
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+def bump_bookmark_fragments(sender, instance, **kwargs):
+    fragments.bump(fragments.bookmarks_key(instance.user_id))
@@ -1,8 +1,44 @@
-from django.test import TestCase, Client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Subquery
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth.models import User, Group
-from snippets.models import Snippet, Comment, Language
+from bookmarks.models import Bookmark
+from ratings.models import Rating, RatingBucket
+from snippets.fields import RAW, ZLIB, compress, decompress
+from snippets.models import Snippet, SnippetNeighbour, Comment, Language, LeaderboardEntry, Tag
+from snippets.utils.recommendation_cache import get_cache_stats, get_cached_user_recommendations
+from snippets.utils.collaborative import build_collaborative_scores
+from snippets.utils.minhash import get_similar_code
+from snippets.utils import fragments, leaderboards, pdf_cache, pdf_render, rendering, trending
+from snippets.utils import concurrency
+from snippets.utils.concurrency import gather_lookups
+from snippets.utils.recommendations import get_similar_snippets, get_user_recommendations
+from snippets.utils.similarity import rebuild_neighbours
+from snippets.views import download_pdf
 from django.urls import reverse
+from tatum24.benchmark import compare_reports, run_benchmark
+from tatum24.middleware import ReplicaPinMiddleware
+from tatum24.models import ProfiledRequest
+from tatum24.profiling import StackSampler, hot_paths
+from tatum24.routers import PrimaryReplicaRouter, current_routing, routing
+from tatum24.testing import QUERY_BUDGETS, QueryBudgetMixin, QueryPlanMixin
 
 """
     Code Testing
@@ -101,6 +137,110 @@ class CommentTestCase(TestCase):
         self.assertEqual(comment.get_absolute_url(), expected_url)
 
 
+class SnippetFixturesMixin:
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test-user', password='password123')
+        self.other_user = User.objects.create_user(username='other-user', password='password123')
+        self.python = Language.objects.create(name='Python', slug='python', language_code='python')
+        self.ruby = Language.objects.create(name='Ruby', slug='ruby', language_code='ruby')
+
+    def create_snippet(self, title, tags, language=None, author=None):
+        return Snippet.objects.create(
+            title=title,
+            language=language or self.python,
+            author=author or self.user,
+            description='',
+            code='pass',
+            tags=tags,
+        )
+
+
+class TagIndexTestCase(SnippetFixturesMixin, TestCase):
+
+    def test_tags_are_indexed_on_save(self):
+        snippet = self.create_snippet('Tagged', 'Go, http ,server,')
+        self.assertEqual(
+            set(snippet.snippet_tags.values_list('tag__name', flat=True)),
+            {'go', 'http', 'server'},
+        )
+
+    def test_tag_index_follows_edits(self):
+        snippet = self.create_snippet('Tagged', 'go,http')
+        snippet.tags = 'http,concurrency'
+        snippet.save()
+        self.assertEqual(
+            set(snippet.snippet_tags.values_list('tag__name', flat=True)),
+            {'http', 'concurrency'},
+        )
+        self.assertEqual(Tag.objects.filter(name='http').count(), 1)
+
+    def test_similar_snippets_match_whole_tags(self):
+        current = self.create_snippet('Go Server', 'go', language=self.ruby)
+        exact = self.create_snippet('Go Client', 'go', author=self.other_user)
+        self.create_snippet('Google API', 'google', author=self.other_user)
+
+        self.assertEqual(get_similar_snippets(current, user=self.user), [exact])
+
+
+class SimilarityTestCase(SnippetFixturesMixin, TestCase):
+
+    def test_neighbours_ranked_by_similarity(self):
+        current = self.create_snippet('Current', 'go,http,server')
+        close = self.create_snippet('Close', 'go,http,server', author=self.other_user)
+        partial = self.create_snippet('Partial', 'go', language=self.ruby, author=self.other_user)
+        self.create_snippet('Unrelated', 'blocks', language=self.ruby, author=self.other_user)
+
+        neighbour_ids = list(current.neighbours.order_by('-score').values_list('neighbour_id', flat=True))
+        self.assertEqual(neighbour_ids, [close.pk, partial.pk])
+        self.assertIn(current.pk, partial.neighbours.values_list('neighbour_id', flat=True))
+
+    def test_rebuild_matches_incremental_updates(self):
+        current = self.create_snippet('Current', 'go,http')
+        self.create_snippet('Other', 'http', author=self.other_user)
+        self.create_snippet('Ruby', 'go', language=self.ruby, author=self.other_user)
+        incremental = set(current.neighbours.values_list('neighbour_id', 'score'))
+
+        rebuild_neighbours()
+        rebuilt = set(current.neighbours.values_list('neighbour_id', 'score'))
+        self.assertEqual(
+            {pk: round(score, 6) for pk, score in incremental},
+            {pk: round(score, 6) for pk, score in rebuilt},
+        )
+
+    def test_incremental_updates_match_a_rebuild_with_full_lists(self):
+        # Untagged snippets are most similar to each other, yet more snippets than a list
+        # holds came in between, with many tied scores
+        for number in range(5):
+            self.create_snippet(f'Plain {number}', '')
+        tag_sets = ['go', 'go,http', 'http', 'server']
+        for number in range(30):
+            language = self.ruby if number % 9 == 0 else self.python
+            self.create_snippet(f'Tagged {number}', tag_sets[number % len(tag_sets)], language=language)
+        self.create_snippet('Plain again', '')
+        incremental = self.neighbour_rows()
+        rebuild_neighbours()
+        self.assertEqual(incremental, self.neighbour_rows())
+
+    def test_incremental_update_scores_a_bounded_sample(self):
+        older = [self.create_snippet(f'Older {number}', '') for number in range(6)]
+        tagged = [self.create_snippet(f'Tagged {number}', 'go') for number in range(4)]
+        with mock.patch('snippets.utils.similarity.MAX_LANGUAGE_CANDIDATES', 3), \
+                mock.patch('snippets.utils.similarity.MAX_TAG_CANDIDATES', 2):
+            snippet = self.create_snippet('New', 'go')
+        # The three most recently updated snippets of the language and the two newest tagged
+        # ones, counting the new snippet itself
+        sample = {tagged[3].pk, tagged[2].pk}
+        self.assertEqual(set(snippet.neighbours.values_list('neighbour_id', flat=True)), sample)
+        self.assertEqual(set(SnippetNeighbour.objects.filter(neighbour=snippet).values_list('snippet_id', flat=True)),
+                         sample)
+        self.assertFalse(SnippetNeighbour.objects.filter(snippet__in=older, neighbour=snippet).exists())
+
+    def neighbour_rows(self):
+        rows = SnippetNeighbour.objects.values_list('snippet_id', 'neighbour_id', 'score')
+        return {(snippet_id, neighbour_id, round(score, 6)) for snippet_id, neighbour_id, score in rows}
+
+
 """
     
     View Testing
@@ -108,6 +248,1173 @@ class CommentTestCase(TestCase):
 """
 
 
+class SnippetCounterTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.snippet = self.create_snippet('Counted', 'python')
+        self.client.force_login(self.other_user)
+
+    def test_rating_flip_moves_the_vote(self):
+        self.client.post(reverse('rate_snippet', args=[self.snippet.pk]), {'rating': 'like'})
+        self.snippet.refresh_from_db()
+        self.assertEqual((self.snippet.like_count, self.snippet.dislike_count), (1, 0))
+
+        self.client.post(reverse('rate_snippet', args=[self.snippet.pk]), {'rating': 'dislike'})
+        self.snippet.refresh_from_db()
+        self.assertEqual((self.snippet.like_count, self.snippet.dislike_count), (0, 1))
+        self.assertEqual(self.snippet.get_weighted_score(), -1)
+
+    def test_comment_and_bookmark_counters(self):
+        self.client.post(reverse('add_comment', args=[self.snippet.pk]), {'content': 'Nice'})
+        self.client.get(reverse('add_bookmark', args=[self.snippet.pk]))
+        self.client.get(reverse('add_bookmark', args=[self.snippet.pk]))
+        self.snippet.refresh_from_db()
+        self.assertEqual((self.snippet.comment_count, self.snippet.bookmark_count), (1, 1))
+
+        self.client.post(reverse('delete_comment', args=[Comment.objects.get().pk]))
+        self.client.post(reverse('delete_bookmark', args=[self.snippet.pk]))
+        self.snippet.refresh_from_db()
+        self.assertEqual((self.snippet.comment_count, self.snippet.bookmark_count), (0, 0))
+
+    def test_saving_a_stale_instance_keeps_counters(self):
+        stale = Snippet.objects.get(pk=self.snippet.pk)
+        Snippet.adjust_counters(self.snippet.pk, like_count=1)
+        stale.title = 'Renamed'
+        stale.save()
+        self.snippet.refresh_from_db()
+        self.assertEqual(self.snippet.like_count, 1)
+
+    def test_recount_repairs_drift(self):
+        Snippet.adjust_counters(self.snippet.pk, like_count=5)
+        call_command('recount', stdout=StringIO())
+        self.snippet.refresh_from_db()
+        self.assertEqual(self.snippet.like_count, 0)
+
+
+class RecommendationCacheTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['recommendations'].clear()
+        caches['recommendation_state'].clear()
+        liked = self.create_snippet('Liked', 'go', author=self.other_user)
+        self.recommended = self.create_snippet('Recommended', 'go', author=self.other_user)
+        self.user.ratings.create(snippet=liked, rating='like')
+
+    def test_second_call_is_a_hit(self):
+        self.assertEqual(get_cached_user_recommendations(self.user), [self.recommended])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cached_user_recommendations(self.user), [self.recommended])
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1, 'stale': 0})
+
+    def test_new_snippet_refreshes_entry(self):
+        get_cached_user_recommendations(self.user)
+        newer = self.create_snippet('Newer', 'go', author=self.other_user)
+        self.assertCountEqual(get_cached_user_recommendations(self.user), [self.recommended, newer])
+
+    def test_new_snippet_only_refreshes_the_entries_it_can_change(self):
+        get_cached_user_recommendations(self.user)
+        get_cached_user_recommendations(self.other_user)
+        # Neither a candidate for the user nor more popular than what the other user sees
+        self.create_snippet('Unrelated', 'rust', author=self.other_user)
+        get_cached_user_recommendations(self.user)
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 2, 'stale': 0})
+        # Popular snippets are recomputed on any new snippet
+        get_cached_user_recommendations(self.other_user)
+        self.assertEqual(get_cache_stats()['misses'], 3)
+
+    def test_evicted_entries_keep_the_stats(self):
+        get_cached_user_recommendations(self.user)
+        caches['recommendations'].clear()
+        get_cached_user_recommendations(self.user)
+        self.assertEqual(get_cache_stats(), {'hits': 0, 'misses': 2, 'stale': 0})
+
+    def test_rating_invalidates_entry(self):
+        get_cached_user_recommendations(self.user)
+        self.client.force_login(self.user)
+        self.client.post(reverse('rate_snippet', args=[self.recommended.pk]), {'rating': 'dislike'})
+        self.assertEqual(get_cached_user_recommendations(self.user), [])
+
+
+class CollaborativeFilteringTestCase(SnippetFixturesMixin, TestCase):
+
+    def test_recommends_what_similar_users_liked(self):
+        author = User.objects.create_user(username='author', password='password123')
+        shared = self.create_snippet('Shared', 'go', author=author)
+        liked_by_peer = self.create_snippet('Peer Favourite', 'blocks', language=self.ruby, author=author)
+        disliked_by_peer = self.create_snippet('Peer Dislike', 'traits', language=self.ruby, author=author)
+        self.user.ratings.create(snippet=shared, rating='like')
+        self.other_user.ratings.create(snippet=shared, rating='like')
+        self.other_user.ratings.create(snippet=liked_by_peer, rating='like')
+        self.other_user.ratings.create(snippet=disliked_by_peer, rating='dislike')
+
+        caches['recommendations'].clear()
+        self.assertNotIn(liked_by_peer, get_cached_user_recommendations(self.user))
+        build_collaborative_scores()
+        self.assertEqual(
+            list(self.user.collaborative_scores.values_list('snippet_id', 'score')),
+            [(liked_by_peer.pk, 1.0)],
+        )
+        self.assertEqual(get_user_recommendations(self.user), [liked_by_peer])
+        # The entry cached before the rebuild is not served any more
+        self.assertEqual(get_cached_user_recommendations(self.user), [liked_by_peer])
+
+    def test_popular_fallback_has_no_duplicates(self):
+        snippet = self.create_snippet('Popular', 'go', author=self.other_user)
+        for username in ('first', 'second'):
+            user = User.objects.create_user(username=username, password='password123')
+            user.ratings.create(snippet=snippet, rating='like')
+        Snippet.adjust_counters(snippet.pk, like_count=2)
+
+        recommended = list(get_user_recommendations(self.user))
+        self.assertEqual(recommended[0], snippet)
+        self.assertEqual(len(recommended), len(set(recommended)))
+
+
+class SimilarCodeTestCase(SnippetFixturesMixin, TestCase):
+    code = (
+        'def fibonacci(n):\n'
+        '    a, b = 0, 1\n'
+        '    for _ in range(n):\n'
+        '        a, b = b, a + b\n'
+        '    return a\n'
+    )
+
+    def create_code_snippet(self, title, code):
+        snippet = self.create_snippet(title, '')
+        snippet.code = code
+        snippet.save()
+        return snippet
+
+    def test_near_duplicate_code_is_found(self):
+        original = self.create_code_snippet('Original', self.code)
+        # Same tokens, different comments and whitespace
+        copy = self.create_code_snippet('Copy', '# copied\n' + self.code.replace('    ', '  '))
+        self.create_code_snippet('Other', 'class Greeter:\n    def greet(self):\n        print("hi")\n')
+
+        self.assertEqual(get_similar_code(copy), [original])
+
+    def test_signature_follows_code_edits(self):
+        original = self.create_code_snippet('Original', self.code)
+        edited = self.create_code_snippet('Edited', self.code)
+        edited.code = 'import os\nprint(os.getcwd())\n'
+        edited.save()
+        self.assertEqual(get_similar_code(original), [])
+
+    def test_add_snippet_warns_about_duplicates(self):
+        self.create_code_snippet('Original', self.code)
+        self.client.force_login(self.other_user)
+        response = self.client.post(reverse('add_snippet'), {
+            'title': 'Again', 'code': self.code, 'description': 'Copy', 'language': self.python.pk, 'tags': 'math',
+        }, follow=True)
+        self.assertContains(response, 'This code looks very similar to')
+
+
+class SnippetSearchTestCase(SnippetFixturesMixin, TestCase):
+
+    def search(self, query):
+        response = self.client.get(reverse('snippet_list'), {'q': query})
+        return [snippet.title for snippet in response.context['snippets']]
+
+    def test_searches_description_tags_and_code(self):
+        self.create_snippet('Loops', 'beginner')
+        described = self.create_snippet('Described', 'iterators')
+        described.description = 'Explains generators'
+        described.save()
+        coded = self.create_snippet('Coded', 'beginner')
+        coded.code = 'def gen():\n    yield 1'
+        coded.save()
+
+        self.assertEqual(self.search('generators'), ['Described'])
+        self.assertEqual(self.search('iterators'), ['Described'])
+        self.assertEqual(self.search('yield'), ['Coded'])
+        self.assertEqual(self.search('loo'), ['Loops'])
+
+    def test_title_matches_rank_first(self):
+        self.create_snippet('Other', 'decorators')
+        self.create_snippet('Decorators', 'python')
+        self.assertEqual(self.search('decorators'), ['Decorators', 'Other'])
+
+    def test_deleted_snippets_leave_the_index(self):
+        self.create_snippet('Gone', 'python').delete()
+        self.assertEqual(self.search('gone'), [])
+
+    def test_excerpts_are_escaped_and_highlighted(self):
+        snippet = self.create_snippet('Markup', 'html')
+        snippet.description = '<script>alert(1)</script> unique'
+        snippet.save()
+        response = self.client.get(reverse('snippet_list'), {'q': 'unique'})
+        self.assertContains(response, '&lt;script&gt;alert(1)&lt;/script&gt; <mark>unique</mark>')
+
+    def test_capped_results_say_so(self):
+        for number in range(3):
+            self.create_snippet(f'Capped {number}', 'python')
+        with mock.patch('snippets.utils.search.MAX_RESULTS', 2), mock.patch('snippets.views.snippets.MAX_RESULTS', 2):
+            response = self.client.get(reverse('snippet_list'), {'q': 'capped'})
+            self.assertEqual(len(response.context['snippets']), 2)
+            self.assertContains(response, 'Showing the first 2 matches')
+        response = self.client.get(reverse('snippet_list'), {'q': 'capped'})
+        self.assertNotContains(response, 'Showing the first')
+
+
+class KeysetPaginationTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Newest first, so the list shows Snippet 24 down to Snippet 0
+        for number in range(25):
+            self.create_snippet(f'Snippet {number}', 'python')
+
+    def titles(self, response):
+        return [snippet.title for snippet in response.context['snippets']]
+
+    def follow(self, response, direction):
+        query = getattr(response.context['page_obj'], f'{direction}_query')
+        return self.client.get(f"{reverse('snippet_list')}?{query}")
+
+    def test_next_and_previous_cursors(self):
+        first = self.client.get(reverse('snippet_list'))
+        self.assertEqual(self.titles(first), [f'Snippet {n}' for n in range(24, 4, -1)])
+        self.assertFalse(first.context['page_obj'].has_previous())
+
+        second = self.follow(first, 'next')
+        self.assertEqual(self.titles(second), [f'Snippet {n}' for n in range(4, -1, -1)])
+        self.assertFalse(second.context['page_obj'].has_next())
+
+        back = self.follow(second, 'previous')
+        self.assertEqual(self.titles(back), self.titles(first))
+        self.assertFalse(back.context['page_obj'].has_previous())
+
+    def test_language_detail_is_paginated(self):
+        response = self.client.get(reverse('language_detail', args=['python']))
+        self.assertEqual(len(response.context['snippets']), 20)
+        self.assertContains(response, 'cursor=')
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('snippet_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RenderingCacheTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches[rendering.CACHE_ALIAS].clear()
+
+    def test_identical_code_is_highlighted_once(self):
+        with mock.patch.object(rendering, 'highlight', wraps=rendering.highlight) as highlight:
+            first = self.create_snippet('First', 'python')
+            second = self.create_snippet('Second', 'python')
+        self.assertEqual(highlight.call_count, 1)
+        self.assertEqual(first.highlighted_code, second.highlighted_code)
+
+    def test_unchanged_fields_are_not_rendered_again(self):
+        snippet = Snippet.objects.get(pk=self.create_snippet('Title', 'python').pk)
+        with mock.patch('snippets.models.highlight_code') as highlight_code, \
+                mock.patch('snippets.models.render_markdown') as render_markdown:
+            snippet.title = 'Renamed'
+            snippet.tags = 'python, renamed'
+            snippet.save()
+        highlight_code.assert_not_called()
+        render_markdown.assert_not_called()
+
+    def test_changed_code_is_rendered(self):
+        snippet = Snippet.objects.get(pk=self.create_snippet('Title', 'python').pk)
+        snippet.code = 'print("changed")'
+        snippet.description = '*changed*'
+        snippet.save()
+        self.assertIn('changed', snippet.highlighted_code)
+        self.assertIn('<em>changed</em>', snippet.description_html)
+
+
+class FragmentCacheTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches[fragments.CACHE_ALIAS].clear()
+        self.snippet = self.create_snippet('Cached', 'python')
+        self.url = reverse('snippet_detail', args=[self.snippet.pk])
+
+    def test_code_is_cached_until_the_snippet_is_saved(self):
+        self.client.get(self.url)
+        # A raw update changes neither update_date nor any stamp
+        Snippet.objects.filter(pk=self.snippet.pk).update(highlighted_code='<pre>raw update</pre>')
+        self.assertNotContains(self.client.get(self.url), 'raw update')
+
+        self.snippet.code = 'print("saved")'
+        self.snippet.save()
+        self.assertContains(self.client.get(self.url), 'saved')
+
+    def test_comment_changes_bump_the_comment_list(self):
+        self.assertContains(self.client.get(self.url), 'No comments yet')
+        comment = Comment.objects.create(snippet=self.snippet, author=self.other_user, content='First!')
+        self.assertContains(self.client.get(self.url), 'First!')
+        comment.delete()
+        self.assertContains(self.client.get(self.url), 'No comments yet')
+
+    def test_per_user_parts_are_rendered_per_request(self):
+        Comment.objects.create(snippet=self.snippet, author=self.other_user, content='Mine')
+        delete_url = reverse('delete_comment', args=[self.snippet.comments.get().pk])
+
+        self.client.force_login(self.other_user)
+        self.assertContains(self.client.get(self.url), delete_url)
+        Bookmark.objects.create(user=self.other_user, snippet=self.snippet)
+        self.assertContains(self.client.get(self.url), 'Saved')
+
+        self.client.force_login(User.objects.create_user('visitor', password='password123'))
+        response = self.client.get(self.url)
+        self.assertNotContains(response, delete_url)
+        self.assertNotContains(response, 'Saved')
+
+    def test_cached_page_skips_the_fragment_queries(self):
+        Comment.objects.create(snippet=self.snippet, author=self.other_user, content='Hello')
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(self.url)
+        self.assertLess(len(second.captured_queries), len(first.captured_queries))
+        self.assertFalse(any('snippets_comment' in query['sql'] for query in second.captured_queries))
+
+
+class ConditionalGetTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches[fragments.CACHE_ALIAS].clear()
+        self.snippet = self.create_snippet('Conditional', 'python')
+        self.url = reverse('snippet_detail', args=[self.snippet.pk])
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_anonymous_detail_page(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.revalidate(self.url, response).status_code, 304)
+        modified_since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(modified_since.status_code, 304)
+
+        Comment.objects.create(snippet=self.snippet, author=self.other_user, content='New')
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_logged_in_detail_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(self.url, response).status_code, 304)
+
+        Bookmark.objects.create(user=self.user, snippet=self.snippet)
+        response = self.revalidate(self.url, response)
+        self.assertContains(response, 'Saved')
+
+        # Another user never gets this user's page back
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_pending_messages_disable_validators(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('rate_snippet', args=[self.snippet.pk]), {'rating': 'like'})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Rating added successfully.')
+        self.assertNotIn('ETag', response)
+        self.assertIn('ETag', self.client.get(self.url))
+
+    def test_aggregate_pages_follow_the_leaderboard(self):
+        url = reverse('top_rated_snippets')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        Rating.objects.create(snippet=self.snippet, user=self.other_user, rating=Rating.LIKE)
+        Snippet.adjust_counters(self.snippet.pk, like_count=1)
+        response = self.revalidate(url, response)
+        self.assertContains(response, 'Conditional')
+
+
+class LeaderboardTestCase(SnippetFixturesMixin, TestCase):
+
+    def entries(self):
+        return set(LeaderboardEntry.objects.exclude(score=0).values_list('board', 'object_id', 'score'))
+
+    def test_incremental_updates_match_a_refresh(self):
+        first = self.create_snippet('First', 'python')
+        second = self.create_snippet('Second', 'ruby', language=self.ruby, author=self.other_user)
+        third = self.create_snippet('Third', 'python')
+        second.language = self.python
+        second.save()
+        Snippet.adjust_counters(first.pk, like_count=2, dislike_count=1, bookmark_count=1)
+        Snippet.adjust_counters(second.pk, dislike_count=1)
+        Snippet.adjust_counters(third.pk, like_count=3)
+        Snippet.adjust_counters(third.pk, like_count=-1, dislike_count=1)
+        first.delete()
+
+        incremental = self.entries()
+        self.assertIn((LeaderboardEntry.TOP_LANGUAGES, self.python.pk, 2), incremental)
+        self.assertIn((LeaderboardEntry.TOP_AUTHORS, self.user.pk, 1), incremental)
+        leaderboards.refresh()
+        self.assertEqual(self.entries(), incremental)
+
+    def test_pages_read_the_boards(self):
+        snippets = [self.create_snippet(f'Snippet {n}', 'python') for n in range(4)]
+        for n, snippet in enumerate(snippets):
+            Snippet.adjust_counters(snippet.pk, like_count=n, bookmark_count=n)
+        self.create_snippet('Ruby one', 'ruby', language=self.ruby, author=self.other_user)
+
+        top_rated = self.client.get(reverse('top_rated_snippets')).context['top_snippets']
+        self.assertEqual([item['snippet'].title for item in top_rated], ['Snippet 3', 'Snippet 2', 'Snippet 1'])
+        self.assertEqual(top_rated[0]['popularity_score'], 3)
+
+        most_bookmarked = self.client.get(reverse('most_bookmarked')).context['most_bookmarked_list']
+        self.assertEqual([snippet.bookmark_count for snippet in most_bookmarked], [3, 2, 1])
+
+        authors = self.client.get(reverse('tatum24_top_authors')).context['popular_top_authors_list']
+        self.assertEqual([(user.username, user.snippet_count) for user in authors], [('test-user', 4), ('other-user', 1)])
+        response = self.client.get(reverse('tatum24_top_languages'))
+        self.assertEqual([(language.name, language.snippet_count) for language in response.context['top_languages_list']],
+                         [('Python', 4), ('Ruby', 1)])
+
+
+class TrendingTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.old = self.create_snippet('Old favourite', 'python')
+        self.new = self.create_snippet('New hit', 'python')
+
+    def ago(self, **delta):
+        return self.now - timezone.timedelta(**delta)
+
+    def test_rating_changes_are_bucketed(self):
+        Snippet.adjust_counters(self.new.pk, like_count=1)
+        Snippet.adjust_counters(self.new.pk, like_count=-1, dislike_count=1)
+        bucket = RatingBucket.objects.get()
+        self.assertEqual((bucket.likes, bucket.dislikes, bucket.span), (0, 1, RatingBucket.HOUR))
+        self.assertEqual(bucket.start, trending.bucket_start(timezone.now()))
+
+    def test_recent_votes_weigh_more(self):
+        trending.record(self.old.pk, likes=3, moment=self.ago(hours=20))
+        trending.record(self.new.pk, likes=2, moment=self.now)
+        trending.record(self.old.pk, likes=50, moment=self.ago(days=60))
+
+        day = trending.get_trending_snippets('24h', now=self.now)
+        self.assertEqual(day, [self.new, self.old])
+        self.assertLess(day[1].trending_score, 1)
+        month = trending.get_trending_snippets('30d', now=self.now)
+        self.assertEqual(month, [self.old, self.new])
+
+    def test_compaction_rolls_up_old_hours(self):
+        three_days_ago = trending.bucket_start(self.ago(days=3), RatingBucket.DAY)
+        for hour in (1, 5, 9):
+            trending.record(self.old.pk, likes=2, dislikes=1, moment=three_days_ago + timezone.timedelta(hours=hour))
+        trending.record(self.new.pk, likes=1, moment=self.now)
+        trending.record(self.new.pk, likes=1, moment=self.ago(days=40))
+        before = trending.trending_scores('7d', now=self.now)
+
+        self.assertEqual(trending.compact(self.now), (3, 1, 1))
+        daily = RatingBucket.objects.get(snippet=self.old)
+        self.assertEqual((daily.start, daily.span, daily.likes, daily.dislikes), (three_days_ago, RatingBucket.DAY, 6, 3))
+        self.assertEqual(RatingBucket.objects.filter(snippet=self.new).count(), 1)
+        after = trending.trending_scores('7d', now=self.now)
+        self.assertAlmostEqual(after[self.old.pk], before[self.old.pk], delta=0.5)
+        self.assertEqual(after[self.new.pk], before[self.new.pk])
+
+    def test_rebuild_from_ratings(self):
+        Rating.objects.create(snippet=self.new, user=self.user, rating=Rating.LIKE, date=self.ago(hours=2))
+        Rating.objects.create(snippet=self.new, user=self.other_user, rating=Rating.DISLIKE, date=self.ago(hours=2))
+        Rating.objects.create(snippet=self.old, user=self.user, rating=Rating.LIKE, date=self.ago(days=90))
+        self.assertEqual(trending.rebuild(self.now), 1)
+        bucket = RatingBucket.objects.get()
+        self.assertEqual((bucket.snippet_id, bucket.likes, bucket.dislikes), (self.new.pk, 1, 1))
+        self.assertEqual(bucket.start, trending.bucket_start(self.ago(hours=2)))
+
+    def test_trending_page(self):
+        caches[trending.CACHE_ALIAS].clear()
+        trending.record(self.new.pk, likes=1)
+        response = self.client.get(reverse('trending_snippets'), {'window': '7d'})
+        self.assertEqual(response.context['window'], '7d')
+        self.assertContains(response, 'New hit')
+        # The ranking is reused until it expires
+        trending.record(self.old.pk, likes=5)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('trending_snippets'), {'window': '7d'})
+        self.assertNotContains(response, 'Old favourite')
+        self.assertEqual(self.client.get(reverse('trending_snippets'), {'window': 'bogus'}).context['window'], '24h')
+
+
+def hang(html):
+    time.sleep(60)
+
+
+def fill_render_queue(test):
+    """
+    Takes every PDF queue slot through lock files of its own, as other web processes would.
+    """
+    slots = pdf_render._Gate('slot', pdf_render._get_gates()[1].size)
+    tokens = [slots.acquire() for _ in range(slots.size)]
+    for token in tokens:
+        test.addCleanup(slots.release, token)
+
+
+class PDFCacheTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.snippet = self.create_snippet('Printable', 'python')
+        self.client.login(username='test-user', password='password123')
+
+    def download(self, **headers):
+        return self.client.get(reverse('download_pdf', args=[self.snippet.pk]), headers=headers)
+
+    def test_pdf_is_rendered_once_and_revalidated(self):
+        with mock.patch.object(download_pdf, 'render_pdf_bytes', wraps=download_pdf.render_pdf_bytes) as render:
+            first = self.download()
+            second = self.download()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(b''.join(first.streaming_content), b''.join(second.streaming_content))
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+
+        not_modified = self.download(if_none_match=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_editing_the_snippet_replaces_its_pdf(self):
+        etag = self.download()['ETag']
+        self.snippet.title = 'Reprinted'
+        self.snippet.save()
+        response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        pdfs = [name for name in os.listdir(self.cache_dir.name) if name.endswith('.pdf')]
+        self.assertEqual(pdfs, [pdf_cache.pdf_cache_key(self.snippet)])
+
+    def test_least_recently_used_files_are_evicted(self):
+        for index, name in enumerate(['old.pdf', 'recent.pdf']):
+            path = os.path.join(self.cache_dir.name, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (index, index))
+        self.assertEqual(pdf_cache.evict(150), 1)
+        self.assertEqual(os.listdir(self.cache_dir.name), ['recent.pdf'])
+
+    def test_full_render_queue_answers_503(self):
+        fill_render_queue(self)
+        self.assertEqual(pdf_render.get_render_stats()['in_flight'], 10)
+        response = self.download()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_render_stats_are_staff_only(self):
+        self.download().close()
+        self.assertEqual(self.client.get(reverse('pdf_render_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get(reverse('pdf_render_stats')).json()
+        self.assertGreaterEqual(stats['completed'], 1)
+        self.assertEqual(stats['capacity'], 10)
+
+    def test_render_processes_are_reused(self):
+        pdf_render.render_pdf('<p>x</p>')
+        pids = [worker.process.pid for worker in pdf_render._idle]
+        pdf_render.render_pdf('<p>y</p>')
+        self.assertEqual([worker.process.pid for worker in pdf_render._idle], pids)
+        self.assertTrue(pids)
+
+    def test_hanging_render_is_killed_at_the_deadline(self):
+        timed_out = pdf_render.get_render_stats()['timed_out']
+        started = time.monotonic()
+        with self.assertRaises(pdf_render.PDFRenderTimeout):
+            pdf_render.render_pdf('<p>x</p>', timeout=0.5, render=hang)
+        self.assertLess(time.monotonic() - started, 5)
+        stats = pdf_render.get_render_stats()
+        self.assertEqual((stats['timed_out'], stats['in_flight']), (timed_out + 1, 0))
+        # The worker and the queue slot are free again
+        for _ in range(stats['capacity'] + 1):
+            self.assertTrue(pdf_render.render_pdf('<p>x</p>').startswith(b'%PDF'))
+
+
+class ExportTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.login(username='test-user', password='password123')
+
+    def archive(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_exports_own_snippets_as_source_files(self):
+        mine = self.create_snippet('My Loop', 'python')
+        self.create_snippet('Gem', 'ruby', language=self.ruby)
+        self.create_snippet('Not Mine', 'python', author=self.other_user)
+
+        archive = self.archive('export_snippets')
+        self.assertEqual(sorted(archive.namelist()), [
+            f'source/{mine.pk}-my-loop.py',
+            f'source/{mine.pk + 1}-gem.rb',
+        ])
+        self.assertEqual(archive.read(f'source/{mine.pk}-my-loop.py'), b'pass')
+
+    def test_exports_bookmarks_with_pdfs(self):
+        snippet = self.create_snippet('Bookmarked', 'python', author=self.other_user)
+        Bookmark.objects.create(snippet=snippet, user=self.user)
+
+        archive = self.archive('export_bookmarks', pdf='1')
+        self.assertEqual(sorted(archive.namelist()), [
+            f'pdf/{snippet.pk}-bookmarked.pdf',
+            f'source/{snippet.pk}-bookmarked.py',
+        ])
+        self.assertTrue(archive.read(f'pdf/{snippet.pk}-bookmarked.pdf').startswith(b'%PDF'))
+
+    def test_pdfs_are_listed_as_missing_when_the_queue_is_full(self):
+        snippet = self.create_snippet('Busy', 'python')
+        fill_render_queue(self)
+        with mock.patch('time.sleep') as sleep:
+            archive = self.archive('export_snippets', pdf='1')
+        sleep.assert_not_called()
+        self.assertEqual(sorted(archive.namelist()), ['pdf/MISSING.txt', f'source/{snippet.pk}-busy.py'])
+        self.assertIn(f'{snippet.pk}-busy.pdf: PDF generation was busy', archive.read('pdf/MISSING.txt').decode())
+
+
+class NDJSONTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.snippet = self.create_snippet('Round Trip', 'python, io')
+        self.snippet.description = '*Reads* a file'
+        self.snippet.code = 'open("f").read()'
+        self.snippet.save()
+        Rating.objects.create(snippet=self.snippet, user=self.other_user, rating=Rating.LIKE)
+        Comment.objects.create(snippet=self.snippet, author=self.other_user, content='Handy')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dump.ndjson')
+        call_command('export_ndjson', self.path, stdout=StringIO())
+
+    def import_dump(self, *args):
+        stderr = StringIO()
+        call_command('import_ndjson', self.path, '--workers', '0', *args, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_round_trip_preserves_ids_and_rebuilds_derived_data(self):
+        Snippet.objects.all().delete()
+        self.import_dump()
+
+        snippet = Snippet.objects.get(pk=self.snippet.pk)
+        self.assertEqual(snippet.highlighted_code, self.snippet.highlighted_code)
+        self.assertEqual(snippet.description_html, '<p><em>Reads</em> a file</p>')
+        self.assertEqual((snippet.like_count, snippet.comment_count), (1, 1))
+        self.assertEqual(set(snippet.snippet_tags.values_list('tag__name', flat=True)), {'python', 'io'})
+        response = self.client.get(reverse('snippet_list'), {'q': 'reads'})
+        self.assertEqual([s.pk for s in response.context['snippets']], [snippet.pk])
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+    def test_resumes_after_checkpoint_and_reports_invalid_lines(self):
+        Snippet.objects.all().delete()
+        with open(self.path) as f:
+            lines = f.readlines()
+        snippet_line = next(i for i, line in enumerate(lines, start=1) if '"type": "snippet"' in line)
+        with open(self.path, 'a') as f:
+            f.write('{"type": "rating", "snippet": 999, "user": "test-user", "rating": "like"}\n')
+        with open(f'{self.path}.checkpoint', 'w') as f:
+            f.write(json.dumps({'line': snippet_line}))
+
+        errors = self.import_dump('--skip-finish')
+        self.assertIn(f'Line {len(lines) + 1}: unknown snippet 999', errors)
+        # Everything up to the checkpoint counts as imported already
+        self.assertFalse(Snippet.objects.exists())
+
+    def test_ids_of_existing_rows_are_not_reused(self):
+        errors = self.import_dump('--skip-finish')
+        self.assertIn(f'id {self.snippet.pk} belongs to an existing snippet', errors)
+        # The file's rating and comment are not attached to the snippet that happens to have its id
+        self.assertEqual(errors.count(f'unknown snippet {self.snippet.pk}'), 2)
+        self.assertEqual((Rating.objects.count(), Comment.objects.count()), (1, 1))
+
+    def test_repeated_and_replayed_records_are_not_counted(self):
+        Snippet.objects.all().delete()
+        with open(self.path) as f:
+            lines = f.readlines()
+        with open(self.path, 'a') as f:
+            f.writelines(line for line in lines if '"type": "snippet"' in line or '"type": "rating"' in line)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_ndjson', self.path, '--workers', '0', stdout=stdout, stderr=stderr)
+        self.assertEqual(stderr.getvalue().count('duplicate of an earlier record'), 2)
+        # The languages and users were already there
+        self.assertIn('Imported 0 languages, 0 users, 1 snippets, 1 ratings, 1 comments', stdout.getvalue())
+
+        # A batch replayed after an interruption is skipped
+        with open(f'{self.path}.checkpoint', 'w') as f:
+            f.write(json.dumps({'line': 1}))
+        call_command('import_ndjson', self.path, '--workers', '0', '--skip-finish', stdout=stdout, stderr=StringIO())
+        self.assertIn('0 snippets, 0 ratings, 0 comments', stdout.getvalue())
+        self.assertEqual(Rating.objects.count(), 1)
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_generated_data_can_be_benchmarked(self):
+        call_command('generate_data', '--users', '5', '--snippets', '20', '--ratings', '40', '--comments', '10',
+                     '--bookmarks', '10', '--workers', '0', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Snippet.objects.count(), 20)
+        self.assertEqual(Bookmark.objects.count(), 10)
+        self.assertEqual(Rating.objects.count(), 40)
+
+        report = run_benchmark(iterations=2, warmup=0, only=['snippet_list', 'snippet_detail'], host='testserver')
+        self.assertEqual(set(report['results']), {'snippet_list', 'snippet_detail'})
+        self.assertEqual(report['meta']['rows']['snippets'], 20)
+        self.assertGreater(report['results']['snippet_detail']['queries']['max'], 0)
+        self.assertEqual(compare_reports(report, report)[0][3], 0.0)
+
+    def test_generating_twice_appends(self):
+        options = ['--users', '5', '--snippets', '20', '--ratings', '40', '--comments', '10', '--bookmarks', '10',
+                   '--workers', '0']
+        call_command('generate_data', *options, stdout=StringIO(), stderr=StringIO())
+        stdout, stderr = StringIO(), StringIO()
+        call_command('generate_data', *options, '--seed', '1', stdout=stdout, stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+        self.assertIn('Generated 0 users, 20 snippets', stdout.getvalue())
+        self.assertEqual(
+            (Snippet.objects.count(), Comment.objects.count(), Rating.objects.count(), Bookmark.objects.count()),
+            (40, 20, 80, 20),
+        )
+        self.assertEqual(User.objects.count(), 5)
+
+
+@override_settings(PARALLEL_VIEW_QUERIES=True)
+class BenchmarkQueryCountTestCase(TransactionTestCase):
+    # Committed rows, so the detail page runs its lookups on worker threads
+
+    def test_query_counts_are_the_requests_own(self):
+        call_command('generate_data', '--users', '5', '--snippets', '20', '--ratings', '40', '--comments', '10',
+                     '--bookmarks', '10', '--workers', '0', stdout=StringIO(), stderr=StringIO())
+        # The benchmark picks the same snippet with the same seed
+        snippet_ids = list(Snippet.objects.values_list('id', flat=True))
+        snippet_id = snippet_ids[random.Random(0).randrange(len(snippet_ids))]
+        client = Client()
+        client.force_login(User.objects.filter(ratings__isnull=False).first())
+
+        for cache in caches.all():
+            cache.clear()
+        report = run_benchmark(
+            iterations=1, warmup=0, only=['snippet_detail_logged_in', 'user_recommendations'], host='testserver'
+        )
+        for cache in caches.all():
+            cache.clear()
+        response = client.get(reverse('snippet_detail', args=[snippet_id]))
+
+        queries = report['results']['snippet_detail_logged_in']['queries']
+        self.assertEqual(queries['max'], response.wsgi_request.query_stats.count)
+        # Scenarios without a request are counted on the calling thread
+        self.assertGreater(report['results']['user_recommendations']['queries']['max'], 0)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Enough rows that a per-row query would blow every budget
+        call_command('generate_data', '--users', '20', '--snippets', '150', '--ratings', '600', '--comments', '300',
+                     '--bookmarks', '200', '--workers', '0', stdout=StringIO(), stderr=StringIO())
+        cls.user = User.objects.filter(ratings__isnull=False, bookmarks__isnull=False).distinct().first()
+        cls.snippet = Snippet.objects.order_by('-comment_count').first()
+
+    def setUp(self):
+        # Budgets are for pages rendered from scratch
+        caches[fragments.CACHE_ALIAS].clear()
+        caches[trending.CACHE_ALIAS].clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.logged_in = Client()
+        self.logged_in.force_login(self.user)
+
+    def test_snippet_list(self):
+        self.assertQueryBudget('snippet_list')
+        self.assertQueryBudget('snippet_list', client=self.logged_in)
+        self.assertQueryBudget('snippet_list', params={'q': 'parse'})
+
+    def test_snippet_detail(self):
+        self.assertGreater(self.snippet.comment_count, 5)
+        self.assertQueryBudget('snippet_detail', args=[self.snippet.pk])
+        self.assertQueryBudget('snippet_detail', args=[self.snippet.pk], client=self.logged_in)
+
+    def test_listings(self):
+        self.assertQueryBudget('language_detail', args=['python'])
+        self.assertQueryBudget('top_rated_snippets')
+        self.assertQueryBudget('most_bookmarked')
+        self.assertQueryBudget('tatum24_top_authors')
+        self.assertQueryBudget('tatum24_top_languages')
+        self.assertQueryBudget('trending_snippets', params={'window': '30d'})
+        self.assertQueryBudget('user_bookmarks', client=self.logged_in)
+        self.assertQueryBudget('download_pdf', args=[self.snippet.pk], client=self.logged_in)
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    def test_middleware_reports_query_stats(self):
+        with self.assertLogs('tatum24.queries', 'INFO') as logs:
+            response = self.client.get(reverse('snippet_detail', args=[self.snippet.pk]))
+        self.assertEqual(response.wsgi_request.query_stats.count, QUERY_BUDGETS['snippet_detail', False])
+        self.assertIn('queries', response['Server-Timing'])
+        self.assertIn('GET snippet_detail: 6 queries', logs.output[0])
+
+    def test_budget_failure_lists_repeated_queries(self):
+        with self.assertRaisesMessage(AssertionError, 'over its budget of 0'):
+            self.assertQueryBudget('snippet_detail', args=[self.snippet.pk], budget=0)
+
+
+class QueryPlanTestCase(QueryPlanMixin, TestCase):
+    # Similar code candidates, ranked by how many of their buckets matched
+    COMPUTED_SCORES = ('ORDER BY COUNT("snippets_codebucket"."id") DESC',)
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_data', '--users', '20', '--snippets', '150', '--ratings', '600', '--comments', '300',
+                     '--bookmarks', '200', '--workers', '0', stdout=StringIO(), stderr=StringIO())
+        cls.user = User.objects.filter(ratings__isnull=False, bookmarks__isnull=False).distinct().first()
+        cls.snippet = Snippet.objects.order_by('-comment_count').first()
+
+    def setUp(self):
+        caches[fragments.CACHE_ALIAS].clear()
+        caches[trending.CACHE_ALIAS].clear()
+        self.logged_in = Client()
+        self.logged_in.force_login(self.user)
+
+    def get(self, url_name, args=None, params=None, client=None):
+        response = (client or self.client).get(reverse(url_name, args=args), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_snippet_pages(self):
+        self.assertIndexedPlans(lambda: self.get('snippet_list'))
+        response = self.get('snippet_list')
+        next_page = dict(param.split('=') for param in response.context['page_obj'].next_query[1:].split('&'))
+        self.assertIndexedPlans(lambda: self.get('snippet_list', params=next_page))
+        self.assertIndexedPlans(lambda: self.get('snippet_list', client=self.logged_in))
+        self.assertIndexedPlans(lambda: self.get('snippet_detail', args=[self.snippet.pk]), self.COMPUTED_SCORES)
+        self.assertIndexedPlans(lambda: self.get('snippet_detail', args=[self.snippet.pk], client=self.logged_in),
+                                self.COMPUTED_SCORES)
+        self.assertIndexedPlans(lambda: self.get('language_detail', args=['python']))
+        self.assertIndexedPlans(lambda: self.get('profile', client=self.logged_in))
+
+    def test_rankings_and_bookmarks(self):
+        for url_name in ('top_rated_snippets', 'most_bookmarked', 'tatum24_top_authors', 'tatum24_top_languages'):
+            self.assertIndexedPlans(lambda: self.get(url_name))
+        self.assertIndexedPlans(lambda: self.get('trending_snippets', params={'window': '24h'}))
+        self.assertIndexedPlans(lambda: self.get('user_bookmarks', client=self.logged_in))
+
+    def test_recommenders(self):
+        newcomer = User.objects.create_user('newcomer', password='password123')
+        self.assertIndexedPlans(lambda: list(get_user_recommendations(newcomer)))
+        self.assertIndexedPlans(lambda: list(get_user_recommendations(self.user)))
+        self.assertIndexedPlans(lambda: get_similar_snippets(self.snippet, user=self.user))
+        self.assertIndexedPlans(lambda: get_similar_code(self.snippet), self.COMPUTED_SCORES)
+
+    def test_regressions_are_reported(self):
+        with self.assertRaisesMessage(AssertionError, 'USE TEMP B-TREE FOR ORDER BY'):
+            self.assertIndexedPlans(lambda: list(Snippet.objects.order_by('title')[:10]))
+        # Walking an index is only fine when a LIMIT stops it
+        keyset = Snippet.objects.order_by(*Snippet.KEYSET_ORDERING).values_list('pk', flat=True)
+        self.assertIndexedPlans(lambda: list(keyset[:10]))
+        with self.assertRaisesMessage(AssertionError, 'USING COVERING INDEX snippet_keyset_idx'):
+            self.assertIndexedPlans(lambda: list(keyset))
+        # A LIMIT in a subquery does not stop the outer walk
+        python = Language.objects.filter(slug='python').values('pk')[:1]
+        with self.assertRaisesMessage(AssertionError, 'USING COVERING INDEX snippet_keyset_idx'):
+            self.assertIndexedPlans(lambda: list(keyset.annotate(python=Subquery(python))))
+
+
+class SamplingProfilerTestCase(SnippetFixturesMixin, TestCase):
+
+    def busy(self, seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def test_sampler_collects_collapsed_stacks(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        self.busy(0.1)
+        stacks = sampler.stop()
+        self.assertTrue(stacks)
+        top_stacks, leaves = hot_paths(stacks)
+        self.assertIn('snippets.tests:busy', top_stacks[0][0])
+        self.assertIn('snippets.tests:test_sampler_collects_collapsed_stacks;snippets.tests:busy', top_stacks[0][0])
+        self.assertEqual(leaves[0][0], 'snippets.tests:busy')
+
+    @override_settings(PROFILER_SAMPLE_RATE=0.0, PROFILER_VIEW_RATES={'snippet_list': 1.0})
+    def test_middleware_samples_selected_views(self):
+        self.create_snippet('Profiled', 'python')
+        self.client.get(reverse('snippet_list'))
+        self.client.get(reverse('top_rated_snippets'))
+
+        profile = ProfiledRequest.objects.get()
+        self.assertEqual(profile.view_name, 'snippet_list')
+        self.assertEqual(profile.status_code, 200)
+        self.assertEqual(profile.sample_count, sum(profile.get_stacks().values()))
+
+    def test_profiling_is_off_by_default(self):
+        self.client.get(reverse('snippet_list'))
+        self.assertFalse(ProfiledRequest.objects.exists())
+
+    def test_admin_hot_path_report(self):
+        ProfiledRequest.objects.create(
+            view_name='snippet_list', path='/snippets/', method='GET', status_code=200, duration_ms=30,
+            sample_count=4, stacks='django:handle;snippets.views:get 3\ndjango:handle;django:render 1\n',
+        )
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client.force_login(admin_user)
+
+        response = self.client.get(reverse('admin:tatum24_profiledrequest_hot_paths'), {'view': 'snippet_list'})
+        self.assertContains(response, 'snippets.views:get')
+        self.assertContains(response, '75%')
+
+        response = self.client.get(reverse('admin:tatum24_profiledrequest_collapsed'), {'view': 'snippet_list'})
+        self.assertEqual(response.content.decode(), 'django:handle;snippets.views:get 3\ndjango:handle;django:render 1\n')
+
+
+class AsyncViewTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches[fragments.CACHE_ALIAS].clear()
+        self.snippet = self.create_snippet('Async', 'python')
+        self.url = reverse('snippet_detail', args=[self.snippet.pk])
+
+    async def test_detail_page_under_asgi(self):
+        await Comment.objects.acreate(snippet=self.snippet, author=self.other_user, content='Concurrent')
+        await self.async_client.aforce_login(self.other_user)
+        await Bookmark.objects.acreate(user=self.other_user, snippet=self.snippet)
+        await Rating.objects.acreate(snippet=self.snippet, user=self.other_user, rating=Rating.LIKE)
+
+        response = await self.async_client.get(self.url)
+        self.assertContains(response, 'Concurrent')
+        self.assertContains(response, 'Saved')
+        self.assertContains(response, 'active-like')
+        self.assertGreater(response.asgi_request.query_stats.count, 0)
+
+        response = await self.async_client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_listings_under_asgi(self):
+        for url_name in ('snippet_list', 'top_rated_snippets', 'most_bookmarked', 'tatum24_top_authors',
+                         'tatum24_top_languages', 'trending_snippets'):
+            response = await self.async_client.get(reverse(url_name))
+            self.assertEqual(response.status_code, 200, url_name)
+        self.assertContains(await self.async_client.get(reverse('tatum24_top_authors')), self.user.username)
+
+    def test_missing_snippet(self):
+        self.assertEqual(self.client.get(reverse('snippet_detail', args=[self.snippet.pk + 1])).status_code, 404)
+
+    def test_lookups_run_on_worker_threads_outside_transactions(self):
+        caller = threading.get_ident()
+        # A TestCase runs in a transaction, which other connections cannot see into
+        self.assertEqual(async_to_sync(gather_lookups)(threading.get_ident, threading.get_ident), [caller, caller])
+
+        with mock.patch('snippets.utils.concurrency._run_in_transaction', return_value=None):
+            results = async_to_sync(gather_lookups)(threading.get_ident, lambda: 'done')
+        self.assertNotEqual(results[0], caller)
+        self.assertEqual(results[1], 'done')
+
+
+@override_settings(PARALLEL_VIEW_QUERIES=True)
+class ParallelLookupsTestCase(SnippetFixturesMixin, TransactionTestCase):
+    """
+    Outside a transaction the detail page's lookups really run on worker threads.
+    """
+
+    def setUp(self):
+        super().setUp()
+        caches[fragments.CACHE_ALIAS].clear()
+        self.snippet = self.create_snippet('Parallel', 'python')
+        Comment.objects.create(snippet=self.snippet, author=self.other_user, content='From a worker')
+
+    async def test_detail_lookups_run_on_worker_threads(self):
+        lookups = []
+        opened = []
+        closed = []
+        routed = []
+        wrap = concurrency._on_worker
+        close_old_connections = concurrency.close_old_connections
+
+        def on_worker(call):
+            run = wrap(call)
+
+            def tracked():
+                lookups.append(threading.get_ident())
+                return run()
+            return tracked
+
+        def connection_opened(sender, connection, **kwargs):
+            opened.append((threading.get_ident(), connection))
+
+        def close_connections():
+            closed.append(threading.get_ident())
+            close_old_connections()
+
+        def db_for_read(router, model, **hints):
+            routed.append((threading.get_ident(), current_routing.get()))
+            return 'default'
+
+        connection_created.connect(connection_opened)
+        self.addCleanup(connection_created.disconnect, connection_opened)
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(concurrency, '_on_worker', on_worker), \
+                mock.patch.object(concurrency, 'close_old_connections', close_connections), \
+                mock.patch.object(PrimaryReplicaRouter, 'db_for_read', db_for_read):
+            response = await self.async_client.get(reverse('snippet_detail', args=[self.snippet.pk]))
+
+        self.assertContains(response, 'Parallel')
+        self.assertContains(response, 'From a worker')
+        # Bookmark, rating, recommendations, similar code and comments
+        self.assertEqual(len(lookups), 5)
+        workers = set(lookups)
+        # The workers opened connections of their own, and let go of them after each lookup
+        # (the in-memory test database ignores the actual close)
+        self.assertTrue(workers & {thread for thread, _ in opened})
+        self.assertCountEqual(closed, lookups)
+        # Their queries count towards the request and route with the request's state
+        stats = response.asgi_request.query_stats
+        self.assertTrue(any('snippets_comment' in shape for shape in stats.shapes))
+        states = {state for thread, state in routed if thread in workers}
+        self.assertEqual(len(states), 1)
+        self.assertIsNotNone(states.pop())
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.router = PrimaryReplicaRouter()
+        self.snippet = self.create_snippet('Routed', 'python')
+
+    def test_reads_go_to_replicas_outside_transactions(self):
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Snippet), 'replica')
+            with routing(pinned=True):
+                self.assertEqual(self.router.db_for_read(Snippet), 'default')
+            # Related lookups on an object loaded from the primary
+            self.assertEqual(self.router.db_for_read(Comment, instance=self.snippet), 'default')
+            with override_settings(REPLICA_DATABASES=[]):
+                self.assertEqual(self.router.db_for_read(Snippet), 'default')
+        # e.g. select_for_update() inside transaction.atomic()
+        self.assertEqual(self.router.db_for_read(Snippet), 'default')
+
+    def test_writes_go_to_the_primary(self):
+        with routing() as state:
+            self.assertEqual(self.router.db_for_write(Snippet), 'default')
+        self.assertTrue(state.wrote)
+        self.assertFalse(self.router.allow_migrate('replica', 'snippets'))
+
+    def test_writing_pins_the_client(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('snippet_detail', args=[self.snippet.pk]))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('rate_snippet', args=[self.snippet.pk]), {'rating': Rating.LIKE})
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        middleware = ReplicaPinMiddleware(lambda request: None)
+        factory = RequestFactory()
+        self.assertTrue(middleware.pinned(factory.get('/', headers={'cookie': f'primary_pin={cookie.value}'})))
+        self.assertFalse(middleware.pinned(factory.get('/', headers={'cookie': 'primary_pin=1'})))
+        self.assertFalse(middleware.pinned(factory.get('/')))
+        self.assertTrue(middleware.pinned(factory.post('/')))
+
+
+class ListProjectionTestCase(SnippetFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.snippet = Snippet.objects.create(
+            title='Projected', language=self.python, author=self.user, tags='',
+            description='Reads *every* line &amp; more',
+            code='\n'.join(f'line_{number} = {number}' for number in range(20)),
+        )
+
+    def test_excerpt_and_summary_are_stored_on_save(self):
+        self.assertEqual(self.snippet.summary, 'Reads every line & more')
+        self.assertIn('line_4', self.snippet.excerpt_html)
+        self.assertNotIn('line_5', self.snippet.excerpt_html)
+
+        self.snippet.description = 'x' * 500
+        self.snippet.save()
+        self.assertEqual(len(self.snippet.summary), rendering.SUMMARY_LENGTH)
+
+    def test_list_querysets_leave_out_heavy_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            snippet = Snippet.objects.for_list().get(pk=self.snippet.pk)
+            self.assertEqual((snippet.author.username, snippet.language.name), ('test-user', 'Python'))
+        self.assertEqual(len(queries), 1)
+        for field in Snippet.HEAVY_FIELDS:
+            self.assertNotIn(f'"snippets_snippet"."{field}"', queries[0]['sql'])
+
+        # Saving a deferred instance neither re-renders nor writes back the heavy columns
+        snippet.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            snippet.save()
+        for field in Snippet.HEAVY_FIELDS:
+            self.assertNotIn(f'"{field}" =', queries[0]['sql'])
+        highlighted_code = self.snippet.highlighted_code
+        self.snippet.refresh_from_db()
+        self.assertEqual((self.snippet.title, self.snippet.highlighted_code), ('Renamed', highlighted_code))
+
+    def test_list_pages_show_the_summary(self):
+        for url in [reverse('snippet_list'), reverse('language_detail', args=[self.python.slug])]:
+            self.assertContains(self.client.get(url), 'Reads every line &amp; more')
+
+
+class CompressedTextFieldTestCase(SnippetFixturesMixin, TestCase):
+
+    def stored(self, snippet, field):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {field} FROM snippets_snippet WHERE id = %s', [snippet.pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_large_values_are_stored_compressed(self):
+        code = 'for item in items:\n    print(item)\n' * 100
+        snippet = Snippet.objects.create(
+            title='Big', language=self.python, author=self.user, description='', code=code, tags='',
+        )
+        stored = self.stored(snippet, 'code')
+        self.assertEqual(stored[:1], ZLIB)
+        self.assertLess(len(stored), len(code) / 10)
+        self.assertEqual(self.stored(snippet, 'highlighted_code')[:1], ZLIB)
+        self.assertEqual(Snippet.objects.get(pk=snippet.pk).code, code)
+        self.assertEqual(Snippet.objects.filter(pk=snippet.pk).values_list('code', flat=True).get(), code)
+
+    def test_small_values_stay_raw(self):
+        snippet = self.create_snippet('Small', '')
+        self.assertEqual(self.stored(snippet, 'code'), RAW + b'pass')
+        self.assertEqual(compress('é' * 10), RAW + 'é'.encode('utf-8') * 10)
+        self.assertEqual(compress('a' * 255)[:1], RAW)
+        self.assertEqual(compress('a' * 256)[:1], ZLIB)
+
+    def test_plain_text_rows_are_read_as_they_are(self):
+        snippet = self.create_snippet('Legacy', '')
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE snippets_snippet SET code = 'print(1)' WHERE id = %s", [snippet.pk])
+        self.assertEqual(Snippet.objects.get(pk=snippet.pk).code, 'print(1)')
+        with self.assertRaises(ValueError):
+            decompress(b'\x07data')
+
+
 class EditSnippetViewTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from snippets.views.comments import add_comment_view, delete_comment_view
-from snippets.views.download_pdf import download_pdf_view
+from snippets.views.download_pdf import download_pdf_view, pdf_render_stats_view
+from snippets.views.export import export_bookmarks_view, export_snippets_view
 from snippets.views.languages import LanguageListView, LanguageDetailView
 from snippets.views.popular import TopAuthorsView, TopLanguagesView
 from snippets.views.snippets import (
@@ -10,6 +11,7 @@ from snippets.views.snippets import (
     AddSnippetView,
     snippet_remove_view,
     edit_snippet_view,
+    recommendation_cache_stats_view,
 )
 
 urlpatterns = [
@@ -25,6 +27,7 @@ urlpatterns += [
     path('<int:pk>/edit/', edit_snippet_view, name='edit_snippet'),
 
     path('top-authors/', TopAuthorsView.as_view(), name='tatum24_top_authors'),
+    path('recommendations/cache-stats/', recommendation_cache_stats_view, name='recommendation_cache_stats'),
 ]
 
 # Languages
@@ -47,4 +50,12 @@ urlpatterns += [
 
 urlpatterns += [
     path('snippet/<int:snippet_id>/download_pdf/', download_pdf_view, name='download_pdf'),
+    path('pdf/render-stats/', pdf_render_stats_view, name='pdf_render_stats'),
+]
+
+# Bulk export
+
+urlpatterns += [
+    path('export/mine/', export_snippets_view, name='export_snippets'),
+    path('export/bookmarks/', export_bookmarks_view, name='export_bookmarks'),
 ]
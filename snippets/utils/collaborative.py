@@ -0,0 +1,120 @@
+"""
+Item-item collaborative filtering over the user x snippet rating matrix.
+
+Likes count as +1 and dislikes as -1. Two snippets are similar when the same users rated
+them the same way (cosine of their rating columns), and only each snippet's top-K
+neighbours are kept. A user's score for a snippet they have not rated is the sum of their
+ratings of the snippets it neighbours, weighted by similarity. Everything is computed in
+one batch of sparse matrix products (``manage.py build_collaborative``) and stored in
+CollaborativeScore, so recommendations never aggregate the ratings table at request time.
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+
+from ratings.models import Rating
+from snippets.models import CollaborativeScore
+from snippets.utils.recommendation_cache import mark_snippets_changed
+
+ITEM_NEIGHBOURS = 50
+TOP_N = 50
+BATCH_SIZE = 1000
+
+
+def build_rating_matrix(likes, dislikes):
+    """
+    Builds the users x snippets matrix of +1/-1 ratings from (user_id, snippet_id) pair arrays.
+    Returns the user ids (one per row), the snippet ids (one per column) and the CSR matrix.
+    """
+    pairs = np.concatenate([likes, dislikes]).reshape(-1, 2)
+    values = np.concatenate([np.ones(len(likes)), -np.ones(len(dislikes))])
+    user_ids, user_rows = np.unique(pairs[:, 0], return_inverse=True)
+    snippet_ids, snippet_cols = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (values, (user_rows, snippet_cols)), shape=(len(user_ids), len(snippet_ids))
+    )
+    return user_ids, snippet_ids, matrix
+
+
+def top_n_per_row(block, n, row_offset=0, exclude_diagonal=False):
+    """
+    Returns (rows, cols, values) of the ``n`` largest positive entries of each row of a sparse
+    block, sorted by row and then by descending value.
+    """
+    block = sparse.csr_matrix(block)
+    rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    keep = block.data > 0
+    if exclude_diagonal:
+        keep &= block.indices != rows + row_offset
+    rows, cols, values = rows[keep], block.indices[keep], block.data[keep]
+
+    order = np.lexsort((-values, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < n
+    return rows[keep], cols[keep], values[keep]
+
+
+def item_similarities(matrix, k=ITEM_NEIGHBOURS, chunk_size=BATCH_SIZE):
+    """
+    Returns the snippets x snippets CSR matrix holding each snippet's top-``k`` cosine neighbours.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = (matrix @ sparse.diags(1.0 / norms)).tocsc()
+    items = normalized.T.tocsr()
+    n_items = items.shape[0]
+
+    all_rows, all_cols, all_values = [], [], []
+    for start in range(0, n_items, chunk_size):
+        block = items[start:start + chunk_size] @ normalized
+        rows, cols, values = top_n_per_row(block, k, row_offset=start, exclude_diagonal=True)
+        all_rows.append(rows + start)
+        all_cols.append(cols)
+        all_values.append(values)
+    return sparse.csr_matrix(
+        (np.concatenate(all_values), (np.concatenate(all_rows), np.concatenate(all_cols))),
+        shape=(n_items, n_items),
+    )
+
+
+def _rating_pairs(rating):
+    pairs = Rating.objects.filter(rating=rating).order_by().values_list('user_id', 'snippet_id')
+    return np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def build_collaborative_scores(item_neighbours=ITEM_NEIGHBOURS, top_n=TOP_N, chunk_size=BATCH_SIZE):
+    """
+    Recomputes every user's top-N collaborative-filtering scores, normalised so each user's
+    best snippet scores 1. Returns the number of rows written.
+    """
+    likes, dislikes = _rating_pairs(Rating.LIKE), _rating_pairs(Rating.DISLIKE)
+    written = 0
+    with transaction.atomic():
+        CollaborativeScore.objects.all().delete()
+        if len(likes) + len(dislikes):
+            written = _store_scores(likes, dislikes, item_neighbours, top_n, chunk_size)
+    # Cached recommendations were blended with the old scores
+    mark_snippets_changed()
+    return written
+
+
+def _store_scores(likes, dislikes, item_neighbours, top_n, chunk_size):
+    user_ids, snippet_ids, matrix = build_rating_matrix(likes, dislikes)
+    # Each rated snippet spreads its rating over its own top-K neighbours, which bounds
+    # the work per user by (ratings x K) even for very popular snippets
+    similarities = item_similarities(matrix, item_neighbours, chunk_size)
+    written = 0
+    for start in range(0, len(user_ids), chunk_size):
+        ratings = matrix[start:start + chunk_size]
+        block = ratings @ similarities
+        # Never recommend what the user has already rated
+        block = block - block.multiply(ratings != 0)
+        rows, cols, values = top_n_per_row(block, top_n)
+        values = values / values[np.searchsorted(rows, rows)]
+
+        CollaborativeScore.objects.bulk_create([
+            CollaborativeScore(user_id=int(user_id), snippet_id=int(snippet_id), score=float(score))
+            for user_id, snippet_id, score in zip(user_ids[rows + start], snippet_ids[cols], values)
+        ], batch_size=BATCH_SIZE)
+        written += len(rows)
+    return written
@@ -0,0 +1,66 @@
+"""
+Running the independent lookups of an async view at the same time.
+
+Django's async ORM methods (aget, aexists, ...) all run on the request's one sync thread, so
+gathering several of them frees the event loop but still runs their queries one after
+another. gather_lookups() runs blocking callables on worker threads instead, each with a
+database connection of its own, so the lookups really overlap. A worker closes its
+connections when the call returns (or keeps them for reuse, depending on CONN_MAX_AGE), and
+its queries count towards the request's QueryStats.
+
+Another connection cannot see the writes of an open transaction, e.g. under ATOMIC_REQUESTS
+or in a TestCase. In that case the lookups run one after another on the request thread.
+``PARALLEL_VIEW_QUERIES = False`` does the same everywhere, e.g. when the database only allows
+a few connections.
+"""
+import asyncio
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from tatum24.middleware import current_query_stats
+
+
+def _run_in_transaction(calls):
+    if any(connection.in_atomic_block for connection in connections.all(initialized_only=True)):
+        return [call() for call in calls]
+    return None
+
+
+def _on_worker(call):
+    def run():
+        stats = current_query_stats.get()
+        try:
+            with stats.track() if stats is not None else nullcontext():
+                return call()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_lookups(*calls):
+    """
+    Runs the blocking ``calls`` concurrently and returns their results in order.
+    """
+    if not calls:
+        return []
+    if not getattr(settings, 'PARALLEL_VIEW_QUERIES', True):
+        return await sync_to_async(lambda: [call() for call in calls])()
+    # Checked on the request thread, which runs the calls right away if it is in a transaction
+    results = await sync_to_async(_run_in_transaction)(calls)
+    if results is not None:
+        return results
+    return await asyncio.gather(*(sync_to_async(_on_worker(call), thread_sensitive=False)() for call in calls))
+
+
+class ThreadedGetMixin:
+    """
+    View mixin serving GET from an async handler that runs the view's regular get() on the
+    request thread. For pages whose queries each depend on the one before, so there is nothing
+    to overlap, but which should not hold up the event loop.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await sync_to_async(super().get)(request, *args, **kwargs)
@@ -0,0 +1,119 @@
+"""
+Conditional GET for read-heavy pages.
+
+conditional_page() wraps a view with validators built from version stamps (see
+snippets.utils.fragments), so a repeat visit is answered with a 304 before the page is
+rendered or its queries run. The ETag also covers what differs between viewers: the user
+shown in the navigation bar and the CSRF secret the page's forms are rendered for.
+Last-Modified is only sent to anonymous visitors, since a date cannot express a change of
+user. Responses carrying pending flash messages get no validators at all, otherwise the
+message would be replayed from the browser cache.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from snippets.utils import fragments
+
+
+def page_etag(request, stamps):
+    digest = hashlib.sha256()
+    user = request.user
+    viewer = (user.pk, user.get_username()) if user.is_authenticated else (None, '')
+    # Set from the CSRF cookie, or by the first render that needed a token
+    for part in (*stamps, *viewer, request.META.get('CSRF_COOKIE', '')):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def _check(stamps, request, args, kwargs):
+    """
+    Returns the page's stamps and the 304 response, if the client's copy is current. Returns
+    None when the page gets no validators.
+    """
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None
+    page_stamps = stamps(request, *args, **kwargs)
+    return page_stamps, get_conditional_response(
+        request, etag=page_etag(request, page_stamps), last_modified=_last_modified(request, page_stamps)
+    )
+
+
+def _last_modified(request, page_stamps):
+    return None if request.user.is_authenticated else max(page_stamps) // 10 ** 9
+
+
+def _add_validators(request, response, page_stamps):
+    # Rendering may have created the CSRF secret the next request will send
+    response['ETag'] = page_etag(request, page_stamps)
+    last_modified = _last_modified(request, page_stamps)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Browsers must revalidate instead of guessing a freshness lifetime
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(stamps):
+    """
+    View decorator; ``stamps(request, *args, **kwargs)`` returns the version stamps of
+    everything the page shows. Async views are supported; the stamps, the session and the
+    rendering then run on the request's sync thread.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                checked = await sync_to_async(_check)(stamps, request, args, kwargs)
+                if checked is None:
+                    return await view(request, *args, **kwargs)
+
+                page_stamps, response = checked
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    if hasattr(response, 'render'):
+                        await sync_to_async(response.render)()
+                return _add_validators(request, response, page_stamps)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            checked = _check(stamps, request, args, kwargs)
+            if checked is None:
+                return view(request, *args, **kwargs)
+
+            page_stamps, response = checked
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if hasattr(response, 'render'):
+                    response.render()
+            return _add_validators(request, response, page_stamps)
+        return wrapper
+    return decorator
+
+
+def leaderboard_stamps(request, *args, **kwargs):
+    return fragments.get_stamps(fragments.LEADERBOARD_KEY)
+
+
+def snippets_stamps(request, *args, **kwargs):
+    return fragments.get_stamps(fragments.SNIPPETS_KEY)
+
+
+def snippet_detail_stamps(request, pk):
+    keys = [fragments.snippet_key(pk), fragments.comments_key(pk), fragments.SNIPPETS_KEY]
+    if request.user.is_authenticated:
+        keys += [fragments.ratings_key(request.user.pk), fragments.bookmarks_key(request.user.pk)]
+    return fragments.get_stamps(*keys)
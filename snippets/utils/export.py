@@ -0,0 +1,105 @@
+"""
+Streaming ZIP archives of snippets.
+
+zipfile can write to a stream it cannot seek in (sizes go into data descriptors after each
+entry), so the archive is produced one entry at a time and every chunk is handed to the
+response as soon as it is written. Memory use depends on the largest single entry, not on
+how many snippets the archive holds.
+"""
+import zipfile
+
+from django.utils.text import slugify
+from pygments.util import ClassNotFound
+
+from snippets.utils.rendering import get_lexer
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """
+    Write-only file object that keeps what was written until it is drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(entries):
+    """
+    Yields the bytes of a ZIP archive of ``entries``, an iterable of (name, chunks) pairs
+    where ``chunks`` is an iterable of bytes.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            with archive.open(name, mode='w') as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if buffer.chunks:
+                        yield buffer.drain()
+            yield buffer.drain()
+    # Closing the archive writes the central directory
+    yield buffer.drain()
+
+
+def source_extension(language_code):
+    """
+    Returns the usual file extension of a language, e.g. '.py', or '.txt' if it has none.
+    """
+    try:
+        patterns = get_lexer(language_code).filenames
+    except ClassNotFound:
+        return '.txt'
+    for pattern in patterns:
+        if pattern.startswith('*.') and not any(char in pattern[2:] for char in '*?['):
+            return pattern[1:]
+    return '.txt'
+
+
+def snippet_basename(snippet):
+    return f'{snippet.pk}-{slugify(snippet.title) or "snippet"}'
+
+
+def iter_file(file, chunk_size=CHUNK_SIZE):
+    with file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+def snippet_entries(snippets, open_pdf=None):
+    """
+    Yields archive entries for ``snippets``: the source file of each and, when ``open_pdf``
+    is given, its PDF. ``open_pdf(snippet)`` returns a binary file, or a message saying why
+    the PDF is left out; those are listed in a final ``pdf/MISSING.txt`` entry.
+    """
+    missing = []
+    for snippet in snippets:
+        basename = snippet_basename(snippet)
+        extension = source_extension(snippet.language.language_code)
+        yield f'source/{basename}{extension}', [snippet.code.encode('utf-8')]
+        if open_pdf is not None:
+            pdf_file = open_pdf(snippet)
+            if isinstance(pdf_file, str):
+                missing.append(f'{basename}.pdf: {pdf_file}\n')
+            else:
+                yield f'pdf/{basename}.pdf', iter_file(pdf_file)
+    if missing:
+        yield 'pdf/MISSING.txt', [line.encode('utf-8') for line in missing]
@@ -0,0 +1,91 @@
+"""
+Version stamps for cached template fragments and HTTP validators.
+
+snippet_detail.html caches the code, the comment list and the recommendation sidebar with
+``{% cache ... using='fragments' %}``. Each fragment key includes the stamps it depends on,
+and snippets.signals bumps a stamp whenever what it covers changes. So fragments are never
+deleted: a changed stamp just makes the old key unused until it is culled. Stamps are
+unique nanosecond timestamps rather than counters. An evicted stamp therefore comes back as
+a new value and can never revive an outdated fragment. The same stamps make up the ETags of
+snippets.utils.conditional; being timestamps, they double as Last-Modified dates.
+missing_fragments() tells a view which fragments it has to run the queries for.
+"""
+import time
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+
+CACHE_ALIAS = 'fragments'
+SNIPPETS_KEY = 'fragments:snippets'
+# Anything shown on the aggregate pages: snippets, languages and the snippet counters
+LEADERBOARD_KEY = 'fragments:leaderboard'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def snippet_key(snippet_id):
+    return f'fragments:snippet:{snippet_id}'
+
+
+def comments_key(snippet_id):
+    return f'fragments:comments:{snippet_id}'
+
+
+def ratings_key(user_id):
+    return f'fragments:ratings:{user_id}'
+
+
+def bookmarks_key(user_id):
+    return f'fragments:bookmarks:{user_id}'
+
+
+def bump(*keys):
+    """
+    Gives the stamps under ``keys`` new values.
+    """
+    stamp = time.time_ns()
+    _cache().set_many({key: stamp for key in keys}, timeout=None)
+
+
+def get_stamps(*keys):
+    """
+    Returns the stamps under ``keys`` as a list, creating the missing ones.
+    """
+    cache = _cache()
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            # add() keeps a stamp another request has set in the meantime
+            cache.add(key, time.time_ns(), timeout=None)
+            stamps[key] = cache.get(key)
+    return [stamps[key] for key in keys]
+
+
+def get_versions(snippet_id, user_id=None):
+    """
+    Returns the stamps for a detail page, by name: the snippet's comments, any snippet (the
+    sidebar's neighbours) and, for a logged-in user, their ratings.
+    """
+    keys = {'comments': comments_key(snippet_id), 'snippets': SNIPPETS_KEY}
+    if user_id is not None:
+        keys['ratings'] = ratings_key(user_id)
+    return dict(zip(keys, get_stamps(*keys.values())))
+
+
+def missing_fragments(vary):
+    """
+    Takes the fragments of a page as ``{fragment name: vary_on value}`` and returns the names
+    of those that are not cached. The ``{% cache %}`` tags must vary on that single value.
+    """
+    keys = {make_template_fragment_key(name, [value]): name for name, value in vary.items()}
+    cached = _cache().get_many(keys)
+    return {name for key, name in keys.items() if key not in cached}
+
+
+def clear():
+    """
+    Drops every fragment and stamp, e.g. after a bulk import that bypassed the signals.
+    """
+    _cache().clear()
@@ -0,0 +1,138 @@
+"""
+Materialized leaderboards.
+
+The top rated, most bookmarked, top authors and top languages pages read a pre-sorted slice
+of LeaderboardEntry instead of sorting or grouping the snippet table, so their cost does not
+grow with the data. Scores are kept up to date incrementally. Snippet.adjust_counters() moves
+the snippet boards along with the rating and bookmark counters. Snippet.save() and the
+post_delete signal move the author and language boards. The ``refresh_leaderboards`` command
+recomputes every board from scratch, e.g. after a bulk import or to repair drift.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from snippets.models import LeaderboardEntry, Snippet
+from snippets.utils import fragments
+
+BATCH_SIZE = 1000
+# Snippet counter changes moving each snippet board, by counter field and sign
+COUNTER_BOARDS = {
+    'like_count': (LeaderboardEntry.TOP_RATED, 1),
+    'dislike_count': (LeaderboardEntry.TOP_RATED, -1),
+    'bookmark_count': (LeaderboardEntry.MOST_BOOKMARKED, 1),
+}
+SNIPPET_BOARDS = (LeaderboardEntry.TOP_RATED, LeaderboardEntry.MOST_BOOKMARKED)
+
+
+def adjust(board, object_id, delta):
+    """
+    Atomically adds ``delta`` to an object's score, creating its entry if needed.
+    """
+    if not delta:
+        return
+    entries = LeaderboardEntry.objects.filter(board=board, object_id=object_id)
+    if entries.update(score=F('score') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardEntry.objects.create(board=board, object_id=object_id, score=delta)
+    except IntegrityError:
+        # Another request created the entry in the meantime
+        entries.update(score=F('score') + delta)
+
+
+def counters_adjusted(snippet_id, deltas):
+    """
+    Applies Snippet.adjust_counters() deltas to the snippet boards.
+    """
+    board_deltas = {}
+    for field, delta in deltas.items():
+        if field in COUNTER_BOARDS:
+            board, sign = COUNTER_BOARDS[field]
+            board_deltas[board] = board_deltas.get(board, 0) + sign * delta
+    for board, delta in board_deltas.items():
+        adjust(board, snippet_id, delta)
+
+
+def snippet_saved(snippet, created, previous_language_id):
+    if created:
+        adjust(LeaderboardEntry.TOP_AUTHORS, snippet.author_id, 1)
+    elif previous_language_id is not None:
+        adjust(LeaderboardEntry.TOP_LANGUAGES, previous_language_id, -1)
+    adjust(LeaderboardEntry.TOP_LANGUAGES, snippet.language_id, 1)
+
+
+def snippet_deleted(snippet):
+    adjust(LeaderboardEntry.TOP_AUTHORS, snippet.author_id, -1)
+    adjust(LeaderboardEntry.TOP_LANGUAGES, snippet.language_id, -1)
+    LeaderboardEntry.objects.filter(board__in=SNIPPET_BOARDS, object_id=snippet.pk).delete()
+
+
+def board_scores(board):
+    """
+    Returns the (object id, score) pairs of a board computed from the source tables.
+    """
+    snippets = Snippet.objects.order_by()
+    if board == LeaderboardEntry.TOP_RATED:
+        return snippets.annotate(score=F('like_count') - F('dislike_count')).exclude(score=0) \
+            .values_list('id', 'score')
+    if board == LeaderboardEntry.MOST_BOOKMARKED:
+        return snippets.filter(bookmark_count__gt=0).values_list('id', 'bookmark_count')
+    if board == LeaderboardEntry.TOP_AUTHORS:
+        return snippets.values('author_id').annotate(score=Count('id')).values_list('author_id', 'score')
+    return snippets.values('language_id').annotate(score=Count('id')).values_list('language_id', 'score')
+
+
+def refresh(boards=None):
+    """
+    Recomputes ``boards`` (all by default). Returns the number of entries written.
+    """
+    written = 0
+    for board in boards or [board for board, _ in LeaderboardEntry.BOARDS]:
+        with transaction.atomic():
+            LeaderboardEntry.objects.filter(board=board).delete()
+            batch = []
+            for object_id, score in board_scores(board).iterator(chunk_size=BATCH_SIZE):
+                batch.append(LeaderboardEntry(board=board, object_id=object_id, score=score))
+                if len(batch) == BATCH_SIZE:
+                    LeaderboardEntry.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            LeaderboardEntry.objects.bulk_create(batch)
+            written += len(batch)
+    fragments.bump(fragments.LEADERBOARD_KEY)
+    return written
+
+
+def top_entries(board):
+    """
+    Returns the entries of a board with a positive score, best first, ready to slice or paginate.
+    """
+    return LeaderboardEntry.objects.filter(board=board, score__gt=0).order_by('-score', 'object_id')
+
+
+def with_objects(entries, queryset, score_attribute='score'):
+    """
+    Loads the objects of ``entries`` from ``queryset`` in ranking order, with each entry's
+    score set as ``score_attribute``. Objects deleted since are skipped.
+    """
+    entries = list(entries)
+    return _ranked(entries, queryset.order_by().in_bulk([entry.object_id for entry in entries]), score_attribute)
+
+
+async def awith_objects(entries, queryset, score_attribute='score'):
+    """
+    Async version of with_objects().
+    """
+    entries = [entry async for entry in entries]
+    return _ranked(entries, await queryset.order_by().ain_bulk([entry.object_id for entry in entries]), score_attribute)
+
+
+def _ranked(entries, objects, score_attribute):
+    ranked = []
+    for entry in entries:
+        obj = objects.get(entry.object_id)
+        if obj is not None:
+            setattr(obj, score_attribute, entry.score)
+            ranked.append(obj)
+    return ranked
@@ -0,0 +1,128 @@
+"""
+"More like this" code similarity with MinHash signatures and LSH buckets.
+
+A snippet's code is tokenized with its language's Pygments lexer (whitespace and comments
+dropped) and cut into overlapping token shingles. The MinHash signature estimates the
+Jaccard similarity of two shingle sets, and splitting it into bands of rows gives LSH
+buckets: snippets sharing a bucket in any band are candidates, so lookups only compare a
+handful of signatures instead of every snippet.
+"""
+import hashlib
+import zlib
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+from pygments.token import Comment, Text, Whitespace
+
+from snippets.models import CodeBucket, CodeSignature, Snippet
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+# Upper bound on the candidate signatures compared per lookup
+MAX_CANDIDATES = 200
+# Similarity above which a new snippet is reported as a near-duplicate
+DUPLICATE_THRESHOLD = 0.8
+
+_random = np.random.RandomState(24)
+_PERMUTATION_A = _random.randint(1, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _random.randint(0, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def code_tokens(code, lexer):
+    """
+    Returns the significant token values of ``code``.
+    """
+    return [
+        value for token_type, value in lexer.get_tokens(code)
+        if value.strip() and token_type not in Comment and token_type not in Text
+        and token_type not in Whitespace
+    ]
+
+
+def compute_signature(tokens):
+    """
+    Returns the MinHash signature (NUM_PERMUTATIONS uint32 values) of the token shingles.
+    """
+    size = min(SHINGLE_SIZE, len(tokens)) or 1
+    shingles = {'\x00'.join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))}
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    # a * x + b stays below 2**64 because a, b < 2**31 and x < 2**32
+    permuted = (np.outer(hashes, _PERMUTATION_A) + _PERMUTATION_B) % MERSENNE_PRIME
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """
+    Returns one bucket hash per band of the signature.
+    """
+    return [
+        int.from_bytes(
+            hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(),
+                            digest_size=8).digest(),
+            'big',
+        ) & ((1 << 63) - 1)
+        for band in range(BANDS)
+    ]
+
+
+def snippet_signature(snippet):
+    return compute_signature(code_tokens(snippet.code, snippet.language.get_lexer()))
+
+
+def index_code_signature(snippet):
+    """
+    Stores the signature and LSH buckets of a snippet after its code or language changed.
+    """
+    signature = snippet_signature(snippet)
+    with transaction.atomic():
+        CodeSignature.objects.update_or_create(snippet=snippet, defaults={'signature': signature.tobytes()})
+        CodeBucket.objects.filter(snippet=snippet).delete()
+        CodeBucket.objects.bulk_create([
+            CodeBucket(snippet=snippet, band=band, bucket=bucket)
+            for band, bucket in enumerate(band_buckets(signature))
+        ])
+
+
+def find_similar_code(signature, exclude_pk=None, threshold=0.5, limit=5):
+    """
+    Returns up to ``limit`` (snippet, estimated similarity) pairs whose code resembles
+    ``signature``, best first.
+    """
+    bands = Q()
+    for band, bucket in enumerate(band_buckets(signature)):
+        bands |= Q(band=band, bucket=bucket)
+    candidates = CodeBucket.objects.filter(bands)
+    if exclude_pk is not None:
+        candidates = candidates.exclude(snippet_id=exclude_pk)
+    candidate_ids = candidates.values('snippet_id').annotate(
+        shared_bands=Count('pk')
+    ).order_by('-shared_bands').values_list('snippet_id', flat=True)[:MAX_CANDIDATES]
+
+    scored = []
+    for snippet_id, stored in CodeSignature.objects.filter(snippet_id__in=list(candidate_ids)).values_list(
+            'snippet_id', 'signature'):
+        similarity = float(np.mean(np.frombuffer(stored, dtype=np.uint32) == signature))
+        if similarity >= threshold:
+            scored.append((snippet_id, similarity))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    scored = scored[:limit]
+
+    snippets = Snippet.objects.select_related('author', 'language').order_by().in_bulk([pk for pk, _ in scored])
+    return [(snippets[pk], similarity) for pk, similarity in scored if pk in snippets]
+
+
+def get_similar_code(snippet, threshold=0.5, limit=5):
+    """
+    Returns the snippets whose code resembles ``snippet``'s, best first.
+    """
+    stored = CodeSignature.objects.filter(snippet_id=snippet.pk).values_list('signature', flat=True).first()
+    if stored is None:
+        return []
+    signature = np.frombuffer(stored, dtype=np.uint32)
+    return [similar for similar, _ in find_similar_code(signature, snippet.pk, threshold, limit)]
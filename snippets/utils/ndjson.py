@@ -0,0 +1,451 @@
+"""
+Bulk NDJSON export and import of languages, users, snippets, ratings and comments.
+
+Every line is one JSON object with a ``type`` key, written in dependency order so an
+import never sees a rating before its snippet. Imports run in batches. Each batch is
+validated, its code highlighting, Markdown and MinHash signatures are computed in worker
+processes, and then it is inserted with ``bulk_create`` in one transaction. Snippet and
+comment ids are preserved. An import remembers the highest ids present when it started:
+records reusing one of those that is taken are reported and skipped, and rows above them can
+only come from a batch replayed after an interruption and are skipped too, which is what
+makes the line-number checkpoint written after each batch safe to resume from. Ratings and
+comments only attach to snippets created by the same import.
+"""
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from pygments.util import ClassNotFound
+
+from ratings.models import Rating
+from snippets.models import CodeBucket, CodeSignature, Comment, Language, Snippet, SnippetTag, Tag
+from snippets.utils import fragments
+from snippets.utils.minhash import band_buckets, code_tokens, compute_signature
+from snippets.utils.recommendation_cache import mark_snippets_changed
+from snippets.utils.rendering import code_excerpt, get_lexer, highlight_code, plain_summary, render_markdown
+from snippets.utils.search import index_snippets
+
+RECORD_TYPES = ('language', 'user', 'snippet', 'rating', 'comment')
+BATCH_SIZE = 2000
+EXPORT_CHUNK_SIZE = 2000
+
+
+class RecordError(ValueError):
+    pass
+
+
+# Exported fields per record type, with the related lookups renamed to plain keys
+EXPORT_FIELDS = {
+    'language': (Language, ['name', 'slug', 'language_code']),
+    'user': (User, ['username', 'email']),
+    'snippet': (Snippet, ['id', 'title', 'language__slug', 'author__username', 'description', 'code', 'tags',
+                          'pub_date', 'update_date']),
+    'rating': (Rating, ['snippet_id', 'user__username', 'rating', 'date']),
+    'comment': (Comment, ['id', 'snippet_id', 'author__username', 'content', 'pub_date']),
+}
+EXPORT_KEYS = {
+    'language__slug': 'language', 'author__username': 'author', 'user__username': 'user', 'snippet_id': 'snippet',
+}
+
+
+def export_ndjson(stream, record_types=RECORD_TYPES):
+    """
+    Writes the given record types to ``stream`` as NDJSON. Returns the number of lines.
+    """
+    written = 0
+    for record_type in RECORD_TYPES:
+        if record_type not in record_types:
+            continue
+        model, fields = EXPORT_FIELDS[record_type]
+        keys = ['type'] + [EXPORT_KEYS.get(field, field) for field in fields]
+        rows = model.objects.order_by('pk').values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for row in rows:
+            record = dict(zip(keys, (record_type, *row)))
+            stream.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+            stream.write('\n')
+            written += 1
+    return written
+
+
+def render_snippets(items):
+    """
+    Returns (highlighted_code, excerpt_html, description_html, summary, signature) for each
+    (code, language_code, description) item. Runs in the import worker processes.
+    """
+    rendered = []
+    for code, language_code, description in items:
+        signature = compute_signature(code_tokens(code, get_lexer(language_code)))
+        description_html = render_markdown(description)
+        rendered.append((
+            highlight_code(code, language_code), code_excerpt(code, language_code),
+            description_html, plain_summary(description_html), signature.tobytes(),
+        ))
+    return rendered
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _text(record, field, max_length=None, required=True):
+    value = record.get(field)
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise RecordError(f'{field!r} must be a non-empty string' if required else f'{field!r} must be a string')
+    if max_length is not None and len(value) > max_length:
+        raise RecordError(f'{field!r} is longer than {max_length} characters')
+    return value
+
+
+def _datetime(record, field):
+    value = record.get(field)
+    if value is None:
+        return timezone.now()
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise RecordError(f'{field!r} is not an ISO 8601 datetime')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def _id(record, field):
+    value = record.get(field)
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise RecordError(f'{field!r} must be a positive integer')
+    return value
+
+
+class Importer:
+    """
+    Imports an NDJSON file batch by batch; see the module docstring.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, workers=None, checkpoint_path=None, stdout=None, stderr=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+        self.stdout = stdout
+        self.stderr = stderr
+        self.counts = dict.fromkeys(RECORD_TYPES, 0)
+        self.invalid = 0
+        self.languages = {}
+        self.users = {}
+        # Highest snippet and comment ids that existed before the import started
+        self.baseline = {}
+        self.pool = None
+
+    # Checkpoints
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_checkpoint(self, line):
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'line': line, 'baseline': self.baseline}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Main loop
+
+    def run(self, resume=True):
+        """
+        Imports the file and returns the number of imported records per type.
+        """
+        checkpoint = self.read_checkpoint() if resume else None
+        if checkpoint:
+            start_line = checkpoint['line']
+            self.baseline = checkpoint.get('baseline', {'snippet': 0, 'comment': 0})
+            self.log(f'Resuming after line {start_line}.')
+        else:
+            start_line = 0
+            self.baseline = {
+                'snippet': Snippet.objects.aggregate(max_id=Max('id'))['max_id'] or 0,
+                'comment': Comment.objects.aggregate(max_id=Max('id'))['max_id'] or 0,
+            }
+        self.languages = dict(Language.objects.values_list('slug', 'id'))
+        started = time.monotonic()
+
+        if self.workers > 1:
+            # Workers must not share the parent's database connections
+            connections.close_all()
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker)
+        try:
+            batch = []
+            line_number = 0
+            with open(self.path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    if line_number <= start_line or not line.strip():
+                        continue
+                    batch.append((line_number, line))
+                    if len(batch) == self.batch_size:
+                        self.import_batch(batch)
+                        self.progress(line_number, started)
+                        batch = []
+            if batch:
+                self.import_batch(batch)
+                self.progress(line_number, started)
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+        return self.counts
+
+    def finish(self):
+        """
+        Rebuilds what depends on the whole data set once the import is complete.
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Snippet, Comment, Rating]):
+                cursor.execute(sql)
+        call_command('recount', stdout=self.stdout)
+        call_command('rebuild_similarity', stdout=self.stdout)
+        call_command('refresh_leaderboards', stdout=self.stdout)
+        call_command('compact_rating_buckets', '--rebuild', stdout=self.stdout)
+        mark_snippets_changed()
+        # Bulk inserts send no signals, so no fragment stamp saw the new rows
+        fragments.clear()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def error(self, line_number, message):
+        self.invalid += 1
+        if self.stderr is not None:
+            self.stderr.write(f'Line {line_number}: {message}')
+
+    def progress(self, line_number, started):
+        elapsed = time.monotonic() - started
+        imported = sum(self.counts.values())
+        self.log(
+            f'Line {line_number}: {imported} records imported, {self.invalid} invalid '
+            f'({imported / elapsed if elapsed else 0:.0f} records/s).'
+        )
+
+    # Batches
+
+    def import_batch(self, batch):
+        records = dict((record_type, []) for record_type in RECORD_TYPES)
+        for line_number, line in batch:
+            try:
+                record = json.loads(line)
+                record_type = record.get('type') if isinstance(record, dict) else None
+                if record_type not in records:
+                    raise RecordError(f'unknown record type {record_type!r}')
+            except (ValueError, RecordError) as e:
+                self.error(line_number, str(e))
+                continue
+            records[record_type].append((line_number, record))
+
+        with transaction.atomic():
+            for record_type in RECORD_TYPES:
+                if records[record_type]:
+                    getattr(self, f'import_{record_type}s')(records[record_type])
+        self.write_checkpoint(batch[-1][0])
+
+    def validated(self, records, build, key=None):
+        """
+        Returns the objects built from ``records``, reporting invalid ones and, given a
+        ``key`` function, repeats of a key already seen in the batch.
+        """
+        objects = []
+        seen = set()
+        for line_number, record in records:
+            try:
+                obj = build(record)
+                if key is not None:
+                    if key(obj) in seen:
+                        raise RecordError(f'duplicate of an earlier record {key(obj)!r}')
+                    seen.add(key(obj))
+                objects.append(obj)
+            except RecordError as e:
+                self.error(line_number, str(e))
+        return objects
+
+    def resolve_users(self, records, field):
+        missing = {record.get(field) for _, record in records} - set(self.users)
+        missing.discard(None)
+        self.users.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+
+    def user_id(self, record, field):
+        username = record.get(field)
+        if username not in self.users:
+            raise RecordError(f'unknown user {username!r}')
+        return self.users[username]
+
+    def taken_ids(self, model, records, record_type):
+        """
+        Returns the ids in ``records`` that belong to rows which existed before the import.
+        """
+        ids = [
+            record.get('id') for _, record in records
+            if isinstance(record.get('id'), int) and record['id'] <= self.baseline[record_type]
+        ]
+        return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+    def existing_snippet_ids(self, records):
+        """
+        Returns the snippet ids ``records`` refer to that this import created. Ids up to the
+        baseline belong to unrelated snippets, even when the number matches.
+        """
+        ids = {record.get('snippet') for _, record in records}
+        ids = [pk for pk in ids if isinstance(pk, int) and pk > self.baseline['snippet']]
+        return set(Snippet.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+    def import_languages(self, records):
+        def build(record):
+            language_code = _text(record, 'language_code', 50)
+            try:
+                get_lexer(language_code)
+            except ClassNotFound:
+                raise RecordError(f'no Pygments lexer for {language_code!r}')
+            return Language(name=_text(record, 'name', 100), slug=_text(record, 'slug', 50), language_code=language_code)
+
+        languages = self.validated(records, build, key=lambda language: language.slug)
+        existing = set(Language.objects.filter(slug__in=[l.slug for l in languages]).values_list('slug', flat=True))
+        languages = [language for language in languages if language.slug not in existing]
+        Language.objects.bulk_create(languages)
+        self.languages.update(Language.objects.filter(slug__in=[l.slug for l in languages]).values_list('slug', 'id'))
+        self.counts['language'] += len(languages)
+
+    def import_users(self, records):
+        def build(record):
+            return User(username=_text(record, 'username', 150), email=record.get('email') or '',
+                        password=make_password(None))
+
+        users = self.validated(records, build, key=lambda user: user.username)
+        existing = set(User.objects.filter(username__in=[u.username for u in users]).values_list('username', flat=True))
+        users = [user for user in users if user.username not in existing]
+        User.objects.bulk_create(users)
+        self.resolve_users(records, 'username')
+        self.counts['user'] += len(users)
+
+    def import_snippets(self, records):
+        self.resolve_users(records, 'author')
+        language_codes = dict(Language.objects.filter(pk__in=self.languages.values()).values_list('id', 'language_code'))
+        taken = self.taken_ids(Snippet, records, 'snippet')
+
+        def build(record):
+            slug = record.get('language')
+            if slug not in self.languages:
+                raise RecordError(f'unknown language {slug!r}')
+            snippet_id = _id(record, 'id')
+            if snippet_id in taken:
+                raise RecordError(f'id {snippet_id} belongs to an existing snippet')
+            pub_date = _datetime(record, 'pub_date')
+            return Snippet(
+                id=snippet_id,
+                title=_text(record, 'title', 255),
+                language_id=self.languages[slug],
+                author_id=self.user_id(record, 'author'),
+                description=_text(record, 'description', required=False),
+                code=_text(record, 'code', required=False),
+                tags=_text(record, 'tags', 255, required=False),
+                pub_date=pub_date,
+                update_date=_datetime(record, 'update_date') if record.get('update_date') else pub_date,
+            )
+
+        snippets = self.validated(records, build, key=lambda snippet: snippet.pk)
+        # Snippets imported by a replayed batch are left untouched
+        existing = set(Snippet.objects.filter(pk__in=[s.pk for s in snippets]).values_list('pk', flat=True))
+        snippets = [s for s in snippets if s.pk not in existing]
+
+        items = [(s.code, language_codes[s.language_id], s.description) for s in snippets]
+        for snippet, (highlighted, excerpt_html, description_html, summary, signature) in zip(
+            snippets, self.render(items)
+        ):
+            snippet.highlighted_code = highlighted
+            snippet.excerpt_html = excerpt_html
+            snippet.description_html = description_html
+            snippet.summary = summary
+            snippet._signature = signature
+        Snippet.objects.bulk_create(snippets, batch_size=500)
+        self.index_snippets(snippets)
+        self.counts['snippet'] += len(snippets)
+
+    def render(self, items):
+        if self.pool is None or not items:
+            return render_snippets(items)
+        chunk_size = max(len(items) // (self.workers * 4), 1)
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        return [rendered for chunk in self.pool.map(render_snippets, chunks) for rendered in chunk]
+
+    def index_snippets(self, snippets):
+        """
+        Does in bulk what Snippet.save() does per snippet: tag index, code signatures, search.
+        """
+        names = {snippet.pk: snippet.get_normalized_tags() for snippet in snippets}
+        all_names = set().union(*names.values())
+        Tag.objects.bulk_create([Tag(name=name) for name in all_names], ignore_conflicts=True)
+        tag_ids = dict(Tag.objects.filter(name__in=all_names).values_list('name', 'id'))
+        SnippetTag.objects.bulk_create([
+            SnippetTag(snippet_id=pk, tag_id=tag_ids[name]) for pk, snippet_names in names.items()
+            for name in snippet_names
+        ], batch_size=1000, ignore_conflicts=True)
+
+        CodeSignature.objects.bulk_create(
+            [CodeSignature(snippet_id=s.pk, signature=s._signature) for s in snippets], batch_size=1000
+        )
+        CodeBucket.objects.bulk_create([
+            CodeBucket(snippet_id=s.pk, band=band, bucket=bucket) for s in snippets
+            for band, bucket in enumerate(band_buckets(np.frombuffer(s._signature, dtype=np.uint32)))
+        ], batch_size=1000)
+        index_snippets(snippets)
+
+    def import_ratings(self, records):
+        self.resolve_users(records, 'user')
+        snippet_ids = self.existing_snippet_ids(records)
+
+        def build(record):
+            if record.get('snippet') not in snippet_ids:
+                raise RecordError(f'unknown snippet {record.get("snippet")!r}')
+            if record.get('rating') not in Rating.COUNTER_FIELDS:
+                raise RecordError(f'rating must be one of {", ".join(Rating.COUNTER_FIELDS)}')
+            return Rating(snippet_id=record['snippet'], user_id=self.user_id(record, 'user'),
+                          rating=record['rating'], date=_datetime(record, 'date'))
+
+        ratings = self.validated(records, build, key=lambda rating: (rating.snippet_id, rating.user_id))
+        existing = set(Rating.objects.filter(
+            snippet_id__in={rating.snippet_id for rating in ratings}, user_id__in={rating.user_id for rating in ratings}
+        ).values_list('snippet_id', 'user_id'))
+        ratings = [rating for rating in ratings if (rating.snippet_id, rating.user_id) not in existing]
+        Rating.objects.bulk_create(ratings, batch_size=1000)
+        self.counts['rating'] += len(ratings)
+
+    def import_comments(self, records):
+        self.resolve_users(records, 'author')
+        snippet_ids = self.existing_snippet_ids(records)
+        taken = self.taken_ids(Comment, records, 'comment')
+
+        def build(record):
+            if record.get('snippet') not in snippet_ids:
+                raise RecordError(f'unknown snippet {record.get("snippet")!r}')
+            comment_id = _id(record, 'id')
+            if comment_id in taken:
+                raise RecordError(f'id {comment_id} belongs to an existing comment')
+            return Comment(id=comment_id, snippet_id=record['snippet'], author_id=self.user_id(record, 'author'),
+                           content=_text(record, 'content'), pub_date=_datetime(record, 'pub_date'))
+
+        comments = self.validated(records, build, key=lambda comment: comment.pk)
+        existing = set(Comment.objects.filter(pk__in=[c.pk for c in comments]).values_list('pk', flat=True))
+        comments = [comment for comment in comments if comment.pk not in existing]
+        Comment.objects.bulk_create(comments, batch_size=1000)
+        self.counts['comment'] += len(comments)
@@ -0,0 +1,164 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page is fetched with a WHERE clause on the ordering columns of the
+last (or first) row of the previous page, so deep pages cost the same as the first one.
+Cursors are opaque URL-safe tokens; the total count is only computed when asked for.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q, QuerySet
+from django.http import Http404
+
+CURSOR_PARAM = 'cursor'
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise Http404('Invalid cursor.')
+    if direction not in ('next', 'previous') or not isinstance(values, list):
+        raise Http404('Invalid cursor.')
+    return direction, values
+
+
+class KeysetPage:
+    """
+    A page of results plus the cursors around it, with the Page attributes templates use.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, next_query=None, previous_query=None,
+                 total_count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_query = next_query
+        self.previous_query = previous_query
+        self.total_count = total_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+
+def _field_names(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _row_values(obj, fields):
+    return [getattr(obj, name) for name, _ in fields]
+
+
+def _after(fields, values, forward):
+    """
+    Q matching the rows strictly after ``values`` in the ordering (or before, if not ``forward``).
+    """
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending == forward else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[index]})
+        for previous_index, (previous_name, _) in enumerate(fields[:index]):
+            term &= Q(**{previous_name: values[previous_index]})
+        condition |= term
+    return condition
+
+
+def _query_string(request, param, value):
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop(CURSOR_PARAM, None)
+    params[param] = value
+    return params.urlencode()
+
+
+def paginate_keyset(request, queryset, ordering, page_size, with_count=False):
+    """
+    Returns the KeysetPage of ``queryset`` selected by the request's cursor.
+
+    ``ordering`` must be unique, e.g. end with the primary key.
+    """
+    fields = _field_names(ordering)
+    cursor = request.GET.get(CURSOR_PARAM)
+    total_count = queryset.count() if with_count else None
+
+    page_queryset = queryset.order_by(*ordering)
+    direction = 'next'
+    if cursor:
+        direction, raw_values = decode_cursor(cursor)
+        if len(raw_values) != len(fields):
+            raise Http404('Invalid cursor.')
+        try:
+            values = [
+                queryset.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, raw_values)
+            ]
+        except (FieldDoesNotExist, ValueError, TypeError):
+            raise Http404('Invalid cursor.')
+        forward = direction == 'next'
+        page_queryset = page_queryset.filter(_after(fields, values, forward))
+        if not forward:
+            page_queryset = page_queryset.reverse()
+
+    rows = list(page_queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'previous':
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    next_query = previous_query = None
+    if rows and has_next:
+        next_query = _query_string(request, CURSOR_PARAM, encode_cursor('next', _row_values(rows[-1], fields)))
+    if rows and has_previous:
+        previous_query = _query_string(
+            request, CURSOR_PARAM, encode_cursor('previous', _row_values(rows[0], fields))
+        )
+    return KeysetPage(rows, has_next, has_previous, next_query, previous_query, total_count)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin paginating querysets by cursor over ``keyset_ordering``.
+
+    Set ``paginate_with_count`` to also run a COUNT(*) for the total. Anything that is not a
+    queryset (e.g. ranked search results) keeps the regular page-number pagination.
+    """
+    keyset_ordering = ('-id',)
+    paginate_with_count = False
+
+    def paginate_queryset(self, queryset, page_size):
+        if not isinstance(queryset, QuerySet):
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.next_query = _query_string(self.request, 'page', page.next_page_number()) \
+                if page.has_next() else None
+            page.previous_query = _query_string(self.request, 'page', page.previous_page_number()) \
+                if page.has_previous() else None
+            page.total_count = paginator.count
+            return paginator, page, object_list, is_paginated
+
+        page = paginate_keyset(
+            self.request, queryset, self.keyset_ordering, page_size, with_count=self.paginate_with_count
+        )
+        return None, page, page.object_list, page.has_other_pages()
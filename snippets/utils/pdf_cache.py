@@ -0,0 +1,142 @@
+"""
+On-disk cache of generated snippet PDFs.
+
+A PDF only changes when its snippet does, so files are named after the snippet id and its
+``update_date`` and served straight from disk. Reading a file bumps its mtime, and once the
+directory grows past ``PDF_CACHE_MAX_BYTES`` the least recently used files are removed. A
+per-file lock makes concurrent first requests for the same PDF wait for a single render,
+across processes as well as threads.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Striped locks serialise renders of the same file between threads of one process
+_thread_locks = [threading.Lock() for _ in range(64)]
+
+
+def cache_dir():
+    path = str(settings.PDF_CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def pdf_cache_key(snippet):
+    """
+    Returns the file name of the snippet's current PDF; it doubles as the ETag.
+    """
+    return f'{snippet.pk}-{int(snippet.update_date.timestamp() * 1_000_000)}.pdf'
+
+
+@contextmanager
+def _render_lock(path):
+    with _thread_locks[hash(path) % len(_thread_locks)]:
+        if fcntl is None:
+            yield
+            return
+        with open(f'{path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def open_pdf(snippet, render):
+    """
+    Returns the cached PDF of ``snippet`` opened for reading, calling ``render()`` for its
+    bytes on a miss. ``render`` may raise; nothing is cached then.
+    """
+    directory = cache_dir()
+    key = pdf_cache_key(snippet)
+    path = os.path.join(directory, key)
+    cached = _open(path)
+    if cached is not None:
+        return cached
+
+    with _render_lock(path):
+        # Another request may have rendered it while we waited for the lock
+        cached = _open(path)
+        if cached is not None:
+            return cached
+        content = render()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, path)
+        # Open before evicting; an open file stays readable even if it is evicted meanwhile
+        cached = open(path, 'rb')
+
+    _remove_stale_versions(directory, snippet.pk, key)
+    evict(settings.PDF_CACHE_MAX_BYTES)
+    return cached
+
+
+def _open(path):
+    """
+    Opens a cached file and marks it as recently used, or returns None if it is missing.
+    """
+    try:
+        cached = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return cached
+
+
+def _remove_stale_versions(directory, snippet_id, current_key):
+    prefix = f'{snippet_id}-'
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.pdf') and name != current_key:
+            _remove(os.path.join(directory, name))
+
+
+def _remove(path):
+    for name in (path, f'{path}.lock'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def evict(max_bytes):
+    """
+    Removes the least recently used PDFs until the cache fits in ``max_bytes``.
+    Returns the number of files removed.
+    """
+    directory = cache_dir()
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.pdf'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear():
+    directory = cache_dir()
+    for name in os.listdir(directory):
+        _remove(os.path.join(directory, name))
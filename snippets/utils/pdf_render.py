@@ -0,0 +1,309 @@
+"""
+PDF rendering in a bounded pool of worker processes.
+
+xhtml2pdf is slow and CPU-bound, so running it in web workers lets a burst of downloads
+starve every other page. Templates are still rendered to HTML in the web process, but the
+HTML to PDF conversion runs in a long-lived render process. At most ``PDF_RENDER_WORKERS``
+conversions run at a time and at most ``PDF_RENDER_QUEUE_SIZE`` more may wait for a turn;
+beyond that ``render_pdf`` raises PDFQueueFull immediately so the view can answer 503
+instead of piling up requests.
+
+The limits hold for every web process on the host, not per process: each worker and queue
+slot is a lock file in ``PDF_RENDER_LOCK_DIR`` held with flock(), which the kernel releases
+when its holder exits. Without fcntl (Windows) they only bound the current process. A job
+still running when its caller stops waiting is killed with its render process, so a document
+that makes xhtml2pdf hang cannot keep a worker or a queue slot. ``PDF_RENDER_WORKERS = 0``
+renders inline without a deadline, e.g. for development.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import time
+
+from django.conf import settings
+from xhtml2pdf import pisa
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Seconds between attempts to take a busy worker slot
+LOCK_POLL_SECONDS = 0.05
+
+
+class PDFRenderError(Exception):
+    pass
+
+
+class PDFQueueFull(PDFRenderError):
+    pass
+
+
+class PDFRenderTimeout(PDFRenderError):
+    pass
+
+
+_workers = None
+_slots = None
+# Idle render processes of this web process
+_idle = []
+_lock = threading.Lock()
+_stats = {
+    'submitted': 0,
+    'completed': 0,
+    'failed': 0,
+    'rejected': 0,
+    'timed_out': 0,
+    'in_flight': 0,
+    'render_seconds_total': 0.0,
+    'render_seconds_max': 0.0,
+}
+
+
+def html_to_pdf(html):
+    """
+    Converts HTML to PDF bytes. Runs in the worker processes.
+    """
+    output = io.BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=output)
+    if pisa_status.err:
+        raise PDFRenderError(f'xhtml2pdf reported {pisa_status.err} error(s)')
+    return output.getvalue()
+
+
+class _Gate:
+    """
+    ``size`` slots shared by the web processes of this host, one lock file each. ``acquire``
+    returns a token to pass to ``release``, or None when no slot freed up in time.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        # Without fcntl the slots only bound this process
+        self.semaphore = threading.BoundedSemaphore(size) if fcntl is None else None
+
+    def paths(self):
+        directory = str(settings.PDF_RENDER_LOCK_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return [os.path.join(directory, f'{self.name}-{number}.lock') for number in range(self.size)]
+
+    def try_acquire(self):
+        if self.semaphore is not None:
+            return True if self.semaphore.acquire(blocking=False) else None
+        for path in self.paths():
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def acquire(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            token = self.try_acquire()
+            remaining = deadline - time.monotonic()
+            if token is not None or remaining <= 0:
+                return token
+            time.sleep(min(LOCK_POLL_SECONDS, remaining))
+
+    def release(self, token):
+        if self.semaphore is not None:
+            self.semaphore.release()
+        else:
+            # Closing the descriptor drops the lock
+            os.close(token)
+
+    def held(self):
+        """
+        Returns how many slots are taken across processes, or None without fcntl.
+        """
+        if self.semaphore is not None:
+            return None
+        held = 0
+        for path in self.paths():
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                held += 1
+            finally:
+                os.close(fd)
+        return held
+
+
+def _get_gates():
+    """
+    Returns the gates bounding the running jobs (None when rendering inline) and the
+    running plus waiting jobs.
+    """
+    global _workers, _slots
+    with _lock:
+        workers = settings.PDF_RENDER_WORKERS
+        if _slots is None:
+            _slots = _Gate('slot', max(workers, 1) + settings.PDF_RENDER_QUEUE_SIZE)
+        if _workers is None and workers:
+            _workers = _Gate('worker', workers)
+        return _workers, _slots
+
+
+def _serve(connection):
+    """
+    Main loop of a render process: converts the (render, html) jobs it receives until the
+    web process goes away.
+    """
+    import django
+    django.setup()
+    while True:
+        try:
+            render, html = connection.recv()
+        except EOFError:
+            return
+        started = time.perf_counter()
+        try:
+            connection.send((True, render(html), time.perf_counter() - started))
+        except Exception as e:
+            connection.send((False, str(e), time.perf_counter() - started))
+
+
+class _RenderProcess:
+
+    def __init__(self):
+        self.connection, child = multiprocessing.Pipe()
+        # Spawned, so the child inherits neither the slot locks nor the web process' state
+        self.process = multiprocessing.get_context('spawn').Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _checkout():
+    with _lock:
+        while _idle:
+            worker = _idle.pop()
+            if worker.process.is_alive():
+                return worker
+            worker.stop()
+    return _RenderProcess()
+
+
+def _checkin(worker):
+    with _lock:
+        if len(_idle) < settings.PDF_RENDER_WORKERS:
+            _idle.append(worker)
+            return
+    worker.stop()
+
+
+def _record(**changes):
+    with _lock:
+        for name, value in changes.items():
+            _stats[name] += value
+
+
+def _completed(seconds):
+    with _lock:
+        _stats['completed'] += 1
+        _stats['render_seconds_total'] += seconds
+        _stats['render_seconds_max'] = max(_stats['render_seconds_max'], seconds)
+
+
+def _timed_out():
+    _record(timed_out=1)
+    return PDFRenderTimeout('PDF rendering timed out')
+
+
+def render_pdf(html, timeout=None, render=html_to_pdf):
+    """
+    Returns the PDF bytes of ``html``, waiting at most ``timeout`` seconds
+    (``PDF_RENDER_TIMEOUT`` by default) for a worker and the conversion.
+
+    Raises PDFQueueFull when all workers are busy and the queue is full, PDFRenderTimeout
+    when the job takes too long and PDFRenderError when xhtml2pdf fails.
+    """
+    workers, slots = _get_gates()
+    slot = slots.acquire()
+    if slot is None:
+        _record(rejected=1)
+        raise PDFQueueFull('PDF render queue is full')
+    _record(submitted=1, in_flight=1)
+    try:
+        if workers is None:
+            return _render_inline(render, html)
+        deadline = time.monotonic() + (settings.PDF_RENDER_TIMEOUT if timeout is None else timeout)
+        worker_slot = workers.acquire(timeout=max(deadline - time.monotonic(), 0))
+        if worker_slot is None:
+            raise _timed_out()
+        try:
+            return _render_in_process(render, html, deadline)
+        finally:
+            workers.release(worker_slot)
+    finally:
+        slots.release(slot)
+        _record(in_flight=-1)
+
+
+def _render_inline(render, html):
+    started = time.perf_counter()
+    try:
+        content = render(html)
+    except Exception:
+        _record(failed=1)
+        raise
+    _completed(time.perf_counter() - started)
+    return content
+
+
+def _render_in_process(render, html, deadline):
+    worker = _checkout()
+    try:
+        try:
+            worker.connection.send((render, html))
+            if not worker.connection.poll(max(deadline - time.monotonic(), 0)):
+                # Stuck in xhtml2pdf; the next job gets a fresh process
+                worker.stop()
+                worker = None
+                raise _timed_out()
+            ok, result, seconds = worker.connection.recv()
+        except (EOFError, OSError):
+            worker.stop()
+            worker = None
+            _record(failed=1)
+            raise PDFRenderError('PDF render worker died')
+    finally:
+        if worker is not None:
+            _checkin(worker)
+    if not ok:
+        _record(failed=1)
+        raise PDFRenderError(result)
+    _completed(seconds)
+    return result
+
+
+def get_render_stats():
+    """
+    Returns counters and timings of the PDF render pool. The jobs in flight and the queue
+    depth are those of every web process on the host, the other counters this process'.
+    """
+    with _lock:
+        stats = dict(_stats)
+    workers, slots = _get_gates()
+    held = slots.held()
+    if held is not None:
+        stats['in_flight'] = held
+    stats['workers'] = settings.PDF_RENDER_WORKERS
+    stats['capacity'] = slots.size
+    stats['queue_depth'] = max(stats['in_flight'] - settings.PDF_RENDER_WORKERS, 0)
+    stats['render_seconds_avg'] = (
+        stats['render_seconds_total'] / stats['completed'] if stats['completed'] else 0.0
+    )
+    return stats
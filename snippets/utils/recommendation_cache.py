@@ -0,0 +1,148 @@
+"""
+Per-user cache of recommended snippet ids in front of get_user_recommendations().
+
+Entries live in the ``recommendations`` cache alias, which bounds how many are kept. An
+entry is fresh for ``RECOMMENDATION_CACHE_TTL`` seconds and until a change that can alter it:
+
+- the user rates a snippet (invalidate_user_recommendations());
+- a new snippet shares a tag with a snippet the user likes, the only way it becomes a
+  candidate for them (snippet_created());
+- for users who like nothing yet and get the popular snippets, any new snippet;
+- a bulk import (mark_snippets_changed()).
+
+The generations behind the last two and the hit/miss counters live in the small
+``recommendation_state`` alias, so evicting entries never resets them. Once an entry goes
+stale, the first request to take the user's lock recomputes it while concurrent requests
+keep serving the stale ids.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ratings.models import Rating
+from snippets.models import Snippet, SnippetTag
+from snippets.utils.recommendations import get_user_recommendations
+
+LOCK_TIMEOUT = 30
+# Bumped by bulk changes, and by every new snippet for the popular-snippet entries
+GENERATION_KEY = 'recommendations:generation'
+POPULAR_GENERATION_KEY = 'recommendations:generation:popular'
+STATS = ('hits', 'misses', 'stale')
+
+
+def _cache():
+    return caches['recommendations']
+
+
+def _state():
+    return caches['recommendation_state']
+
+
+def _entry_key(user_id):
+    return f'recommendations:user:{user_id}'
+
+
+def _lock_key(user_id):
+    return f'recommendations:lock:{user_id}'
+
+
+def _count(stat):
+    cache = _state()
+    key = f'recommendations:stats:{stat}'
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def _generations():
+    state = _state()
+    for key in (GENERATION_KEY, POPULAR_GENERATION_KEY):
+        state.add(key, 0, timeout=None)
+    generations = state.get_many([GENERATION_KEY, POPULAR_GENERATION_KEY])
+    return generations.get(GENERATION_KEY, 0), generations.get(POPULAR_GENERATION_KEY, 0)
+
+
+def _bump(key):
+    state = _state()
+    state.add(key, 0, timeout=None)
+    state.incr(key)
+
+
+def _load(snippet_ids):
+    snippets = Snippet.objects.for_list().order_by().in_bulk(snippet_ids)
+    return [snippets[pk] for pk in snippet_ids if pk in snippets]
+
+
+def get_cached_user_recommendations(user, top_n=5):
+    """
+    Returns the same snippets as get_user_recommendations(), recomputing them at most
+    once per user per TTL.
+    """
+    cache = _cache()
+    entry = cache.get(_entry_key(user.pk))
+    generation, popular_generation = _generations()
+
+    if entry and entry['top_n'] >= top_n and entry['generation'] == generation \
+            and entry['popular_generation'] in (None, popular_generation) and entry['expires'] > time.time():
+        _count('hits')
+        return _load(entry['ids'][:top_n])
+
+    locked = cache.add(_lock_key(user.pk), 1, LOCK_TIMEOUT)
+    if not locked and entry and entry['top_n'] >= top_n:
+        # Another request is already recomputing this user's entry
+        _count('stale')
+        return _load(entry['ids'][:top_n])
+
+    _count('misses')
+    try:
+        recommended = list(get_user_recommendations(user, top_n=top_n))
+        # The popular snippets shown to users who like nothing yet carry their popularity. They,
+        # and an empty list, can change with any new snippet.
+        popular = all(hasattr(snippet, 'popularity') for snippet in recommended)
+        cache.set(_entry_key(user.pk), {
+            'ids': [snippet.pk for snippet in recommended],
+            'top_n': top_n,
+            'generation': generation,
+            'popular_generation': popular_generation if popular else None,
+            'expires': time.time() + settings.RECOMMENDATION_CACHE_TTL,
+        })
+    finally:
+        if locked:
+            cache.delete(_lock_key(user.pk))
+    return recommended
+
+
+def invalidate_user_recommendations(user_id):
+    """
+    Drops a user's entry, e.g. after they rated a snippet.
+    """
+    _cache().delete(_entry_key(user_id))
+
+
+def snippet_created(snippet):
+    """
+    Drops the entries a new snippet can change: those of the users who like a snippet sharing
+    one of its tags, and those showing the popular snippets.
+    """
+    tag_ids = SnippetTag.objects.filter(snippet=snippet).values('tag_id')
+    user_ids = Rating.objects.filter(
+        rating=Rating.LIKE, snippet__snippet_tags__tag_id__in=tag_ids
+    ).exclude(user_id=snippet.author_id).values_list('user_id', flat=True).distinct().order_by()
+    _cache().delete_many([_entry_key(user_id) for user_id in user_ids])
+    _bump(POPULAR_GENERATION_KEY)
+
+
+def mark_snippets_changed():
+    """
+    Makes every cached entry stale so it is lazily recomputed on the user's next visit,
+    e.g. after a bulk import or a collaborative filtering rebuild.
+    """
+    _bump(GENERATION_KEY)
+
+
+def get_cache_stats():
+    """
+    Returns the hit/miss/stale counters kept next to the generations.
+    """
+    state = _state()
+    return {stat: state.get(f'recommendations:stats:{stat}', 0) for stat in STATS}
@@ -1,47 +1,43 @@
 from collections import defaultdict
-from django.db.models import Q
+from itertools import chain
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
 
 from ratings.models import Rating
-from snippets.models import Snippet
+from snippets.models import Snippet, SnippetTag
 
+# Scales the [0, 1] cosine similarity against the rating and author boosts
+SIMILARITY_WEIGHT = 6.0
+# Scales the collaborative-filtering score (1 for the user's best match) against tag overlap
+COLLABORATIVE_WEIGHT = 4.0
 
-def get_similar_snippets(current_snippet, user=None, top_n=5):
+
+def annotate_shared_tags(queryset, tag_ids):
     """
-    Computes a weighted similarity score based on tags, language, and ratings.
+    Annotates each snippet with how many of ``tag_ids`` it carries, using the tag index.
     """
-    current_tags = current_snippet.get_normalized_tags()
-    if not current_tags:
-        return Snippet.objects.none()
+    shared_tags = SnippetTag.objects.filter(
+        snippet=OuterRef('pk'), tag_id__in=tag_ids
+    ).order_by().values('snippet').annotate(count=Count('pk')).values('count')
+    return queryset.annotate(shared_tags=Subquery(shared_tags, output_field=IntegerField()))
 
-    # Heuristic filtering: find snippets that share at least one tag or the same language
-    # Also, exclude snippets by the current user
-    candidate_snippets = Snippet.objects.exclude(pk=current_snippet.pk)
-    if user and user.is_authenticated:
-        candidate_snippets = candidate_snippets.exclude(author=user)
 
-    candidate_snippets = candidate_snippets.filter(
-        Q(language=current_snippet.language) |
-        Q(tags__icontains=list(current_tags)[0])
-    )
+def get_similar_snippets(current_snippet, user=None, top_n=5):
+    """
+    Ranks the precomputed content neighbours of a snippet (see snippets.utils.similarity)
+    by similarity, ratings, and the user's liked authors.
+    """
+    neighbours = current_snippet.neighbours.select_related(
+        'neighbour__author', 'neighbour__language'
+    ).order_by('-score')
+    # Exclude snippets by the current user
+    if user and user.is_authenticated:
+        neighbours = neighbours.exclude(neighbour__author=user)
 
     scored_snippets = defaultdict(float)
 
-    # 1. Tag and Language Scoring
-    for snippet in candidate_snippets:
-        score = 0
-
-        # Tag overlap: count shared tags
-        other_tags = snippet.get_normalized_tags()
-        shared_tags_count = len(current_tags & other_tags)
-
-        if shared_tags_count > 0:
-            score += shared_tags_count * 1.5  # Weight tag similarity heavily
-
-        # Language match: boost if it's the same language
-        if snippet.language == current_snippet.language:
-            score += 3.0  # Give a significant boost for language match
-
-        scored_snippets[snippet] += score
+    # 1. Tag and Language Scoring (precomputed cosine similarity)
+    for neighbour in neighbours:
+        scored_snippets[neighbour.neighbour] += neighbour.score * SIMILARITY_WEIGHT
 
     # 2. Add Social Proof (Ratings)
     for snippet, score in list(scored_snippets.items()):  # use list() to iterate over a copy
@@ -51,7 +47,9 @@ def get_similar_snippets(current_snippet, user=None, top_n=5):
     # 3. Add Personalized Scoring for the user
     if user and user.is_authenticated:
         # Find authors of snippets the user has liked
-        liked_authors_ids = user.ratings.filter(rating='like').values_list('snippet__author_id', flat=True)
+        liked_authors_ids = set(
+            user.ratings.filter(rating=Rating.LIKE).values_list('snippet__author_id', flat=True)
+        )
 
         for snippet, score in list(scored_snippets.items()):
             if snippet.author_id in liked_authors_ids:
@@ -66,47 +64,55 @@ def get_similar_snippets(current_snippet, user=None, top_n=5):
 def get_user_recommendations(user, top_n=5):
     """
     Generates recommendations for a user based on their past likes and dislikes.
-    This is a simple content-based approach.
+    Blends tag overlap with the user's precomputed collaborative-filtering scores
+    (see snippets.utils.collaborative).
     """
     # Get all snippets the user has liked
     liked_snippets = Snippet.objects.filter(ratings__user=user, ratings__rating=Rating.LIKE)
+    collaborative_scores = dict(user.collaborative_scores.values_list('snippet_id', 'score'))
 
     # If the user has not liked anything, return popular snippets
-    if not liked_snippets:
-        return Snippet.objects.order_by('-ratings__rating')[:top_n]
+    if not collaborative_scores and not liked_snippets.exists():
+        return Snippet.objects.select_related('author', 'language').annotate(
+            popularity=F('like_count') - F('dislike_count')
+        ).order_by('-popularity', '-update_date')[:top_n]
 
     # Aggregate tags from liked snippets
-    user_tags = set()
-    for snippet in liked_snippets:
-        user_tags.update(snippet.get_normalized_tags())
-
-    if not user_tags:
-        return Snippet.objects.none()
-
-    # Find snippets that match the user's preferred tags
-    # Start with a simple OR filter on all tags
-    query = Q()
-    for tag in user_tags:
-        query |= Q(tags__icontains=tag)
+    user_tag_ids = list(
+        SnippetTag.objects.filter(snippet__in=liked_snippets).values_list('tag_id', flat=True).distinct()
+    )
 
     # Exclude snippets the user has already interacted with AND snippets written by the user
     rated_snippet_ids = user.ratings.values_list('snippet_id', flat=True)
 
-    candidate_snippets = Snippet.objects.exclude(pk__in=rated_snippet_ids).exclude(author=user).filter(query)
-
     # Score the candidates based on tag overlap and other factors
     scored_snippets = defaultdict(float)
-    for snippet in candidate_snippets:
-        score = 0
-        other_tags = snippet.get_normalized_tags()
-        shared_tags_count = len(user_tags & other_tags)
-
-        if shared_tags_count > 0:
-            score += shared_tags_count * 2.0  # Heavier weight for shared tags
-
-        # You can add other factors here, like popularity, recency, etc.
-        scored_snippets[snippet] += score
+    if user_tag_ids:
+        # Find snippets that match the user's preferred tags through the tag index
+        tagged_ids = SnippetTag.objects.filter(tag_id__in=user_tag_ids).values('snippet_id')
+        candidate_snippets = Snippet.objects.select_related('author', 'language').exclude(
+            pk__in=rated_snippet_ids
+        ).exclude(author=user).filter(pk__in=tagged_ids).order_by()
+        candidate_snippets = annotate_shared_tags(candidate_snippets, user_tag_ids)
+
+        for snippet in candidate_snippets:
+            score = 0
+            shared_tags_count = snippet.shared_tags or 0
+
+            if shared_tags_count > 0:
+                score += shared_tags_count * 2.0  # Heavier weight for shared tags
+
+            scored_snippets[snippet] += score
+
+    # Blend in collaborative filtering, adding the snippets it found that share no tags
+    if collaborative_scores:
+        tag_matched_ids = {snippet.pk for snippet in scored_snippets}
+        collaborative_only = Snippet.objects.select_related('author', 'language').filter(
+            pk__in=collaborative_scores.keys() - tag_matched_ids
+        ).exclude(pk__in=rated_snippet_ids).exclude(author=user).order_by()
+        for snippet in chain(list(scored_snippets), collaborative_only):
+            scored_snippets[snippet] += collaborative_scores.get(snippet.pk, 0) * COLLABORATIVE_WEIGHT
 
     # Sort and return the top N
     sorted_scored = sorted(scored_snippets.items(), key=lambda item: item[1], reverse=True)
-    return [snippet for snippet, score in sorted_scored[:top_n]]
\ No newline at end of file
+    return [snippet for snippet, score in sorted_scored[:top_n]]
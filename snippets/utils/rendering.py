@@ -0,0 +1,95 @@
+"""
+Content-addressed rendering of highlighted code and Markdown descriptions.
+
+Rendered HTML is cached under a hash of everything the output depends on: the source text,
+the lexer, the formatter options and the Pygments/Markdown versions. Identical inputs, such
+as the same code in several snippets or a bulk re-import, are rendered once; upgrading a
+library changes the keys so stale HTML is never served. Lexers and the formatter are built
+once per process and reused.
+
+List pages show a short highlighted excerpt and a plain-text summary instead of the full code
+and description. Both are bounded in size and stored with the snippet when it is saved.
+"""
+import hashlib
+import html
+from functools import lru_cache
+
+import markdown as markdown_module
+import pygments
+from django.core.cache import caches
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from markdown import markdown
+from pygments import highlight
+from pygments.formatters.html import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+
+CACHE_ALIAS = 'rendering'
+FORMATTER_OPTIONS = {'linenos': False}
+
+# Size of the list page excerpt and summary
+EXCERPT_LINES = 5
+EXCERPT_LINE_LENGTH = 100
+SUMMARY_LENGTH = 200
+
+_formatter = HtmlFormatter(**FORMATTER_OPTIONS)
+_FORMATTER_KEY = repr(sorted(FORMATTER_OPTIONS.items()))
+
+
+@lru_cache(maxsize=None)
+def get_lexer(language_code):
+    """
+    Returns the shared lexer for ``language_code``; Pygments lexers keep no per-call state.
+    """
+    return get_lexer_by_name(language_code)
+
+
+def render_key(kind, text, *options):
+    digest = hashlib.sha256()
+    for part in (kind, *options):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    digest.update(text.encode('utf-8'))
+    return f'{kind}:{digest.hexdigest()}'
+
+
+def _cached_render(key, render):
+    cache = caches[CACHE_ALIAS]
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html)
+    return html
+
+
+def highlight_code(code, language_code):
+    """
+    Returns the Pygments HTML for ``code``, rendered at most once per distinct input.
+    """
+    key = render_key('code', code, language_code, _FORMATTER_KEY, pygments.__version__)
+    return _cached_render(key, lambda: highlight(code, get_lexer(language_code), _formatter))
+
+
+def render_markdown(text):
+    """
+    Returns the Markdown HTML for ``text``, rendered at most once per distinct input.
+    """
+    key = render_key('markdown', text, markdown_module.__version__)
+    return _cached_render(key, lambda: markdown(text))
+
+
+def code_excerpt(code, language_code):
+    """
+    Returns the Pygments HTML of the first EXCERPT_LINES lines of ``code``, each cut to
+    EXCERPT_LINE_LENGTH characters.
+    """
+    lines = code.strip('\n').splitlines()[:EXCERPT_LINES]
+    return highlight_code('\n'.join(line[:EXCERPT_LINE_LENGTH] for line in lines), language_code)
+
+
+def plain_summary(description_html):
+    """
+    Returns the text of a rendered description on one line, cut to SUMMARY_LENGTH characters.
+    """
+    text = ' '.join(html.unescape(strip_tags(description_html)).split())
+    return Truncator(text).chars(SUMMARY_LENGTH)
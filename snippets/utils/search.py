@@ -0,0 +1,154 @@
+"""
+Full-text search over snippet titles, descriptions, tags and code.
+
+On SQLite the snippets are mirrored into an FTS5 table ranked by BM25 (title matches weigh
+most). Snippet.save() and the post_delete signal keep it in sync, and
+``manage.py rebuild_search_index`` recreates it from scratch. Other databases fall back to
+a title search.
+"""
+import re
+
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'snippets_snippet_fts'
+# Upper bound on the ranked results a single search returns
+MAX_RESULTS = 1000
+BATCH_SIZE = 500
+# Control characters used to mark highlights before the excerpt is HTML-escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as a prefix.
+    Quoting each word keeps FTS5 operators in user input from being interpreted.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def _index_rows(snippets):
+    return [(s.pk, s.title, s.description, s.tags, s.code) for s in snippets]
+
+
+def index_snippets(snippets):
+    """
+    Adds or refreshes the search entries of ``snippets``.
+    """
+    if not search_enabled():
+        return
+    rows = _index_rows(snippets)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, description, tags, code) VALUES (%s, %s, %s, %s, %s)', rows
+        )
+
+
+def remove_snippets(snippet_ids):
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in snippet_ids])
+
+
+def rebuild_search_index():
+    """
+    Re-indexes every snippet. Returns the number of snippets indexed.
+    """
+    from snippets.models import Snippet
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    indexed = 0
+    batch = []
+    for snippet in Snippet.objects.only('pk', 'title', 'description', 'tags', 'code').iterator(chunk_size=BATCH_SIZE):
+        batch.append(snippet)
+        if len(batch) == BATCH_SIZE:
+            index_snippets(batch)
+            indexed += len(batch)
+            batch = []
+    index_snippets(batch)
+    return indexed + len(batch)
+
+
+class SearchResults:
+    """
+    Lazily fetched, BM25-ordered search results that paginate like a queryset.
+
+    Only the ranked ids are loaded up front; slicing fetches that page's snippets from
+    ``queryset`` and attaches a highlighted ``search_excerpt`` to each of them. At most
+    MAX_RESULTS are kept, and ``truncated`` tells whether more matched.
+    """
+
+    def __init__(self, queryset, match, exclude_ids=()):
+        self.queryset = queryset
+        self.match = match
+        # Read from the database the queryset reads from, e.g. a replica
+        self.connection = connections[queryset.db]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+                # One more than the cap tells whether matches were left out
+                [match, MAX_RESULTS + 1 + len(exclude_ids)],
+            )
+            excluded = set(exclude_ids)
+            ids = [pk for pk, in cursor.fetchall() if pk not in excluded]
+        self.truncated = len(ids) > MAX_RESULTS
+        self.ids = ids[:MAX_RESULTS]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        snippets = self.queryset.order_by().in_bulk(ids)
+        excerpts = self.excerpts(ids)
+        results = []
+        for pk in ids:
+            if pk in snippets:
+                snippets[pk].search_excerpt = excerpts.get(pk, '')
+                results.append(snippets[pk])
+        return results
+
+    def excerpts(self, ids):
+        if not ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, '…', 16) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [_MARK_START, _MARK_END, self.match, *ids],
+            )
+            return {pk: _highlight(excerpt) for pk, excerpt in cursor.fetchall()}
+
+
+def _highlight(excerpt):
+    html = escape(excerpt).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def search_snippets(queryset, query, exclude_ids=()):
+    """
+    Returns the snippets of ``queryset`` matching ``query``, best match first.
+    """
+    if not search_enabled():
+        return queryset.exclude(pk__in=exclude_ids).filter(title__icontains=query)
+    match = build_match_query(query)
+    if match is None:
+        return queryset.none()
+    return SearchResults(queryset, match, exclude_ids)
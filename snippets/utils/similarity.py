@@ -0,0 +1,223 @@
+"""
+Item-item content similarity between snippets.
+
+Every snippet is a sparse vector with one column per tag and one per language, and the
+similarity of two snippets is the cosine of their vectors. Only each snippet's top-K
+neighbours are kept (in SnippetNeighbour), so the detail page reads them with one indexed
+query instead of rescoring every candidate on each hit.
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Count, Min
+
+from snippets.models import Snippet, SnippetNeighbour, SnippetTag
+
+TOP_K = 20
+TAG_WEIGHT = 1.5
+LANGUAGE_WEIGHT = 3.0
+BATCH_SIZE = 1000
+# Sample scored by the incremental update, see _candidate_ids()
+MAX_LANGUAGE_CANDIDATES = 500
+MAX_TAG_CANDIDATES = 200
+QUERY_CHUNK_SIZE = 500
+
+
+def build_feature_matrix(snippet_rows, tag_rows):
+    """
+    Builds the L2-normalised snippet x feature matrix.
+
+    ``snippet_rows`` are (snippet_id, language_id) pairs and ``tag_rows`` are (snippet_id, tag_id)
+    pairs. Returns the sorted snippet ids (one per matrix row) and the CSR matrix.
+    """
+    snippets = np.array(snippet_rows, dtype=np.int64).reshape(-1, 2)
+    snippets = snippets[np.argsort(snippets[:, 0])]
+    snippet_ids, language_ids = snippets[:, 0], snippets[:, 1]
+    n_snippets = len(snippet_ids)
+    if not n_snippets:
+        return snippet_ids, sparse.csr_matrix((0, 0))
+
+    tags = np.array(tag_rows, dtype=np.int64).reshape(-1, 2)
+    tag_rows_idx = np.searchsorted(snippet_ids, tags[:, 0])
+    known = tag_rows_idx < n_snippets
+    known[known] = snippet_ids[tag_rows_idx[known]] == tags[known, 0]
+    tag_rows_idx = tag_rows_idx[known]
+    tag_values, tag_cols = np.unique(tags[known, 1], return_inverse=True)
+    language_values, language_cols = np.unique(language_ids, return_inverse=True)
+
+    rows = np.concatenate([tag_rows_idx, np.arange(n_snippets)])
+    cols = np.concatenate([tag_cols, len(tag_values) + language_cols])
+    data = np.concatenate([
+        np.full(len(tag_cols), TAG_WEIGHT),
+        np.full(n_snippets, LANGUAGE_WEIGHT),
+    ])
+    matrix = sparse.csr_matrix(
+        (data, (rows, cols)), shape=(n_snippets, len(tag_values) + len(language_values))
+    )
+    matrix.sum_duplicates()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return snippet_ids, sparse.diags(1.0 / norms) @ matrix
+
+
+def top_k(scores, k):
+    """
+    Returns the indices of the ``k`` highest positive entries of ``scores``, best first. Ties
+    go to the lowest indices, i.e. the lowest snippet ids, so the incremental update and the
+    full rebuild pick the same neighbours.
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidate_scores = scores[candidates]
+        threshold = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+        above = candidates[candidate_scores > threshold]
+        tied = candidates[candidate_scores == threshold][:k - len(above)]
+        candidates = np.concatenate([above, tied])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def rebuild_neighbours(top_k_size=TOP_K, chunk_size=100):
+    """
+    Recomputes the neighbour table for every snippet. Returns the number of rows written.
+    """
+    snippet_rows = list(Snippet.objects.order_by().values_list('pk', 'language_id'))
+    tag_rows = list(SnippetTag.objects.order_by().values_list('snippet_id', 'tag_id'))
+    snippet_ids, matrix = build_feature_matrix(snippet_rows, tag_rows)
+    transposed = matrix.T.tocsr()
+
+    written = 0
+    with transaction.atomic():
+        SnippetNeighbour.objects.all().delete()
+        for start in range(0, len(snippet_ids), chunk_size):
+            # Multiplying a block of rows keeps the sparse intermediate bounded by chunk_size
+            block = (matrix[start:start + chunk_size] @ transposed).tocsr()
+            # top_k() breaks ties by position, so the columns must be in snippet id order
+            block.sort_indices()
+            neighbours = []
+            for offset in range(block.shape[0]):
+                row = start + offset
+                cols = block.indices[block.indptr[offset]:block.indptr[offset + 1]]
+                scores = block.data[block.indptr[offset]:block.indptr[offset + 1]].copy()
+                scores[cols == row] = 0
+                for position in top_k(scores, top_k_size):
+                    neighbours.append(SnippetNeighbour(
+                        snippet_id=int(snippet_ids[row]),
+                        neighbour_id=int(snippet_ids[cols[position]]),
+                        score=float(scores[position]),
+                    ))
+            SnippetNeighbour.objects.bulk_create(neighbours, batch_size=BATCH_SIZE)
+            written += len(neighbours)
+    return written
+
+
+def update_snippet_neighbours(snippet, top_k_size=TOP_K):
+    """
+    Incrementally refreshes the neighbours of ``snippet`` after its tags or language changed,
+    and offers it as a neighbour to the snippets it is now similar to.
+
+    This runs inside the save request, so it only scores a bounded sample (see
+    _candidate_ids()) and touches only the neighbour lists of that sample. Until the next full
+    rebuild (``manage.py rebuild_similarity``), a snippet can miss an older neighbour outside
+    the sample, and snippets that lose ``snippet`` as a neighbour keep a shorter list.
+    """
+    candidate_ids = _candidate_ids(snippet)
+    snippet_rows = []
+    tag_rows = []
+    for chunk in _chunks(candidate_ids):
+        snippet_rows.extend(Snippet.objects.filter(pk__in=chunk).order_by().values_list('pk', 'language_id'))
+        tag_rows.extend(SnippetTag.objects.filter(snippet_id__in=chunk).order_by().values_list('snippet_id', 'tag_id'))
+    snippet_ids, matrix = build_feature_matrix(snippet_rows, tag_rows)
+    row = int(np.searchsorted(snippet_ids, snippet.pk))
+    scores = (matrix @ matrix[row].T).toarray().ravel()
+    scores[row] = 0
+
+    own_neighbours = [
+        SnippetNeighbour(snippet_id=snippet.pk, neighbour_id=int(snippet_ids[col]), score=float(scores[col]))
+        for col in top_k(scores, top_k_size)
+    ]
+    similar = {int(snippet_ids[col]): float(scores[col]) for col in np.flatnonzero(scores > 0)}
+
+    with transaction.atomic():
+        SnippetNeighbour.objects.filter(snippet=snippet).delete()
+        SnippetNeighbour.objects.filter(neighbour=snippet).delete()
+        entered, full = _entered_lists(snippet.pk, similar, top_k_size)
+        reverse_neighbours = [
+            SnippetNeighbour(snippet_id=snippet_id, neighbour_id=snippet.pk, score=similar[snippet_id])
+            for snippet_id in entered
+        ]
+        SnippetNeighbour.objects.bulk_create(own_neighbours + reverse_neighbours, batch_size=BATCH_SIZE)
+        _prune_neighbours(full, top_k_size)
+
+
+def _candidate_ids(snippet):
+    """
+    Returns the sorted ids of the snippets to score ``snippet`` against: the most recently
+    updated snippets of its language and the newest snippets of each of its tags. Both walk an
+    index, so the sample stays bounded however many snippets a language or tag has.
+    """
+    ids = {snippet.pk}
+    ids.update(
+        Snippet.objects.filter(language_id=snippet.language_id).order_by(*Snippet.KEYSET_ORDERING)
+        .values_list('pk', flat=True)[:MAX_LANGUAGE_CANDIDATES]
+    )
+    for tag_id in snippet.snippet_tags.values_list('tag_id', flat=True):
+        ids.update(
+            SnippetTag.objects.filter(tag_id=tag_id).order_by('-snippet_id')
+            .values_list('snippet_id', flat=True)[:MAX_TAG_CANDIDATES]
+        )
+    return sorted(ids)
+
+
+def _chunks(ids):
+    # Keeps IN lists under the database's parameter limit
+    for start in range(0, len(ids), QUERY_CHUNK_SIZE):
+        yield ids[start:start + QUERY_CHUNK_SIZE]
+
+
+def _entered_lists(snippet_id, scores, top_k_size):
+    """
+    Returns the ids of the snippets whose neighbour list ``snippet_id`` enters with the given
+    ``scores``, and the subset of those whose list is already full and needs pruning.
+    """
+    lists = {}
+    for chunk in _chunks(sorted(scores)):
+        rows = SnippetNeighbour.objects.filter(snippet_id__in=chunk).order_by().values('snippet_id') \
+            .annotate(size=Count('id'), lowest=Min('score'))
+        lists.update((row['snippet_id'], (row['size'], row['lowest'])) for row in rows)
+    entered = []
+    tied = []
+    for other_id, score in scores.items():
+        size, lowest = lists.get(other_id, (0, None))
+        if size < top_k_size or score > lowest:
+            entered.append(other_id)
+        elif score == lowest:
+            tied.append(other_id)
+    # On a tie with the worst entry the lower snippet id wins, as in top_k()
+    highest_tied = {}
+    for chunk in _chunks(sorted(tied)):
+        rows = SnippetNeighbour.objects.filter(snippet_id__in=chunk).order_by() \
+            .values_list('snippet_id', 'neighbour_id', 'score')
+        for other_id, neighbour_id, score in rows:
+            if score == lists[other_id][1]:
+                highest_tied[other_id] = max(highest_tied.get(other_id, 0), neighbour_id)
+    entered.extend(other_id for other_id in tied if snippet_id < highest_tied[other_id])
+    full = [other_id for other_id in entered if lists.get(other_id, (0, None))[0] >= top_k_size]
+    return entered, full
+
+
+def _prune_neighbours(snippet_ids, top_k_size):
+    """
+    Trims the neighbour lists of ``snippet_ids`` back to their ``top_k_size`` best entries.
+    """
+    for chunk in _chunks(snippet_ids):
+        rows = SnippetNeighbour.objects.filter(snippet_id__in=chunk).order_by(
+            'snippet_id', '-score', 'neighbour_id'
+        ).values_list('pk', 'snippet_id')
+        kept = {}
+        stale = []
+        for pk, snippet_id in rows:
+            kept[snippet_id] = kept.get(snippet_id, 0) + 1
+            if kept[snippet_id] > top_k_size:
+                stale.append(pk)
+        if stale:
+            SnippetNeighbour.objects.filter(pk__in=stale).delete()
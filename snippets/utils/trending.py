@@ -0,0 +1,167 @@
+"""
+Time-decayed "trending" ranking.
+
+Rating changes are counted per snippet and hour in RatingBucket rows, written by
+Snippet.adjust_counters() next to the all-time like/dislike counters. A trending window only
+reads the buckets that started inside it (a range scan of the ``start`` index). Each bucket
+is weighed by its age with an exponential decay, so a like from an hour ago counts for more
+than one from last week. Rankings are cached per window for TRENDING_CACHE_TTL seconds,
+so the buckets of a window are summed once per TTL rather than on every request. compact()
+rolls hourly buckets older than COMPACT_AFTER up into daily ones and drops the buckets no
+window reaches any more.
+"""
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from ratings.models import Rating, RatingBucket
+from snippets.models import Snippet
+
+# Window name: (length, half-life of a vote's weight)
+WINDOWS = {
+    '24h': (datetime.timedelta(hours=24), datetime.timedelta(hours=6)),
+    '7d': (datetime.timedelta(days=7), datetime.timedelta(days=1)),
+    '30d': (datetime.timedelta(days=30), datetime.timedelta(days=7)),
+}
+DEFAULT_WINDOW = '24h'
+COMPACT_AFTER = datetime.timedelta(days=2)
+RETENTION = max(length for length, _ in WINDOWS.values())
+BATCH_SIZE = 1000
+CACHE_ALIAS = 'trending'
+
+
+def bucket_start(moment, span=RatingBucket.HOUR):
+    moment = moment.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if span == RatingBucket.DAY else moment
+
+
+def record(snippet_id, likes=0, dislikes=0, moment=None):
+    """
+    Adds like and dislike changes to the snippet's bucket for the current hour.
+    """
+    if not likes and not dislikes:
+        return
+    start = bucket_start(moment or timezone.now())
+    buckets = RatingBucket.objects.filter(snippet_id=snippet_id, start=start)
+    if buckets.update(likes=F('likes') + likes, dislikes=F('dislikes') + dislikes):
+        return
+    try:
+        with transaction.atomic():
+            RatingBucket.objects.create(snippet_id=snippet_id, start=start, likes=likes, dislikes=dislikes)
+    except IntegrityError:
+        # Another request created the bucket in the meantime
+        buckets.update(likes=F('likes') + likes, dislikes=F('dislikes') + dislikes)
+
+
+def trending_scores(window=DEFAULT_WINDOW, now=None):
+    """
+    Returns the decayed likes-minus-dislikes score of every snippet rated within ``window``.
+    """
+    length, half_life = WINDOWS[window]
+    now = now or timezone.now()
+    buckets = RatingBucket.objects.filter(start__gte=now - length).values_list(
+        'snippet_id', 'start', 'span', 'likes', 'dislikes'
+    )
+    scores = defaultdict(float)
+    for snippet_id, start, span, likes, dislikes in buckets.iterator(chunk_size=BATCH_SIZE):
+        # Age of the middle of the bucket
+        age = max((now - start).total_seconds() - span / 2, 0)
+        scores[snippet_id] += (likes - dislikes) * 0.5 ** (age / half_life.total_seconds())
+    return scores
+
+
+def get_trending_snippets(window=DEFAULT_WINDOW, limit=10, now=None):
+    """
+    Returns the ``limit`` snippets with the best positive score in ``window``, best first,
+    each with its score as ``trending_score``. Rankings as of now are cached.
+    """
+    if now is None:
+        cache = caches[CACHE_ALIAS]
+        key = f'trending:{window}:{limit}'
+        best = cache.get(key)
+        if best is None:
+            best = _ranking(window, limit, timezone.now())
+            cache.set(key, best, settings.TRENDING_CACHE_TTL)
+    else:
+        best = _ranking(window, limit, now)
+    snippets = Snippet.objects.select_related('author').order_by().in_bulk([snippet_id for _, snippet_id in best])
+    trending = []
+    for score, snippet_id in best:
+        if snippet_id in snippets:
+            snippets[snippet_id].trending_score = score
+            trending.append(snippets[snippet_id])
+    return trending
+
+
+def _ranking(window, limit, now):
+    scores = trending_scores(window, now)
+    return heapq.nlargest(limit, ((score, snippet_id) for snippet_id, score in scores.items() if score > 0))
+
+
+def _write_buckets(rows, span):
+    batch = []
+    written = 0
+    for snippet_id, start, likes, dislikes in rows:
+        batch.append(RatingBucket(snippet_id=snippet_id, start=start, span=span, likes=likes, dislikes=dislikes))
+        if len(batch) == BATCH_SIZE:
+            RatingBucket.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    RatingBucket.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def compact(now=None):
+    """
+    Rolls whole days of hourly buckets older than COMPACT_AFTER up into daily buckets and
+    drops buckets older than RETENTION. Returns (hourly buckets rolled up, daily buckets
+    written, buckets dropped).
+    """
+    now = now or timezone.now()
+    cutoff = bucket_start(now - COMPACT_AFTER, RatingBucket.DAY)
+    with transaction.atomic():
+        dropped, _ = RatingBucket.objects.filter(start__lt=now - RETENTION).delete()
+        hourly = RatingBucket.objects.filter(span=RatingBucket.HOUR, start__lt=cutoff)
+        first_hour = hourly.aggregate(first=Min('start'))['first']
+        if first_hour is None:
+            return 0, 0, dropped
+
+        # Daily buckets already on those days are merged in too
+        days = RatingBucket.objects.filter(start__gte=bucket_start(first_hour, RatingBucket.DAY), start__lt=cutoff)
+        rows = list(
+            days.annotate(day=TruncDay('start', tzinfo=datetime.timezone.utc))
+            .values('snippet_id', 'day')
+            .annotate(total_likes=Sum('likes'), total_dislikes=Sum('dislikes'))
+            .values_list('snippet_id', 'day', 'total_likes', 'total_dislikes')
+            .order_by()
+        )
+        rolled_up = hourly.count()
+        days.delete()
+        written = _write_buckets(rows, RatingBucket.DAY)
+    return rolled_up, written, dropped
+
+
+def rebuild(now=None):
+    """
+    Recomputes the hourly buckets of the last RETENTION from the ratings table, e.g. after a
+    bulk import. Returns the number of buckets written; compact() rolls up the older ones.
+    """
+    now = now or timezone.now()
+    rows = (
+        Rating.objects.filter(date__gte=now - RETENTION)
+        .annotate(start=TruncHour('date', tzinfo=datetime.timezone.utc))
+        .values('snippet_id', 'start')
+        .annotate(likes=Count('id', filter=Q(rating=Rating.LIKE)), dislikes=Count('id', filter=Q(rating=Rating.DISLIKE)))
+        .values_list('snippet_id', 'start', 'likes', 'dislikes')
+        .order_by()
+    )
+    with transaction.atomic():
+        RatingBucket.objects.all().delete()
+        return _write_buckets(rows.iterator(chunk_size=BATCH_SIZE), RatingBucket.HOUR)
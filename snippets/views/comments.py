@@ -16,6 +16,7 @@ def add_comment_view(request, snippet_id):
             comment.snippet = snippet
             comment.author = request.user
             comment.save()
+            Snippet.adjust_counters(snippet.pk, comment_count=1)
             messages.success(request, 'Your comment has been added successfully.')
         else:
             messages.error(request, 'Failed to add comment. Fill the form.')
@@ -30,6 +31,7 @@ def delete_comment_view(request, comment_id):
     if (request.user == comment.author or request.user.groups.filter(name='Moderator').exists() or
             request.user == comment.snippet.author):
         comment.delete()
+        Snippet.adjust_counters(comment.snippet_id, comment_count=-1)
         messages.success(request, 'Comment deleted successfully')
     else:
         messages.error(request, 'You do not have permission to delete this comment.')
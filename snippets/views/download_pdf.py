@@ -1,15 +1,18 @@
-import os
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.shortcuts import get_object_or_404, redirect
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.template.loader import render_to_string
-from xhtml2pdf import pisa
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 import logging
 
 from snippets.models import Snippet
+from snippets.utils import pdf_cache
+from snippets.utils.pdf_render import PDFQueueFull, PDFRenderError, get_render_stats, render_pdf
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -31,25 +34,37 @@ def get_static_content(path):
     return ""
 
 
-def render_to_pdf(template_src, context_dict={}):
+def render_pdf_bytes(template_src, context_dict):
     """
-    A helper function to render a Django template to a PDF file.
-    This encapsulates the pisa logic, making the view cleaner.
+    Renders a Django template to PDF in the render pool and returns the bytes.
+    Raises PDFRenderError (or PDFQueueFull when the pool is saturated) on failure.
     """
-    template = render_to_string(template_src, context_dict)
-    response = HttpResponse(content_type='application/pdf')
-    pisa_status = pisa.CreatePDF(template, dest=response)
-    if pisa_status.err:
-        return None, pisa_status.err
-    return response, None
+    return render_pdf(render_to_string(template_src, context_dict))
+
+
+def open_snippet_pdf(snippet, pygments_css):
+    """
+    Returns the snippet's PDF opened for reading, rendering it into the cache if needed.
+    """
+    context = {
+        'snippet': snippet,
+        'pygments_css': pygments_css,  # Pass the CSS content to the template
+    }
+    return pdf_cache.open_pdf(snippet, lambda: render_pdf_bytes('snippets/snippet_pdf.html', context))
 
 
 @login_required
 def download_pdf_view(request, snippet_id):
     """
     A view to generate and download a PDF of a code snippet.
+    PDFs are cached on disk until the snippet changes, see snippets.utils.pdf_cache.
     """
-    snippet = get_object_or_404(Snippet, pk=snippet_id)
+    snippet = get_object_or_404(Snippet.objects.select_related('author'), pk=snippet_id)
+    etag = quote_etag(pdf_cache.pdf_cache_key(snippet))
+    last_modified = int(snippet.update_date.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
 
     # Use the pre-highlighted code directly from the model, avoiding redundant work.
     # Get the CSS content from your static file to be inlined.
@@ -59,14 +74,16 @@ def download_pdf_view(request, snippet_id):
         messages.error(request, "Pygments CSS file could not be found.")
         return redirect('snippet_detail', pk=snippet_id)
 
-    context = {
-        'snippet': snippet,
-        'pygments_css': pygments_css,  # Pass the CSS content to the template
-    }
-
-    pdf_response, err = render_to_pdf('snippets/snippet_pdf.html', context)
-
-    if err:
+    try:
+        pdf_file = open_snippet_pdf(snippet, pygments_css)
+    except PDFQueueFull:
+        # Shed load quickly rather than tying up this worker behind the render queue
+        response = HttpResponse(
+            "PDF generation is busy, please retry shortly.", status=503, content_type='text/plain'
+        )
+        response['Retry-After'] = str(settings.PDF_RENDER_RETRY_AFTER)
+        return response
+    except PDFRenderError as err:
         # Log the error for debugging purposes
         logger.error(f"PDF generation error for snippet {snippet_id}: {err}")
 
@@ -74,7 +91,17 @@ def download_pdf_view(request, snippet_id):
         messages.error(request, "Sorry, we couldn't generate the PDF. Please try again later.")
         return redirect('snippet_detail', pk=snippet_id)
 
-    # Set the filename for the downloaded PDF
-    pdf_response['Content-Disposition'] = f'attachment; filename="{snippet.title}.pdf"'
+    # Stream the cached file under the snippet's title
+    pdf_response = FileResponse(
+        pdf_file, as_attachment=True, filename=f'{snippet.title}.pdf', content_type='application/pdf'
+    )
+    pdf_response['ETag'] = etag
+    pdf_response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(pdf_response, private=True, no_cache=True)
+
+    return pdf_response
+
 
-    return pdf_response
\ No newline at end of file
+@staff_member_required
+def pdf_render_stats_view(request):
+    return JsonResponse(get_render_stats())
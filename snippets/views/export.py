@@ -0,0 +1,66 @@
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from snippets.models import Snippet
+from snippets.utils.export import iter_zip, snippet_entries
+from snippets.utils.pdf_render import PDFQueueFull, PDFRenderError
+from snippets.views.download_pdf import get_static_content, open_snippet_pdf
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 100
+
+
+def _pdf_opener():
+    """
+    Returns a function opening a snippet's PDF for the archive, or None when PDFs can't be made.
+    A PDF that can't be rendered right away, because it fails or the render queue is full, is
+    left out and listed in the archive's manifest rather than holding up this request.
+    """
+    pygments_css = get_static_content('css/pygments.css')
+    if not pygments_css:
+        return None
+
+    def open_pdf(snippet):
+        try:
+            return open_snippet_pdf(snippet, pygments_css)
+        except PDFQueueFull:
+            return 'PDF generation was busy; download the PDF from the snippet page or export again later.'
+        except PDFRenderError as err:
+            logger.error(f"PDF export error for snippet {snippet.pk}: {err}")
+            return 'the PDF could not be generated.'
+
+    return open_pdf
+
+
+def export_response(request, snippets, name):
+    """
+    Streams a ZIP of the source files (and with ``?pdf=1`` the PDFs) of ``snippets``.
+    """
+    snippets = snippets.select_related('author', 'language').order_by('pk').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    open_pdf = _pdf_opener() if request.GET.get('pdf') == '1' else None
+    response = StreamingHttpResponse(iter_zip(snippet_entries(snippets, open_pdf)), content_type='application/zip')
+    filename = f'{name}-{timezone.now():%Y%m%d}.zip'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def export_snippets_view(request):
+    """
+    Downloads the user's own snippets as a ZIP archive.
+    """
+    return export_response(request, Snippet.objects.filter(author=request.user), f'{request.user.username}-snippets')
+
+
+@login_required
+def export_bookmarks_view(request):
+    """
+    Downloads the snippets the user bookmarked as a ZIP archive.
+    """
+    return export_response(
+        request, Snippet.objects.filter(bookmarks__user=request.user).distinct(), f'{request.user.username}-bookmarks'
+    )
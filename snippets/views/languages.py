@@ -1,8 +1,11 @@
 from django.shortcuts import render
 
 # Create your views here.
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
-from snippets.models import Language
+from snippets.models import Language, Snippet
+from snippets.utils.conditional import conditional_page, snippets_stamps
+from snippets.utils.pagination import paginate_keyset
 
 
 class LanguageListView(ListView):
@@ -12,12 +15,18 @@ class LanguageListView(ListView):
     context_object_name = 'languages'
 
 
+@method_decorator(conditional_page(snippets_stamps), name='dispatch')
 class LanguageDetailView(DetailView):
     model = Language
     template_name = 'snippets/templates/languages/language_detail.html'
     context_object_name = 'language'
+    paginate_by = 20
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['snippets'] = self.object.snippets.all()
+        page = paginate_keyset(
+            self.request, self.object.snippets.for_list(), Snippet.KEYSET_ORDERING, self.paginate_by
+        )
+        context['page_obj'] = page
+        context['snippets'] = page.object_list
         return context
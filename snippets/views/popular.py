@@ -1,27 +1,40 @@
 from django.views.generic import ListView
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.utils.decorators import method_decorator
 
-from snippets.models import Snippet
+from snippets.models import Language, LeaderboardEntry
+from snippets.utils.concurrency import ThreadedGetMixin
+from snippets.utils.conditional import conditional_page, leaderboard_stamps
+from snippets.utils.leaderboards import top_entries, with_objects
 
 
-class TopAuthorsView(ListView):
+@method_decorator(conditional_page(leaderboard_stamps), name='get')
+class TopAuthorsView(ThreadedGetMixin, ListView):
     model = User
     template_name = 'snippets/templates/popular/top_authors.html'
     context_object_name = 'popular_top_authors_list'
     paginate_by = 10
 
     def get_queryset(self):
-        queryset = User.objects.annotate(snippet_count=Count('snippets')).order_by('-snippet_count')
-        queryset = queryset.exclude(snippet_count=0)
-        return queryset
+        return top_entries(LeaderboardEntry.TOP_AUTHORS)
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['popular_top_authors_list'] = with_objects(context['object_list'], User.objects, 'snippet_count')
+        return context
 
-class TopLanguagesView(ListView):
-    model = Snippet
+
+@method_decorator(conditional_page(leaderboard_stamps), name='get')
+class TopLanguagesView(ThreadedGetMixin, ListView):
+    model = Language
     template_name = 'snippets/templates/popular/top_languages.html'
     context_object_name = 'top_languages_list'
     paginate_by = 10
 
     def get_queryset(self):
-        return Snippet.objects.values('language__name').annotate(snippet_count=Count('id')).order_by('-snippet_count')
+        return top_entries(LeaderboardEntry.TOP_LANGUAGES)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['top_languages_list'] = with_objects(context['object_list'], Language.objects, 'snippet_count')
+        return context
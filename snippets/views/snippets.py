@@ -1,3 +1,12 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.utils.html import format_html
 from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView
 from django import forms
@@ -8,35 +17,46 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView
 from snippets.models import Snippet
 from snippets.forms.search_input_forms import SnippetSearchForm
-from snippets.utils.recommendations import get_user_recommendations, get_similar_snippets
+from snippets.utils.conditional import conditional_page, snippet_detail_stamps
+from snippets.utils.concurrency import ThreadedGetMixin, gather_lookups
+from snippets.utils.fragments import get_versions, missing_fragments
+from snippets.utils.recommendation_cache import get_cached_user_recommendations, get_cache_stats
+from snippets.utils.minhash import DUPLICATE_THRESHOLD, get_similar_code
+from snippets.utils.pagination import KeysetPaginationMixin
+from snippets.utils.recommendations import get_similar_snippets
+from snippets.utils.search import MAX_RESULTS, search_snippets
 
 
-class SnippetListView(ListView):
+class SnippetListView(ThreadedGetMixin, KeysetPaginationMixin, ListView):
     model = Snippet
     template_name = 'snippets/snippet_list.html'
     context_object_name = 'snippets'
     paginate_by = 20
+    keyset_ordering = Snippet.KEYSET_ORDERING
 
     # Store recommended snippets in an instance variable
     recommended_snippets = None
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().for_list()
         query = self.request.GET.get('q', '').strip()
 
         # Get recommendations first if the user is authenticated
         user = self.request.user
+        recommended_ids = []
         if user.is_authenticated:
             # We'll call the recommendation function here
             # and store the result for use in get_context_data
-            self.recommended_snippets = get_user_recommendations(user, top_n=5)
-            # Exclude the recommended snippets from the main queryset before pagination
-            if self.recommended_snippets:
-                recommended_ids = [s.pk for s in self.recommended_snippets]
-                queryset = queryset.exclude(pk__in=recommended_ids)
+            self.recommended_snippets = get_cached_user_recommendations(user, top_n=5)
+            recommended_ids = [s.pk for s in self.recommended_snippets]
 
         if query:
-            queryset = queryset.filter(title__icontains=query)
+            # Full-text search, ranked by relevance instead of recency
+            return search_snippets(queryset, query, recommended_ids)
+
+        # Exclude the recommended snippets from the main queryset before pagination
+        if recommended_ids:
+            queryset = queryset.exclude(pk__in=recommended_ids)
 
         return queryset
 
@@ -48,24 +68,79 @@ class SnippetListView(ListView):
             context['recommended_snippets'] = self.recommended_snippets
 
         context['search_form'] = SnippetSearchForm(self.request.GET)
+        # Only the best ranked matches are listed, say so rather than hide the rest
+        if getattr(self.object_list, 'truncated', False):
+            context['search_limit'] = MAX_RESULTS
 
         return context
 
 
+@method_decorator(conditional_page(snippet_detail_stamps), name='get')
 class SnippetDetailView(DetailView):
     model = Snippet
     template_name = 'snippets/snippet_detail.html'
     context_object_name = 'snippet'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('author', 'language')
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except Snippet.DoesNotExist:
+            raise Http404('No snippet found matching the query.')
+        context = await sync_to_async(self.get_context_data)(object=self.object)
+
+        # Per-user state and the lists of the fragments that are not cached, all at once
+        lookups = self.get_lookups(context['user'], context['missing_fragments'])
+        context.update(zip(lookups, await gather_lookups(*lookups.values())))
+        self.object.user_rating = context.get('user_rating')
+        return self.render_to_response(context)
+
+    def get_lookups(self, user, missing_fragments):
+        """
+        Returns the blocking lookups the page still needs, by context name.
+        """
+        snippet = self.object
+        lookups = {}
+        if user.is_authenticated:
+            lookups['bookmarked'] = user.bookmarks.filter(snippet=snippet).exists
+            lookups['user_rating'] = snippet.ratings.filter(user=user).values_list('rating', flat=True).first
+            if 'snippet_sidebar' in missing_fragments:
+                # Use the user-aware version of get_similar_snippets
+                lookups['recommended_snippets'] = partial(get_similar_snippets, snippet, user=user)
+        if 'snippet_sidebar' in missing_fragments:
+            lookups['similar_code_snippets'] = partial(get_similar_code, snippet)
+        if 'snippet_comments' in missing_fragments:
+            lookups['comments'] = partial(list, snippet.comments.select_related('author'))
+        return lookups
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        snippet = self.get_object()
+        snippet = self.object
         user = self.request.user
         context['user'] = user
-        context['bookmarked'] = user.is_authenticated and user.bookmarks.filter(snippet=snippet).exists()
+        context['bookmarked'] = False
+
+        # Only evaluated if a fragment reported cached has been evicted before rendering
+        context['recommended_snippets'] = SimpleLazyObject(lambda: get_similar_snippets(snippet, user=user))
+        context['similar_code_snippets'] = SimpleLazyObject(lambda: get_similar_code(snippet))
+        context['comments'] = snippet.comments.select_related('author')
 
-        # Use the user-aware version of get_similar_snippets
-        context['recommended_snippets'] = get_similar_snippets(snippet, user=user)
+        # Who the comment delete buttons are rendered for
+        if user == snippet.author or user.is_staff:
+            comment_viewer = 'moderator'
+        else:
+            comment_viewer = user.pk if user.is_authenticated else 'anonymous'
+        versions = get_versions(snippet.pk, user.pk if user.is_authenticated else None)
+        updated = snippet.update_date.isoformat()
+        context['fragment_vary'] = {
+            'snippet_body': f'{snippet.pk}:{updated}',
+            'snippet_sidebar': f'{snippet.pk}:{updated}:{user.pk}:{versions["snippets"]}:{versions.get("ratings")}',
+            'snippet_comments': f'{snippet.pk}:{updated}:{versions["comments"]}:{comment_viewer}',
+        }
+        context['missing_fragments'] = missing_fragments(context['fragment_vary'])
+        context['sidebar_cache_ttl'] = settings.SIDEBAR_CACHE_TTL
         return context
 
 
@@ -84,6 +159,13 @@ class AddSnippetView(LoginRequiredMixin, CreateView):
         form.instance.author = self.request.user
         response = super().form_valid(form)
         messages.success(self.request, 'Snippet created successfully.')
+
+        duplicates = get_similar_code(self.object, threshold=DUPLICATE_THRESHOLD, limit=1)
+        if duplicates:
+            messages.warning(self.request, format_html(
+                'This code looks very similar to <a href="{}">{}</a>.',
+                duplicates[0].get_absolute_url(), duplicates[0].title,
+            ))
         return response
 
     def get_success_url(self):
@@ -122,4 +204,9 @@ def edit_snippet_view(request, pk):
     else:
         form = AddSnippetForm(instance=snippet)
 
-    return render(request, 'snippets/edit_snippet.html', {'form': form})
\ No newline at end of file
+    return render(request, 'snippets/edit_snippet.html', {'form': form})
+
+
+@staff_member_required
+def recommendation_cache_stats_view(request):
+    return JsonResponse(get_cache_stats())
@@ -0,0 +1,84 @@
+from collections import Counter
+
+from django.contrib import admin
+from django.db.models import Avg, Count, Max, Sum
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+
+from tatum24.models import ProfiledRequest
+from tatum24.profiling import format_collapsed, hot_paths, parse_collapsed
+
+# Most recent profiles of a view merged into the hot-path report
+HOT_PATH_MAX_PROFILES = 500
+
+
+@admin.register(ProfiledRequest)
+class ProfiledRequestAdmin(admin.ModelAdmin):
+    list_display = ('created', 'method', 'view_name', 'status_code', 'duration_ms', 'sample_count')
+    list_filter = ('view_name', 'status_code')
+    search_fields = ('path', 'view_name')
+    date_hierarchy = 'created'
+    readonly_fields = [field.name for field in ProfiledRequest._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('hot-paths/', self.admin_site.admin_view(self.hot_paths_view), name='tatum24_profiledrequest_hot_paths'),
+            path('collapsed/', self.admin_site.admin_view(self.collapsed_view), name='tatum24_profiledrequest_collapsed'),
+        ] + super().get_urls()
+
+    def profiles(self, request):
+        """
+        Returns the profiles selected by the ``view`` and ``days`` query parameters.
+        """
+        try:
+            days = int(request.GET.get('days', 7))
+        except ValueError:
+            days = 7
+        profiles = ProfiledRequest.objects.filter(created__gte=timezone.now() - timezone.timedelta(days=days))
+        if request.GET.get('view'):
+            profiles = profiles.filter(view_name=request.GET['view'])
+        return profiles, days
+
+    def merged_stacks(self, profiles):
+        stacks = Counter()
+        for text in profiles.values_list('stacks', flat=True)[:HOT_PATH_MAX_PROFILES]:
+            stacks.update(parse_collapsed(text))
+        return stacks
+
+    def hot_paths_view(self, request):
+        profiles, days = self.profiles(request)
+        views = (
+            profiles.values('view_name')
+            .annotate(requests=Count('id'), avg_ms=Avg('duration_ms'), max_ms=Max('duration_ms'),
+                      samples=Sum('sample_count'))
+            .order_by('-samples')
+        )
+        view_name = request.GET.get('view')
+        stacks, leaves = hot_paths(self.merged_stacks(profiles)) if view_name else ([], [])
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Hot paths: {view_name}' if view_name else 'Hot paths',
+            'views': views,
+            'view_name': view_name,
+            'days': days,
+            'stacks': stacks,
+            'leaves': leaves,
+            'collapsed_url': reverse('admin:tatum24_profiledrequest_collapsed'),
+        }
+        return TemplateResponse(request, 'admin/tatum24/hot_paths.html', context)
+
+    def collapsed_view(self, request):
+        """
+        Merged stacks as collapsed-stack text for flamegraph.pl or speedscope.
+        """
+        profiles, _ = self.profiles(request)
+        response = HttpResponse(format_collapsed(self.merged_stacks(profiles)), content_type='text/plain; charset=utf-8')
+        name = (request.GET.get('view') or 'all').replace(':', '-')
+        response['Content-Disposition'] = f'attachment; filename="{name}.collapsed.txt"'
+        return response
@@ -0,0 +1,193 @@
+"""
+End-to-end benchmark of the hot views.
+
+Each scenario issues requests through the Django test client (full middleware, URL
+routing, templates and database, no network). It records every request's latency and
+query count, and the report summarises them as percentiles in JSON so two runs can be
+compared with ``compare_reports``. Query counts come from the request's QueryStats, which
+include the lookups a view runs on worker threads and on replica connections.
+"""
+import platform
+import random
+import subprocess
+import time
+
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from bookmarks.models import Bookmark
+from ratings.models import Rating
+from snippets.models import Comment, Snippet
+from snippets.utils.pagination import encode_cursor
+from snippets.utils.recommendations import get_similar_snippets, get_user_recommendations
+from tatum24.middleware import QueryStats
+
+PERCENTILES = (50, 90, 99)
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Scenario:
+    """
+    A named benchmark step; ``run(client)`` performs one measured operation and returns the
+    response when it made a request.
+    """
+
+    def __init__(self, name, run, login=False):
+        self.name = name
+        self.run = run
+        self.login = login
+
+
+def _get(path, **params):
+    def run(client):
+        response = client.get(path, params)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise BenchmarkError(f'GET {path} answered {response.status_code}')
+        return response
+    return run
+
+
+def build_scenarios(snippet_ids, user, rng):
+    """
+    Returns the default scenarios, picking random snippets from ``snippet_ids``.
+    """
+    def random_snippet():
+        return snippet_ids[rng.randrange(len(snippet_ids))]
+
+    def detail(client):
+        return _get(reverse('snippet_detail', args=[random_snippet()]))(client)
+
+    def pdf(client):
+        return _get(reverse('download_pdf', args=[random_snippet()]))(client)
+
+    def similar(client):
+        list(get_similar_snippets(Snippet.objects.get(pk=random_snippet()), user))
+
+    def recommendations(client):
+        list(get_user_recommendations(user))
+
+    deep_snippet = Snippet.objects.order_by(*Snippet.KEYSET_ORDERING).values_list(
+        'update_date', 'pub_date', 'id'
+    )[min(len(snippet_ids) - 1, 10000)]
+    deep_cursor = encode_cursor('next', list(deep_snippet))
+
+    return [
+        Scenario('snippet_list', _get(reverse('snippet_list'))),
+        Scenario('snippet_list_deep_page', _get(reverse('snippet_list'), cursor=deep_cursor)),
+        Scenario('snippet_list_search', _get(reverse('snippet_list'), q='parse')),
+        Scenario('snippet_list_logged_in', _get(reverse('snippet_list')), login=True),
+        Scenario('snippet_detail', detail),
+        Scenario('snippet_detail_logged_in', detail, login=True),
+        Scenario('top_rated_snippets', _get(reverse('top_rated_snippets'))),
+        Scenario('most_bookmarked', _get(reverse('most_bookmarked'))),
+        Scenario('similar_snippets', similar),
+        Scenario('user_recommendations', recommendations),
+        Scenario('download_pdf', pdf, login=True),
+    ]
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=float)
+    summary = {f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}
+    summary.update(mean=float(values.mean()), max=float(values.max()))
+    return summary
+
+
+def measure(scenario, client, iterations, warmup):
+    """
+    Runs a scenario and returns its latency (milliseconds) and query count summaries.
+    """
+    for _ in range(warmup):
+        scenario.run(client)
+    latencies, queries = [], []
+    for _ in range(iterations):
+        # Scenarios that call a function directly only query on this thread
+        stats = QueryStats()
+        with stats.track():
+            started = time.perf_counter()
+            response = scenario.run(client)
+            latencies.append((time.perf_counter() - started) * 1000)
+        request = getattr(response, 'wsgi_request', None)
+        queries.append(getattr(request, 'query_stats', stats).count)
+    return {
+        'iterations': iterations,
+        'latency_ms': _summary(latencies),
+        'queries': _summary(queries),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(iterations=50, warmup=5, only=None, seed=0, host='localhost', progress=None):
+    """
+    Runs the scenarios (all, or those named in ``only``) and returns the report dict.
+    """
+    snippet_ids = list(Snippet.objects.values_list('id', flat=True))
+    user = User.objects.filter(ratings__isnull=False).first() or User.objects.first()
+    if not snippet_ids or user is None:
+        raise BenchmarkError('The benchmark needs snippets and users; run generate_data first.')
+
+    rng = random.Random(seed)
+    anonymous = Client(SERVER_NAME=host)
+    logged_in = Client(SERVER_NAME=host)
+    logged_in.force_login(user)
+
+    results = {}
+    for scenario in build_scenarios(snippet_ids, user, rng):
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = measure(scenario, logged_in if scenario.login else anonymous, iterations, warmup)
+        if progress is not None:
+            progress(scenario.name, results[scenario.name])
+
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'rows': {
+                'users': User.objects.count(),
+                'snippets': len(snippet_ids),
+                'ratings': Rating.objects.count(),
+                'comments': Comment.objects.count(),
+                'bookmarks': Bookmark.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare_reports(baseline, current, metric='p50'):
+    """
+    Returns (scenario, baseline ms, current ms, relative change, baseline queries, current queries)
+    rows for the scenarios present in both reports.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        old, new = before['latency_ms'][metric], result['latency_ms'][metric]
+        rows.append((name, old, new, (new - old) / old if old else 0.0,
+                     before['queries'][metric], result['queries'][metric]))
+    return rows
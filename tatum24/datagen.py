@@ -0,0 +1,161 @@
+"""
+Synthetic data for load testing.
+
+Records are generated as NDJSON and loaded through the bulk importer
+(snippets.utils.ndjson), so millions of rows take minutes. Tags follow a Zipf distribution
+like real tags do: a few are everywhere and most are rare. A share of snippets are
+near-copies of earlier ones, which gives the similar-code index something to find.
+"""
+import json
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db.models import Max
+from django.utils import timezone
+
+from bookmarks.models import Bookmark
+from snippets.models import Comment, Snippet
+
+LANGUAGES = [
+    ('Python', 'python', 'python'),
+    ('JavaScript', 'javascript', 'javascript'),
+    ('Go', 'go', 'go'),
+    ('Java', 'java', 'java'),
+    ('Ruby', 'ruby', 'ruby'),
+    ('Rust', 'rust', 'rust'),
+]
+CODE_TEMPLATES = {
+    'python': 'def {name}({arg}):\n    total = 0\n    for item in {arg}:\n        total += item * {num}\n    return total\n',
+    'javascript': 'function {name}({arg}) {{\n  return {arg}.map((x) => x * {num}).filter(Boolean);\n}}\n',
+    'go': 'func {name}({arg} []int) int {{\n\tsum := 0\n\tfor _, v := range {arg} {{\n\t\tsum += v * {num}\n\t}}\n\treturn sum\n}}\n',
+    'java': 'public static int {name}(int[] {arg}) {{\n    int sum = 0;\n    for (int v : {arg}) sum += v * {num};\n    return sum;\n}}\n',
+    'ruby': 'def {name}({arg})\n  {arg}.sum {{ |x| x * {num} }}\nend\n',
+    'rust': 'fn {name}({arg}: &[i32]) -> i32 {{\n    {arg}.iter().map(|x| x * {num}).sum()\n}}\n',
+}
+WORDS = ('parse', 'render', 'cache', 'sort', 'merge', 'fetch', 'stream', 'batch', 'index', 'filter', 'reduce',
+         'encode', 'decode', 'retry', 'queue', 'graph', 'tree', 'hash', 'token', 'buffer')
+USERNAME_PREFIX = 'bench-user-'
+DATE_SPREAD_DAYS = 365
+
+
+class DataGenerator:
+    """
+    Writes a synthetic data set as NDJSON; bookmarks are created separately by ``create_bookmarks``.
+    """
+
+    def __init__(self, users=100, snippets=1000, ratings=10000, comments=2000, bookmarks=2000, tags=200,
+                 tags_per_snippet=3, tag_skew=1.2, duplicate_ratio=0.05, seed=0):
+        self.users = users
+        self.snippets = snippets
+        self.ratings = ratings
+        self.comments = comments
+        self.bookmarks = bookmarks
+        self.tag_names = [f'{WORDS[i % len(WORDS)]}-{i}' for i in range(tags)]
+        self.tags_per_snippet = tags_per_snippet
+        self.tag_skew = tag_skew
+        self.duplicate_ratio = duplicate_ratio
+        self.rng = np.random.default_rng(seed)
+        self.first_id = (Snippet.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        self.first_comment_id = (Comment.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        self.now = timezone.now()
+
+    def usernames(self):
+        return [f'{USERNAME_PREFIX}{n}' for n in range(self.users)]
+
+    def random_date(self):
+        return self.now - timezone.timedelta(seconds=int(self.rng.integers(0, DATE_SPREAD_DAYS * 86400)))
+
+    def snippet_tags(self):
+        # Zipf ranks, folded into the vocabulary so popular tags stay popular
+        ranks = (self.rng.zipf(self.tag_skew, self.tags_per_snippet) - 1) % len(self.tag_names)
+        return ','.join(dict.fromkeys(self.tag_names[rank] for rank in ranks))
+
+    def code(self, language_code, number):
+        words = self.rng.choice(WORDS, 2)
+        return CODE_TEMPLATES[language_code].format(name=f'{words[0]}_{number}', arg=words[1], num=number % 97)
+
+    def unique_pairs(self, count):
+        """
+        Returns up to ``count`` distinct (user index, snippet index) pairs, favouring popular snippets.
+        """
+        count = min(count, self.users * self.snippets)
+        pairs = np.empty((0, 2), dtype=np.int64)
+        while len(pairs) < count:
+            missing = (count - len(pairs)) * 2
+            users = self.rng.integers(0, self.users, missing)
+            # Half of the activity goes to a long tail of popular snippets
+            popular = (self.rng.zipf(1.3, missing) - 1) % self.snippets
+            snippets = np.where(self.rng.random(missing) < 0.5, popular, self.rng.integers(0, self.snippets, missing))
+            pairs = np.unique(np.concatenate([pairs, np.stack([users, snippets], axis=1)]), axis=0)
+        return pairs[self.rng.permutation(len(pairs))[:count]]
+
+    def records(self):
+        for name, slug, language_code in LANGUAGES:
+            yield {'type': 'language', 'name': name, 'slug': slug, 'language_code': language_code}
+        for username in self.usernames():
+            yield {'type': 'user', 'username': username, 'email': f'{username}@example.com'}
+
+        usernames = self.usernames()
+        codes = []
+        for number in range(self.snippets):
+            name, slug, language_code = LANGUAGES[int(self.rng.integers(len(LANGUAGES)))]
+            if codes and self.rng.random() < self.duplicate_ratio:
+                name, slug, language_code, code = codes[int(self.rng.integers(len(codes)))]
+                code += f'\n# copy {number}\n' if language_code in ('python', 'ruby') else f'\n// copy {number}\n'
+            else:
+                code = self.code(language_code, number)
+                codes.append((name, slug, language_code, code))
+            yield {
+                'type': 'snippet',
+                'id': self.first_id + number,
+                'title': f'{" ".join(self.rng.choice(WORDS, 3)).capitalize()} {number}',
+                'language': slug,
+                'author': usernames[int(self.rng.integers(self.users))],
+                'description': f'Shows how to **{self.rng.choice(WORDS)}** in {name}.',
+                'code': code,
+                'tags': self.snippet_tags(),
+                'pub_date': self.random_date().isoformat(),
+            }
+
+        for user, snippet in self.unique_pairs(self.ratings):
+            yield {
+                'type': 'rating',
+                'snippet': self.first_id + int(snippet),
+                'user': usernames[user],
+                'rating': 'like' if self.rng.random() < 0.8 else 'dislike',
+                'date': self.random_date().isoformat(),
+            }
+        for number in range(self.comments):
+            yield {
+                'type': 'comment',
+                'id': self.first_comment_id + number,
+                'snippet': self.first_id + int((self.rng.zipf(1.3) - 1) % self.snippets),
+                'author': usernames[int(self.rng.integers(self.users))],
+                'content': f'Nice {self.rng.choice(WORDS)} trick, thanks!',
+                'pub_date': self.random_date().isoformat(),
+            }
+
+    def write(self, stream):
+        written = 0
+        for record in self.records():
+            stream.write(json.dumps(record))
+            stream.write('\n')
+            written += 1
+        return written
+
+    def create_bookmarks(self, batch_size=5000):
+        """
+        Bulk-creates the bookmarks of the generated users. Returns how many were created.
+        """
+        user_ids = dict(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('username', 'id'))
+        usernames = self.usernames()
+        batch = []
+        created = 0
+        for user, snippet in self.unique_pairs(self.bookmarks):
+            batch.append(Bookmark(user_id=user_ids[usernames[user]], snippet_id=self.first_id + int(snippet)))
+            if len(batch) == batch_size:
+                Bookmark.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        Bookmark.objects.bulk_create(batch)
+        return created + len(batch)
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tatum24.benchmark import BenchmarkError, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Measures latency percentiles and query counts of the hot views and writes a JSON report, '
+            'optionally compared with a previous one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario.')
+        parser.add_argument('--only', nargs='+', help='Scenario names to run.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='Previous JSON report to compare p50 latencies with.')
+
+    def handle(self, *args, **options):
+        def progress(name, result):
+            latency, queries = result['latency_ms'], result['queries']
+            self.stdout.write(
+                f'{name:<28} p50 {latency["p50"]:8.1f} ms  p90 {latency["p90"]:8.1f} ms  '
+                f'p99 {latency["p99"]:8.1f} ms  queries {queries["p50"]:.0f}'
+            )
+
+        try:
+            report = run_benchmark(iterations=options['iterations'], warmup=options['warmup'], only=options['only'],
+                                   seed=options['seed'], host=options['host'], progress=progress)
+        except BenchmarkError as e:
+            raise CommandError(e)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}.'))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f'\nCompared with {options["compare"]} (p50):')
+            for name, old, new, change, old_queries, new_queries in compare_reports(baseline, report):
+                self.stdout.write(
+                    f'{name:<28} {old:8.1f} -> {new:8.1f} ms ({change:+.0%})  '
+                    f'queries {old_queries:.0f} -> {new_queries:.0f}'
+                )
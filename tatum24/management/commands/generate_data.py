@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from snippets.utils.ndjson import Importer
+from tatum24.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic data set of users, snippets, ratings, comments and bookmarks for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--snippets', type=int, default=1000)
+        parser.add_argument('--ratings', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=2000)
+        parser.add_argument('--bookmarks', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=200, help='Size of the tag vocabulary.')
+        parser.add_argument('--tags-per-snippet', type=int, default=3)
+        parser.add_argument('--tag-skew', type=float, default=1.2,
+                            help='Zipf exponent of tag popularity; higher concentrates on fewer tags.')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.05,
+                            help='Share of snippets that are near-copies of another.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=None, help='Rendering processes for the import.')
+        parser.add_argument('--output', help='Only write the NDJSON to this file instead of importing it.')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            users=options['users'], snippets=options['snippets'], ratings=options['ratings'],
+            comments=options['comments'], bookmarks=options['bookmarks'], tags=options['tags'],
+            tags_per_snippet=options['tags_per_snippet'], tag_skew=options['tag_skew'],
+            duplicate_ratio=options['duplicate_ratio'], seed=options['seed'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                written = generator.write(f)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} records to {options["output"]}.'))
+            return
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.ndjson')
+            with open(path, 'w', encoding='utf-8') as f:
+                generator.write(f)
+            importer = Importer(path, workers=options['workers'], stdout=self.stdout, stderr=self.stderr)
+            counts = importer.run(resume=False)
+            bookmarks = generator.create_bookmarks()
+            importer.finish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {counts["user"]} users, {counts["snippet"]} snippets, {counts["rating"]} ratings, '
+            f'{counts["comment"]} comments and {bookmarks} bookmarks.'
+        ))
@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database into the SQLite files standing in for the read replicas. '
+            'Run it again to catch a replica up; the time in between plays the replication lag.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', help='Only sync this replica alias; may be repeated.')
+
+    def handle(self, *args, **options):
+        aliases = options['database'] or settings.REPLICA_DATABASES
+        if not aliases:
+            raise CommandError('No replica is configured; set TATUM24_REPLICA_DB to an SQLite file.')
+        for alias in aliases:
+            if alias not in settings.REPLICA_DATABASES:
+                raise CommandError(f'"{alias}" is not a replica.')
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'"{alias}" is not an SQLite database; real replicas are fed by the database server.')
+
+        source = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+        try:
+            for alias in aliases:
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Synced replica "{alias}".'))
+        finally:
+            source.close()
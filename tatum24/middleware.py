@@ -0,0 +1,243 @@
+"""
+Per-request instrumentation: SQL statistics and a sampling profiler.
+
+QueryStatsMiddleware wraps every database call made while a request is handled and counts
+the queries, their total time and how often each query shape repeats. A shape is the SQL
+with its parameters left out and IN lists collapsed, so repeated shapes usually mean an N+1
+loop. The totals are logged on the ``tatum24.queries`` logger (as a warning above
+``QUERY_STATS_WARN_COUNT``), attached to the request as ``request.query_stats`` and, with
+``QUERY_STATS_HEADERS``, sent back in a Server-Timing header. Under ASGI the wrappers go on
+the request's sync thread, where the async ORM runs, and snippets.utils.concurrency adds
+them on the worker threads of parallel lookups through ``current_query_stats``.
+
+SamplingProfilerMiddleware records where the time of a sample of requests goes.
+
+ReplicaPinMiddleware gives each request its tatum24.routers routing state and keeps the reads
+of a client that just wrote on the primary database.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from tatum24.profiling import StackSampler, format_collapsed
+from tatum24.routers import routing
+
+logger = logging.getLogger('tatum24.queries')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r'\((?:(?:%s|\?),\s*)+(?:%s|\?)\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# QueryStats of the request being handled, for work it hands to other threads
+current_query_stats = ContextVar('current_query_stats', default=None)
+
+
+def fingerprint(sql):
+    """
+    Returns the shape of a query: literals replaced by ``?``, ``IN (%s, %s, ...)`` lists
+    collapsed and whitespace normalised.
+    """
+    sql = _LITERALS.sub('?', sql)
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?...)', sql)).strip()
+
+
+class QueryStats:
+    """
+    Query count, SQL time and repeated query shapes collected while handling one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def track(self):
+        """
+        Counts the queries of this thread's connections until the returned ExitStack is closed.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def duplicates(self, limit=5):
+        """
+        Returns the (shape, times) pairs that ran more than once, most repeated first.
+        """
+        return [(shape, times) for shape, times in self.shapes.most_common(limit) if times > 1]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'duration_ms': round(self.duration * 1000, 2),
+            'duplicates': [{'sql': shape, 'times': times} for shape, times in self.duplicates()],
+        }
+
+
+class QueryStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = QueryStats()
+        request.query_stats = stats
+        token = current_query_stats.set(stats)
+        try:
+            with stats.track():
+                response = self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        request.query_stats = stats
+        token = current_query_stats.set(stats)
+        tracking = await sync_to_async(stats.track)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(tracking.close)()
+            current_query_stats.reset(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        level = logging.WARNING if stats.count > getattr(settings, 'QUERY_STATS_WARN_COUNT', 50) else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, '%s %s: %d queries in %.1f ms', request.method, view, stats.count,
+                       stats.duration * 1000, extra={'view_name': view, 'query_stats': stats.as_dict()})
+        if getattr(settings, 'QUERY_STATS_HEADERS', False):
+            response['Server-Timing'] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+        return response
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profiles a random share of requests with tatum24.profiling.StackSampler and stores them
+    as ProfiledRequest rows, which the admin aggregates into a hot-path report.
+
+    ``PROFILER_SAMPLE_RATE`` is the share of requests sampled (0 turns profiling off) and
+    ``PROFILER_VIEW_RATES`` overrides it per URL name. Requests that are not picked only
+    pay for the settings lookup.
+
+    The sampler follows a single thread, which an async request does not stay on, so under
+    ASGI the middleware takes itself out of the chain. Profile behind a WSGI server.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed('The sampling profiler only runs under WSGI.')
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler = getattr(request, '_stack_sampler', None)
+            if sampler is not None:
+                stacks = sampler.stop()
+                duration = time.perf_counter() - request._profile_started
+        if sampler is not None:
+            self.save(request, response, stacks, duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rate = getattr(settings, 'PROFILER_VIEW_RATES', {}).get(
+            request.resolver_match.view_name, getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        )
+        if rate <= 0 or random.random() >= rate:
+            return None
+        request._stack_sampler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILER_INTERVAL', 0.005))
+        request._profile_started = time.perf_counter()
+        request._stack_sampler.start()
+        return None
+
+    def save(self, request, response, stacks, duration):
+        from tatum24.models import ProfiledRequest
+
+        ProfiledRequest.objects.create(
+            view_name=request.resolver_match.view_name,
+            path=request.path[:500],
+            method=request.method,
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            sample_count=sum(stacks.values()),
+            stacks=format_collapsed(stacks),
+        )
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins the reads of unsafe requests to the primary database, and those of safe requests
+    carrying the ``REPLICA_PIN_COOKIE``. A request that wrote sets the cookie for
+    ``REPLICA_PIN_SECONDS``, the replication lag it covers, so the client sees its own
+    rating or comment on the page it is redirected to.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with routing(self.pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        with routing(self.pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(response, state)
+
+    def pinned(self, request):
+        if request.method not in SAFE_METHODS:
+            return True
+        try:
+            return float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def pin(self, response, state):
+        if state.wrote:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
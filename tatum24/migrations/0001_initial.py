@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfiledRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(db_index=True, max_length=200)),
+                ('path', models.CharField(max_length=500)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('duration_ms', models.FloatField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('stacks', models.TextField(help_text='One "frame;frame;frame count" line per distinct stack')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -1 +1,27 @@
-from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+from tatum24.profiling import parse_collapsed
+
+
+class ProfiledRequest(models.Model):
+    """
+    A request sampled by SamplingProfilerMiddleware, with its stacks in collapsed format.
+    """
+    view_name = models.CharField(max_length=200, db_index=True)
+    path = models.CharField(max_length=500)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    stacks = models.TextField(help_text='One "frame;frame;frame count" line per distinct stack')
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.method} {self.view_name} ({self.duration_ms:.0f} ms)'
+
+    def get_stacks(self):
+        return parse_collapsed(self.stacks)
@@ -0,0 +1,87 @@
+"""
+Sampling profiler for individual requests.
+
+While a sampled request runs, a background thread reads the request thread's current stack
+every ``PROFILER_INTERVAL`` seconds via ``sys._current_frames()``. Identical stacks are
+counted, so the result is in the "collapsed stack" format that flamegraph.pl and speedscope
+read: ``root;caller;callee <samples>``. The request itself is never traced, so its own
+overhead is only the sampling thread waking up.
+"""
+import sys
+import threading
+from collections import Counter
+
+# Frames from these modules only add noise on top of every stack
+_SKIPPED_MODULES = ('threading', 'tatum24.profiling')
+
+
+def frame_label(frame):
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}:{frame.f_code.co_name}'
+
+
+def collapse(frame):
+    """
+    Returns the stack ending at ``frame`` as ``outermost;...;innermost`` labels.
+    """
+    labels = []
+    while frame is not None:
+        if frame.f_globals.get('__name__') not in _SKIPPED_MODULES:
+            labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of ``thread_id`` until stopped; the counts end up in ``stacks``.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+def format_collapsed(stacks):
+    """
+    Returns a Counter of stacks as collapsed-stack text, one ``stack count`` per line.
+    """
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def parse_collapsed(text):
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+def hot_paths(stacks, limit=20):
+    """
+    Returns the ``limit`` hottest stacks and the functions with the most samples on top of
+    the stack (self time), as lists of (label, samples, share).
+    """
+    total = sum(stacks.values()) or 1
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rpartition(';')[2]] += count
+    return (
+        [(stack, count, count / total) for stack, count in stacks.most_common(limit)],
+        [(leaf, count, count / total) for leaf, count in leaves.most_common(limit)],
+    )
@@ -0,0 +1,78 @@
+"""
+Primary/replica database routing with read-your-writes stickiness.
+
+PrimaryReplicaRouter sends writes to ``default`` and reads to a random database of
+``REPLICA_DATABASES``. Replicas lag behind the primary, so reads stay on the primary when:
+
+- the request is pinned: its method is not safe, or the client carries the pin cookie that
+  ReplicaPinMiddleware sets for ``REPLICA_PIN_SECONDS`` after a request that wrote;
+- the primary connection is inside a transaction, whose reads must see its own writes
+  (this also covers select_for_update() and test cases);
+- the object was loaded from the primary, e.g. a related lookup on a freshly saved instance.
+
+Outside a request (management commands) reads go to the replicas unless a transaction is open.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """
+    Routing state of one request: whether its reads are pinned to the primary, and whether
+    it has written.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Routing state of the request being handled; copied into the threads it hands work to
+current_routing = ContextVar('current_routing', default=None)
+
+
+@contextmanager
+def routing(pinned=False):
+    """
+    Routes the queries run inside the block as one request, returning its RoutingState.
+    """
+    state = RoutingState(pinned)
+    token = current_routing.set(state)
+    try:
+        yield state
+    finally:
+        current_routing.reset(token)
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == DEFAULT_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+        state = current_routing.get()
+        if not replicas() or (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tatum24.middleware.SamplingProfilerMiddleware',
+    'tatum24.middleware.QueryStatsMiddleware',
+    'tatum24.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +88,110 @@ DATABASES = {
     }
 }
 
+# Read replicas, see tatum24.routers. TATUM24_REPLICA_DB names an SQLite file standing in for
+# one locally; ``manage.py sync_replica`` copies the primary into it.
+if os.environ.get('TATUM24_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['TATUM24_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['tatum24.routers.PrimaryReplicaRouter']
+
+# Cookie keeping a client's reads on the primary, and for how many seconds after it wrote
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 10
+
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-user recommendation ids, see snippets.utils.recommendation_cache. Entries are
+    # invalidated by the process that saw the change, so use a shared backend (Redis,
+    # Memcached) for this and 'recommendation_state' when running several processes.
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Generations and hit/miss counters of the recommendation cache: a handful of keys that
+    # must not be culled along with the entries
+    'recommendation_state': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendation_state',
+        'TIMEOUT': None,
+    },
+    # Rendered code and Markdown HTML keyed by content hash, see snippets.utils.rendering
+    'rendering': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rendering',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # Snippet detail fragments and their version stamps, see snippets.utils.fragments. Stamps
+    # are bumped by the process that saw the change, so use a shared backend (Redis,
+    # Memcached) when running several processes.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Trending rankings, see snippets.utils.trending
+    'trending': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trending',
+    },
+}
+
+# Seconds the recommendation sidebar of a snippet page is cached. Its ranking uses the other
+# snippets' ratings, which do not bump its stamps.
+SIDEBAR_CACHE_TTL = 60 * 10
+
+# Seconds before a user's cached recommendations are recomputed
+RECOMMENDATION_CACHE_TTL = 60 * 10
+
+# Seconds a trending ranking is served before it is recomputed from the rating buckets
+TRENDING_CACHE_TTL = 60
+
+# Generated snippet PDFs, see snippets.utils.pdf_cache
+PDF_CACHE_DIR = BASE_DIR / 'cache' / 'pdf'
+PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Per-request SQL stats, see tatum24.middleware.QueryStatsMiddleware
+QUERY_STATS_WARN_COUNT = 50
+QUERY_STATS_HEADERS = DEBUG
+
+# Sampling profiler, see tatum24.middleware.SamplingProfilerMiddleware. The share of
+# requests profiled (0 is off), per-URL-name overrides and the seconds between samples.
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_VIEW_RATES = {}
+PROFILER_INTERVAL = 0.005
+
+# Whether async views run their independent lookups on worker threads, each with its own
+# database connection, see snippets.utils.concurrency
+PARALLEL_VIEW_QUERIES = True
+
+# PDF rendering pool, see snippets.utils.pdf_render. The worker and queue limits are shared by
+# all web processes on the host through lock files in PDF_RENDER_LOCK_DIR (per process on
+# Windows); each host of a multi-host deployment has its own.
+PDF_RENDER_WORKERS = 2
+PDF_RENDER_QUEUE_SIZE = 8
+PDF_RENDER_LOCK_DIR = BASE_DIR / 'cache' / 'pdf-render'
+PDF_RENDER_TIMEOUT = 30
+PDF_RENDER_RETRY_AFTER = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
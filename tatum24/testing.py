@@ -0,0 +1,142 @@
+"""
+Test helpers for keeping the number and the cost of SQL queries per view in check.
+
+QUERY_BUDGETS caps the queries each URL name may run. QueryBudgetMixin.assertQueryBudget
+requests a URL and fails with the repeated query shapes when it goes over. Run it against
+a data set large enough that an N+1 loop shows up as many queries, not just one.
+
+QueryPlanMixin.assertIndexedPlans runs SQLite's EXPLAIN QUERY PLAN on every SELECT of a
+block and fails on a full table scan, an index walk not stopped by the outer statement's
+LIMIT or a sort in a temporary B-tree, i.e. on a hot query that lost its index.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tatum24.middleware import QueryStats, fingerprint
+
+# Maximum queries per request, by URL name and whether the user is logged in
+QUERY_BUDGETS = {
+    ('snippet_list', False): 3,
+    ('snippet_list', True): 8,
+    ('snippet_detail', False): 6,
+    ('snippet_detail', True): 13,
+    ('language_detail', False): 2,
+    ('top_rated_snippets', False): 2,
+    ('most_bookmarked', False): 2,
+    ('tatum24_top_authors', False): 3,
+    ('tatum24_top_languages', False): 3,
+    ('trending_snippets', False): 2,
+    ('user_bookmarks', True): 4,
+    ('download_pdf', True): 3,
+}
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin checking views against QUERY_BUDGETS.
+    """
+
+    def assertQueryBudget(self, url_name, args=None, params=None, client=None, budget=None):
+        client = client or self.client
+        # Client.session would create (and then load) a session for an anonymous client
+        logged_in = settings.SESSION_COOKIE_NAME in client.cookies and '_auth_user_id' in client.session
+        if budget is None:
+            budget = QUERY_BUDGETS[url_name, logged_in]
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(reverse(url_name, args=args), params or {})
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f'{url_name} answered {response.status_code}')
+
+        count = len(captured.captured_queries)
+        if count > budget:
+            stats = QueryStats()
+            for query in captured.captured_queries:
+                stats.shapes[fingerprint(query['sql'])] += 1
+            repeated = '\n'.join(f'  {times}x {shape}' for shape, times in stats.duplicates())
+            self.fail(f'{url_name} ran {count} queries, over its budget of {budget}.\n'
+                      f'Repeated queries:\n{repeated or "  none"}')
+        return response
+
+
+# Plan steps that start a nested statement; the steps below them are not the outer query's
+NESTED_PLAN_STEPS = ('CORRELATED ', 'SCALAR SUBQUERY', 'LIST SUBQUERY', 'CO-ROUTINE', 'MATERIALIZE', 'COMPOUND ',
+                     'MULTI-INDEX OR')
+
+
+def outer_sql(sql):
+    """
+    Returns ``sql`` without its parenthesised parts and string literals, i.e. the clauses of
+    the outermost statement.
+    """
+    outer = []
+    depth = 0
+    for token in re.findall(r"'(?:[^']|'')*'|\(|\)|[^'()]+", sql):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and not token.startswith("'"):
+            outer.append(token)
+    return ' '.join(outer)
+
+
+def plan_regressions(plan, sql=''):
+    """
+    Returns the steps of an EXPLAIN QUERY PLAN, given as (id, parent, detail) rows, that read
+    a whole table or index, or sort in a temporary B-tree. Walking an index in order
+    (``SCAN ... USING INDEX``) is only fine in the outermost statement, when ``sql`` has a
+    LIMIT of its own to stop it; looking rows up in an index (``SEARCH``) always is.
+    """
+    limited = re.search(r'\bLIMIT\b', outer_sql(sql)) is not None
+    details = {step_id: detail for step_id, parent, detail in plan}
+    parents = {step_id: parent for step_id, parent, detail in plan}
+
+    def nested(step_id):
+        parent = parents.get(step_id, 0)
+        while parent:
+            if details.get(parent, '').startswith(NESTED_PLAN_STEPS):
+                return True
+            parent = parents.get(parent, 0)
+        return False
+
+    return [
+        detail for step_id, parent, detail in plan
+        if detail.startswith(('USE TEMP B-TREE FOR ORDER BY', 'USE TEMP B-TREE FOR GROUP BY'))
+        or (detail.startswith('SCAN ') and not detail.startswith(('SCAN CONSTANT ROW', 'SCAN (')) and not (
+            limited and ' INDEX ' in detail and not nested(step_id)
+        ))
+    ]
+
+
+class QueryPlanMixin:
+    """
+    TestCase mixin checking the query plans of the SELECTs a block runs; SQLite only.
+    """
+
+    def assertIndexedPlans(self, run, allow_sorts=()):
+        """
+        Calls ``run`` and fails if a plan of its SELECTs regresses. Sorts are accepted for
+        queries containing one of ``allow_sorts``, e.g. an ORDER BY on a computed score.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            run()
+        failures = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [(row[0], row[1], row[3]) for row in cursor.fetchall()]
+            steps = plan_regressions(plan, sql)
+            if any(allowed in sql for allowed in allow_sorts):
+                steps = [step for step in steps if not step.startswith('USE TEMP B-TREE')]
+            if steps:
+                failures.append(f'  {sql}\n    ' + '\n    '.join(detail for _, _, detail in plan))
+        if failures:
+            self.fail('Queries without a usable index:\n' + '\n'.join(failures))
@@ -19,10 +19,10 @@ def profile_view(request):
     if user.groups.filter(name='Moderator').exists():
         template_name = 'users/templates/profile/moderator_profile.html'
         # Optimize query for moderators
-        snippets = Snippet.objects.select_related('author').order_by('author__username')
+        snippets = Snippet.objects.for_list().order_by('author__username')
     else:
         template_name = 'users/templates/profile/normal_profile.html'
-        snippets = Snippet.objects.filter(author=user)
+        snippets = Snippet.objects.filter(author=user).for_list()
 
     context = {
         'user': user,